@@ -1,26 +1,49 @@
+import re
+
 from django.contrib.auth import get_user_model
 from django.contrib.auth.backends import ModelBackend
-from django.db.models import Q
 from rest_framework.exceptions import AuthenticationFailed
 
+# Digits with an optional leading '+' and the usual separators
+PHONE_PATTERN = re.compile(r'^\+?[\d\s().-]+$')
+
+
+def lookup_order(identifier):
+    """
+    Fields to try for a login identifier, most likely first.
+
+    Each field is indexed, so a login normally costs one query; the other
+    fields are only tried if the likely one misses (a username made of
+    digits, say).
+    """
+    if '@' in identifier:
+        return ('email', 'username', 'primary_phone')
+    if PHONE_PATTERN.match(identifier):
+        return ('primary_phone', 'username', 'email')
+    return ('username', 'email', 'primary_phone')
+
 
 class EmailorPhoneModelBackend(ModelBackend):
     """ Custom authentication backend to allow login using usernamem, email or phone number.
     """
     def authenticate(self, request, username=None, password=None, **kwargs):
         UserModel = get_user_model()
-        try:
-            # Find user by username, phone, or email
-            user = UserModel.objects.get(
-                Q(username__exact=username) |
-                Q(primary_phone__exact=username) |
-                Q(email__exact=username)
-            )
-        except UserModel.DoesNotExist:
+        if not username:
+            raise AuthenticationFailed("Incorrect phone number or email.")
+
+        # Find user by username, phone, or email
+        user = None
+        for field in lookup_order(username):
+            try:
+                user = UserModel.objects.get(**{f'{field}__exact': username})
+                break
+            except UserModel.DoesNotExist:
+                continue
+        if user is None:
             raise AuthenticationFailed("Incorrect phone number or email.")
 
         # Check password
         if not user.check_password(password):
             raise AuthenticationFailed("Incorrect password. Please try again.")
 
-        return user
\ No newline at end of file
+        return user
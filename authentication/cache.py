@@ -0,0 +1,75 @@
+"""
+Short-lived cache of ``User`` rows for ``CachedJWTAuthentication``.
+
+Entries are dropped once the transaction that changed the user commits:
+on ``User.save()`` and on the counter updates that bypass it.
+
+A miss reads the row from the database and then caches it, and an
+invalidation can commit in between: the row read is then already stale.
+So every invalidation also stores a new random token for the user, and an
+entry is written with the token read before the database was. An entry
+whose token is no longer the current one counts as a miss, so a stale row
+written late is never served.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from utils.instrumentation import record_cache
+
+# Bumped whenever the shape of an entry changes (v2: (token, user) pairs)
+KEY_VERSION = 2
+
+
+def user_cache_key(user_id):
+    return f'authentication:v{KEY_VERSION}:user:{user_id}'
+
+
+def user_token_key(user_id):
+    return f'{user_cache_key(user_id)}:token'
+
+
+def _cached(values, user_id):
+    entry = values.get(user_cache_key(user_id))
+    token = values.get(user_token_key(user_id))
+    user = entry[1] if entry is not None and entry[0] == token else None
+    record_cache(user is not None)
+    return user, token
+
+
+def get_cached_user(user_id):
+    """
+    Return ``(user, token)``: the cached user, or None on a miss, and the
+    token to cache the user read from the database with.
+    """
+    return _cached(cache.get_many([user_cache_key(user_id), user_token_key(user_id)]), user_id)
+
+
+def cache_user(user, token):
+    cache.set(user_cache_key(user.pk), (token, user), settings.JWT_USER_CACHE_TIMEOUT)
+
+
+async def aget_cached_user(user_id):
+    return _cached(await cache.aget_many([user_cache_key(user_id), user_token_key(user_id)]), user_id)
+
+
+async def acache_user(user, token):
+    await cache.aset(user_cache_key(user.pk), (token, user), settings.JWT_USER_CACHE_TIMEOUT)
+
+
+def invalidate_user(*user_ids):
+    """Drop the cached users once the current transaction commits."""
+    if not user_ids:
+        return
+
+    def invalidate():
+        cache.delete_many([user_cache_key(user_id) for user_id in user_ids])
+        # Outlives any entry written with the previous token
+        cache.set_many(
+            {user_token_key(user_id): uuid.uuid4().hex for user_id in user_ids},
+            2 * settings.JWT_USER_CACHE_TIMEOUT,
+        )
+
+    transaction.on_commit(invalidate)
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.1 on 2026-10-18 05:53
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_active_borrow_count(apps, schema_editor):
+    User = apps.get_model('authentication', 'User')
+    Borrow = apps.get_model('library', 'Borrow')
+    active = (
+        Borrow.objects.filter(user=OuterRef('pk'), returned=False)
+        .order_by()
+        .values('user')
+        .annotate(count=Count('pk'))
+        .values('count')
+    )
+    User.objects.update(active_borrow_count=Coalesce(Subquery(active), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0002_alter_role_created_at_alter_role_created_by_and_more'),
+        ('library', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='active_borrow_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_active_borrow_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0003_user_active_borrow_count'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='email',
+            field=models.EmailField(blank=True, db_index=True, max_length=255, null=True, verbose_name='email address'),
+        ),
+    ]
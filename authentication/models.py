@@ -1,9 +1,11 @@
 from django.db import models
+from django.db.models import F
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager
 from django.conf import settings
 from rest_framework_simplejwt.tokens import RefreshToken
 from phonenumber_field.modelfields import PhoneNumberField
+from authentication.cache import invalidate_user
 from utils.mixins import BaseModel
 
 
@@ -64,7 +66,7 @@ class User(AbstractBaseUser):
     first_name = models.CharField(max_length=100)
     last_name = models.CharField(max_length=100, blank=True)
     username = models.CharField(max_length=100, unique=True, null=True, blank=True)
-    email = models.EmailField(verbose_name='email address', max_length=255, null=True, blank=True)
+    email = models.EmailField(verbose_name='email address', max_length=255, null=True, blank=True, db_index=True)
     gender = models.CharField(max_length=6, choices=Gender.choices, default=Gender.MALE)
 
     country_code = models.CharField(max_length=20, null=True, blank=True)
@@ -81,6 +83,9 @@ class User(AbstractBaseUser):
     role = models.ForeignKey(Role, on_delete=models.SET_NULL, null=True, blank=True)
     
     penalty_points = models.IntegerField(default=0)
+    # Denormalized number of unreturned borrows, maintained by the borrow and
+    # return paths; `manage.py reconcile_borrow_counts` recomputes it.
+    active_borrow_count = models.PositiveIntegerField(default=0)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -102,6 +107,7 @@ class User(AbstractBaseUser):
     def save(self, *args, **kwargs):
         self.username = self.username.replace(' ', '_').lower() if self.username else ''
         super().save(*args, **kwargs)
+        invalidate_user(self.pk)
 
     def tokens(self):
         refresh = RefreshToken.for_user(self)
@@ -120,6 +126,30 @@ class User(AbstractBaseUser):
         # Simplest possible answer: Yes, always
         return True
 
+    @classmethod
+    def claim_borrow_slot(cls, user_id, limit, count=1):
+        """
+        Count ``count`` more active borrows for a user, unless that would
+        take them over ``limit``.
+
+        The check and the increment are a single conditional UPDATE, so two
+        concurrent borrows cannot both take the last slot.
+        """
+        claimed = cls.objects.filter(pk=user_id, active_borrow_count__lte=limit - count).update(
+            active_borrow_count=F('active_borrow_count') + count
+        ) == 1
+        if claimed:
+            invalidate_user(user_id)
+        return claimed
+
+    @classmethod
+    def release_borrow_slot(cls, user_id):
+        """Count one less active borrow for a user."""
+        cls.objects.filter(pk=user_id, active_borrow_count__gt=0).update(
+            active_borrow_count=F('active_borrow_count') - 1
+        )
+        invalidate_user(user_id)
+
     @property
     def is_staff(self):
         """Is the user a member of staff?"""
@@ -1,3 +1,98 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken
 
-# Create your tests here.
+from authentication.auth_backend import EmailorPhoneModelBackend, lookup_order
+from authentication.cache import cache_user, get_cached_user
+from authentication.jwt_auth import CachedJWTAuthentication
+from authentication.models import User
+
+
+class LookupOrderTests(TestCase):
+    """Logins must try the field the identifier most likely is first."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='reader@example.com', username='reader', password='secret', primary_phone='+15550100',
+        )
+        # A username that looks like a phone number
+        cls.digits = User.objects.create_user(email='digits@example.com', username='5550199', password='secret')
+
+    def test_lookup_order(self):
+        self.assertEqual(lookup_order('reader@example.com'), ('email', 'username', 'primary_phone'))
+        self.assertEqual(lookup_order('+1 (555) 010-0'), ('primary_phone', 'username', 'email'))
+        self.assertEqual(lookup_order('reader'), ('username', 'email', 'primary_phone'))
+
+    def test_likely_field_costs_one_query(self):
+        backend = EmailorPhoneModelBackend()
+        for identifier in ('reader@example.com', '+15550100', 'reader'):
+            with self.subTest(identifier=identifier):
+                with self.assertNumQueries(1):
+                    self.assertEqual(backend.authenticate(None, identifier, 'secret'), self.user)
+
+    def test_falls_back_to_other_fields(self):
+        backend = EmailorPhoneModelBackend()
+        with self.assertNumQueries(2):
+            self.assertEqual(backend.authenticate(None, '5550199', 'secret'), self.digits)
+        with self.assertRaisesMessage(AuthenticationFailed, 'Incorrect phone number or email.'):
+            backend.authenticate(None, 'nobody', 'secret')
+        with self.assertRaisesMessage(AuthenticationFailed, 'Incorrect password. Please try again.'):
+            backend.authenticate(None, 'reader', 'wrong')
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    """Cached users must be dropped by every change, and never served stale."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='reader@example.com', username='reader', password='secret')
+
+    def setUp(self):
+        cache.clear()
+        self.request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def authenticate(self):
+        user, _ = CachedJWTAuthentication().authenticate(self.request)
+        return user
+
+    def test_hit_skips_the_query(self):
+        with self.assertNumQueries(1):
+            self.authenticate()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.authenticate(), self.user)
+
+    def test_claim_and_release_invalidate(self):
+        self.authenticate()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(User.claim_borrow_slot(self.user.pk, limit=3))
+        with self.assertNumQueries(1):
+            self.assertEqual(self.authenticate().active_borrow_count, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            User.release_borrow_slot(self.user.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.authenticate().active_borrow_count, 0)
+
+        # A refused claim changes nothing and keeps the entry
+        User.objects.filter(pk=self.user.pk).update(active_borrow_count=3)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertFalse(User.claim_borrow_slot(self.user.pk, limit=3))
+        with self.assertNumQueries(0):
+            self.authenticate()
+
+    def test_row_read_before_an_invalidation_is_not_served(self):
+        # A miss reads the row, then the change commits before it is cached
+        user, token = get_cached_user(self.user.pk)
+        self.assertIsNone(user)
+        stale = User.objects.get(pk=self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(User.claim_borrow_slot(self.user.pk, limit=3))
+        cache_user(stale, token)
+
+        self.assertIsNone(get_cached_user(self.user.pk)[0])
+        with self.assertNumQueries(1):
+            self.assertEqual(self.authenticate().active_borrow_count, 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.authenticate().active_borrow_count, 1)
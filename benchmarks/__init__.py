@@ -0,0 +1,26 @@
+"""
+Benchmarks for the library API.
+
+Every script builds its own throwaway database through Django's test
+database machinery, so ``db.sqlite3`` is never touched. Run them from the
+repository root, e.g. ``python -m benchmarks.bench_indexes --help``.
+
+``seed.py`` generates the data (optionally with Zipf-skewed popularity),
+``bench_serializers.py`` holds the pytest-benchmark microbenchmarks and
+``bench_load.py`` the mixed HTTP workload; both compare against the
+results stored in ``baselines/``. The extra packages they need are in
+``requirements.txt``.
+
+Timings only compare on the machine that recorded them, so ``baselines/``
+is not versioned. Record it from a clean checkout of the commit to compare
+against (pytest-benchmark notes a dirty tree in the saved run), on the
+machine that will run the comparison:
+
+    git worktree add ../library-base <commit> && cd ../library-base
+    pytest benchmarks/bench_serializers.py --benchmark-autosave \\
+        --benchmark-storage=$OLDPWD/benchmarks/baselines
+    python -m benchmarks.bench_load --duration 30 --save-baseline $OLDPWD/benchmarks/baselines/load.json
+
+Then measure the change with ``--benchmark-compare`` and ``--baseline``
+as shown in ``bench_serializers.py`` and ``bench_load.py``.
+"""
@@ -0,0 +1,137 @@
+"""
+Requests per second and latency of the catalog read endpoints served by
+WSGI (gunicorn, sync views), by ASGI with the native async views (uvicorn),
+and by ASGI with the sync views (``asgi-sync``).
+
+    pip install gunicorn uvicorn
+    python -m benchmarks.bench_asgi --workers 2 --concurrency 32 --duration 15
+
+Both servers run the same number of worker processes against the same
+seeded SQLite file, one after the other, and are driven by the same mix of
+GET requests (book list and detail, author and category lists, penalties)
+from ``--clients`` client processes with ``--concurrency`` connections in
+total.
+"""
+import argparse
+import http.client
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.harness import benchmark_database, setup_django
+from benchmarks.load import SERVERS, latency_stats, running_server, save_results
+
+def request_mix(book_ids, user_id, token):
+    """(paths, headers) of each endpoint; clients pick an endpoint, then one of its paths."""
+    auth = {'Authorization': f'Bearer {token}'}
+    return [
+        (['/api/book/?page_size=20'], {}),
+        ([f'/api/book/{book_id}/' for book_id in book_ids], {}),
+        (['/api/authors/'], {}),
+        (['/api/category/'], {}),
+        ([f'/api/users/{user_id}/penalties/'], auth),
+    ]
+
+
+def client(port, mix, connections, duration, seed):
+    """Send requests over ``connections`` keep-alive connections for ``duration`` seconds."""
+    deadline = time.monotonic() + duration
+    results = []
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        latencies, errors = [], 0
+        while time.monotonic() < deadline:
+            paths, headers = rng.choice(mix)
+            path = rng.choice(paths)
+            start = time.perf_counter()
+            try:
+                conn.request('GET', path, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                if response.status != 200:
+                    errors += 1
+                if response.getheader('Connection', '').lower() == 'close':
+                    conn.close()
+            except (OSError, http.client.HTTPException):
+                errors += 1
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                continue
+            latencies.append((time.perf_counter() - start) * 1000)
+        results.append((latencies, errors))
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(connections)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return [latency for latencies, _ in results for latency in latencies], sum(errors for _, errors in results)
+
+
+def run(name, args, mix, db_path):
+    with running_server(name, db_path, args.port, args.workers, args.wsgi_threads):
+        # Warm the caches and connections before measuring
+        client(args.port, mix, args.concurrency, 2, seed=0)
+
+        per_client = max(1, args.concurrency // args.clients)
+        with ProcessPoolExecutor(args.clients) as pool:
+            futures = [
+                pool.submit(client, args.port, mix, per_client, args.duration, seed)
+                for seed in range(1, args.clients + 1)
+            ]
+            latencies, errors = [], 0
+            for future in futures:
+                client_latencies, client_errors = future.result()
+                latencies.extend(client_latencies)
+                errors += client_errors
+
+    return {'errors': errors, **latency_stats(latencies, args.duration)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=2, help='Server worker processes')
+    parser.add_argument('--wsgi-threads', type=int, default=1, help='Threads per gunicorn worker')
+    parser.add_argument('--clients', type=int, default=4, help='Client processes')
+    parser.add_argument('--concurrency', type=int, default=32, help='Connections across all clients')
+    parser.add_argument('--duration', type=float, default=15, help='Seconds per server')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--books', type=int, default=10000)
+    parser.add_argument('--borrows', type=int, default=50000)
+    parser.add_argument('--servers', nargs='+', choices=SERVERS, default=list(SERVERS))
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    args = parser.parse_args()
+
+    setup_django()
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    from authentication.models import User
+    from benchmarks.seed import seed
+    from library.models import Book
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench_asgi.sqlite3')
+    with benchmark_database(db_path):
+        seed(books=args.books, borrows=args.borrows, log=lambda message: None)
+        user = User.objects.order_by('pk').first()
+        book_ids = list(Book.objects.order_by('?').values_list('pk', flat=True)[:200])
+        mix = request_mix(book_ids, user.pk, AccessToken.for_user(user))
+
+        results = {name: run(name, args, mix, db_path) for name in args.servers}
+
+    for name, result in results.items():
+        print(
+            f"{name}: {result['rps']:>8.1f} req/s  median {result['median_ms']:.2f} ms  "
+            f"p99 {result['p99_ms']:.2f} ms  ({result['requests']} requests, {result['errors']} errors)"
+        )
+
+    if args.output:
+        save_results(args.output, results, vars(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Per-row cost of writing audited ``BaseModel`` rows: ``save()`` without the
+audit lookup, ``save()`` inside ``audit_as`` and a stamped ``bulk_create``.
+
+    python -m benchmarks.bench_audit --rows 5000
+"""
+import argparse
+import json
+import time
+
+from benchmarks.harness import benchmark_database, setup_django
+
+
+def timed(func, rows):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    return {'seconds': round(elapsed, 3), 'us_per_row': round(elapsed / rows * 1e6, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import transaction
+
+    from authentication.models import User
+    from library.models import Author
+    from utils.audit import audit_as
+
+    def save_rows(**kwargs):
+        with transaction.atomic():
+            for i in range(args.rows):
+                Author(name=f'Author {i}').save(**kwargs)
+
+    def bulk_rows():
+        Author.objects.bulk_create(
+            (Author(name=f'Author {i}') for i in range(args.rows)), batch_size=args.batch_size,
+        )
+
+    with benchmark_database():
+        user = User.objects.create_user(email='bench@example.com', username='bench', password='bench')
+        results = {}
+        results['save, no audit'] = timed(lambda: save_rows(disable_auto_set_user=True), args.rows)
+        with audit_as(user):
+            results['save, audit_as'] = timed(save_rows, args.rows)
+            results['bulk_create, audit_as'] = timed(bulk_rows, args.rows)
+        stamped = Author.objects.filter(created_by=user).count()
+
+    for name, result in results.items():
+        print(f"{name:24} {result['seconds']:>8.3f} s  {result['us_per_row']:>8.1f} us/row")
+    print(f'rows attributed to the audit user: {stamped} of {args.rows * 2}')
+
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump({'results': results, 'args': vars(args)}, fh, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+EXPLAIN plans and timings of the Borrow/Book access patterns, with and
+without the composite and partial indexes from library 0003.
+
+    python -m benchmarks.bench_indexes --borrows 10000000 --database /tmp/bench.sqlite3
+
+Large datasets should use an on-disk ``--database`` together with
+``--keep`` so the seed step only runs once.
+"""
+import argparse
+import json
+from datetime import timedelta
+
+from benchmarks.harness import benchmark_database, measure, setup_django, summarize
+
+
+def access_patterns():
+    """The queries the API and the background tasks run against Borrow/Book."""
+    from django.utils import timezone
+
+    from authentication.models import User
+    from library.models import Book, Borrow
+
+    user = User.objects.order_by('pk').first()
+    book = Book.objects.order_by('pk').first()
+    now = timezone.now()
+    newest = ('-borrow_date', '-id')
+    return {
+        'user borrows page': lambda: Borrow.objects.filter(user=user).order_by(*newest)[:20],
+        'user open borrows page': lambda: Borrow.objects.filter(user=user, returned=False).order_by(*newest)[:20],
+        'book borrows page': lambda: Borrow.objects.filter(book=book).order_by(*newest)[:20],
+        'all borrows page': lambda: Borrow.objects.order_by(*newest)[:20],
+        'due in next day': lambda: Borrow.objects.filter(
+            returned=False, due_date__gte=now, due_date__lt=now + timedelta(days=1),
+        ),
+        'overdue': lambda: Borrow.objects.filter(returned=False, due_date__lt=now).order_by('due_date')[:1000],
+        'catalog page': lambda: Book.objects.order_by('title', 'id')[:20],
+    }
+
+
+def run_patterns(repeat):
+    results = {}
+    for name, build in access_patterns().items():
+        queryset = build()
+        results[name] = {
+            'plan': queryset.explain(),
+            **summarize(measure(lambda: list(build()), repeat=repeat)),
+        }
+    return results
+
+
+def set_indexes(enabled):
+    from django.db import connection
+
+    from library.models import Book, Borrow
+
+    with connection.schema_editor() as schema_editor:
+        for model in (Book, Borrow):
+            for index in model._meta.indexes:
+                if enabled:
+                    schema_editor.add_index(model, index)
+                else:
+                    schema_editor.remove_index(model, index)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--books', type=int, default=50000)
+    parser.add_argument('--borrows', type=int, default=500000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--database', help='SQLite file for the dataset (default: in memory)')
+    parser.add_argument('--keep', action='store_true', help='Reuse/keep the seeded database')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    args = parser.parse_args()
+
+    setup_django()
+    from library.models import Borrow
+    from benchmarks.seed import seed
+
+    with benchmark_database(args.database, keep=args.keep):
+        if not Borrow.objects.exists():
+            seed(users=args.users, books=args.books, borrows=args.borrows)
+
+        set_indexes(False)
+        before = run_patterns(args.repeat)
+        set_indexes(True)
+        after = run_patterns(args.repeat)
+
+    for name in before:
+        print(f'\n== {name}')
+        for label, result in (('before', before[name]), ('after', after[name])):
+            print(f"  {label:6} median {result['median_ms']:>10.3f} ms  p95 {result['p95_ms']:>10.3f} ms")
+            for line in result['plan'].splitlines():
+                print(f'           {line}')
+
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump({'before': before, 'after': after, 'args': vars(args)}, fh, indent=2)
+
+
+if __name__ == '__main__':
+    main()
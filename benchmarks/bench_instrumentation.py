@@ -0,0 +1,52 @@
+"""
+Overhead of ``utils.instrumentation`` on a full request through the Django
+handler, without the middleware and at several sample rates.
+
+    python -m benchmarks.bench_instrumentation --requests 2000 --rates 0 0.01 1
+"""
+import argparse
+import json
+
+from benchmarks.harness import benchmark_database, measure, setup_django, summarize
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--rates', type=float, nargs='+', default=[0, 0.01, 1])
+    parser.add_argument('--path', default='/api/book/?page_size=20')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.test import Client, override_settings
+
+    from benchmarks.seed import seed
+    from utils.throttling import SustainedRateThrottle
+
+    SustainedRateThrottle.rate = '100000000/hour'
+    middleware = [name for name in settings.MIDDLEWARE if name != 'utils.instrumentation.InstrumentationMiddleware']
+    configurations = [('no middleware', {'MIDDLEWARE': middleware})]
+    configurations += [(f'sample rate {rate:g}', {'INSTRUMENTATION_SAMPLE_RATE': rate}) for rate in args.rates]
+
+    results = {}
+    with benchmark_database():
+        seed(books=2000, borrows=2000, log=lambda message: None)
+        for name, overrides in configurations:
+            with override_settings(ALLOWED_HOSTS=['*'], **overrides):
+                client = Client()
+                results[name] = summarize(measure(lambda: client.get(args.path), repeat=args.requests, warmup=50))
+
+    baseline = results['no middleware']['median_ms']
+    for name, result in results.items():
+        overhead = (result['median_ms'] - baseline) / baseline * 100
+        print(f"{name:16} median {result['median_ms']:.3f} ms  p95 {result['p95_ms']:.3f} ms  ({overhead:+.2f}%)")
+
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump({'results': results, 'args': vars(args)}, fh, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+"""
+Mixed borrow/return/browse load test of the HTTP API, compared with a
+stored baseline.
+
+    pip install -r benchmarks/requirements.txt
+    python -m benchmarks.bench_load --duration 30 --save-baseline benchmarks/baselines/load.json
+    python -m benchmarks.bench_load --duration 30 --baseline benchmarks/baselines/load.json
+
+The catalog and history are seeded with Zipf-skewed popularity, and each
+virtual reader does the same: it browses (book list, search, book detail,
+its own borrows), borrows a book drawn by popularity while it holds fewer
+than the API's limit of three books, and returns one of its books. Every
+reader keeps one connection open. Throughput and latency percentiles are
+reported per operation and overall. With ``--baseline`` each figure is
+compared with the stored one and the run fails if any is more than
+``--tolerance`` worse.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlencode
+
+from benchmarks.harness import benchmark_database, setup_django
+from benchmarks.load import SERVERS, compare, latency_stats, running_server, save_results
+
+# Relative weight of each operation; a reader with no books cannot return
+# and one at the borrow limit cannot borrow, so it browses instead
+OPERATIONS = {
+    'browse list': 30,
+    'browse search': 10,
+    'browse detail': 30,
+    'my borrows': 10,
+    'borrow': 10,
+    'return': 10,
+}
+
+# The API's MAX_ACTIVE_BORROWS
+MAX_BOOKS = 3
+
+
+class Reader:
+    """One virtual reader: its token, its open borrows and its connection."""
+
+    def __init__(self, port, token, rng, pick_book, search_terms):
+        self.port = port
+        self.headers = {'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'}
+        self.rng = rng
+        self.pick_book = pick_book
+        self.search_terms = search_terms
+        self.borrows = []
+        self.conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+
+    def request(self, method, path, body=None):
+        try:
+            self.conn.request(method, path, body=json.dumps(body) if body else None, headers=self.headers)
+            response = self.conn.getresponse()
+            payload = response.read()
+            if response.getheader('Connection', '').lower() == 'close':
+                self.conn.close()
+            return response.status, payload
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            self.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+            return None, None
+
+    def next_operation(self):
+        operation = self.rng.choices(list(OPERATIONS), weights=list(OPERATIONS.values()))[0]
+        if operation == 'borrow' and len(self.borrows) >= MAX_BOOKS:
+            return 'browse detail'
+        if operation == 'return' and not self.borrows:
+            return 'browse list'
+        return operation
+
+    def run(self, operation):
+        """Run ``operation``; returns the HTTP status, None on a connection error."""
+        if operation == 'browse list':
+            return self.request('GET', '/api/book/?page_size=20')[0]
+        if operation == 'browse search':
+            return self.request('GET', '/api/book/?' + urlencode({'search': self.rng.choice(self.search_terms)}))[0]
+        if operation == 'browse detail':
+            return self.request('GET', f'/api/book/{self.pick_book()}/')[0]
+        if operation == 'my borrows':
+            return self.request('GET', '/api/borrow/?returned=false')[0]
+        if operation == 'borrow':
+            status, payload = self.request('POST', '/api/borrow/', {'book': self.pick_book()})
+            if status == 201:
+                self.borrows.append(json.loads(payload)['id'])
+            return status
+        status, _ = self.request('POST', '/api/return/', {'borrow_id': self.borrows[-1]})
+        if status is not None and status < 500:
+            self.borrows.pop()
+        return status
+
+
+def client(port, tokens, book_ids, skew, duration, seed):
+    """Drive one reader per token for ``duration`` seconds; returns the samples of each operation."""
+    deadline = time.monotonic() + duration
+    ranked = list(book_ids)
+    random.Random(len(ranked)).shuffle(ranked)
+    weights = [rank ** -skew for rank in range(1, len(ranked) + 1)]
+    search_terms = ['Book', 'Description', 'book 0001', 'Author']
+    samples = {operation: {'latencies': [], 'rejected': 0, 'errors': 0} for operation in OPERATIONS}
+
+    def worker(index, token):
+        rng = random.Random(seed * 100000 + index)
+        reader = Reader(
+            port, token, rng, lambda: rng.choices(ranked, weights=weights)[0], search_terms,
+        )
+        while time.monotonic() < deadline:
+            operation = reader.next_operation()
+            start = time.perf_counter()
+            status = reader.run(operation)
+            elapsed = (time.perf_counter() - start) * 1000
+            sample = samples[operation]
+            if status is None or status >= 500:
+                sample['errors'] += 1
+            else:
+                # A 4xx (no copies left, limit reached) is an answer, not a failure
+                sample['latencies'].append(elapsed)
+                if status >= 400:
+                    sample['rejected'] += 1
+
+    threads = [threading.Thread(target=worker, args=(i, token)) for i, token in enumerate(tokens)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples
+
+
+def run(name, args, tokens, book_ids, db_path):
+    with running_server(name, db_path, args.port, args.workers, args.wsgi_threads):
+        per_client = [tokens[i::args.clients] for i in range(args.clients)]
+        with ProcessPoolExecutor(args.clients) as pool:
+            futures = [
+                pool.submit(client, args.port, chunk, book_ids, args.skew, args.duration, seed)
+                for seed, chunk in enumerate(per_client, start=1)
+            ]
+            merged = {operation: {'latencies': [], 'rejected': 0, 'errors': 0} for operation in OPERATIONS}
+            for future in futures:
+                for operation, sample in future.result().items():
+                    merged[operation]['latencies'].extend(sample['latencies'])
+                    merged[operation]['rejected'] += sample['rejected']
+                    merged[operation]['errors'] += sample['errors']
+
+    results = {}
+    for operation, sample in merged.items():
+        results[f'{name} {operation}'] = {
+            'errors': sample['errors'],
+            'rejected': sample['rejected'],
+            **latency_stats(sample['latencies'], args.duration),
+        }
+    everything = [latency for sample in merged.values() for latency in sample['latencies']]
+    results[f'{name} total'] = {
+        'errors': sum(sample['errors'] for sample in merged.values()),
+        'rejected': sum(sample['rejected'] for sample in merged.values()),
+        **latency_stats(everything, args.duration),
+    }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--server', choices=SERVERS, default='wsgi')
+    parser.add_argument('--workers', type=int, default=2, help='Server worker processes')
+    parser.add_argument('--wsgi-threads', type=int, default=1, help='Threads per gunicorn worker')
+    parser.add_argument('--readers', type=int, default=32, help='Concurrent virtual readers')
+    parser.add_argument('--clients', type=int, default=4, help='Client processes the readers are spread over')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds of load')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--books', type=int, default=10000)
+    parser.add_argument('--borrows', type=int, default=100000)
+    parser.add_argument('--skew', type=float, default=1.0, help='Zipf exponent of book popularity')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    parser.add_argument('--baseline', help='Compare with the results stored in this file')
+    parser.add_argument('--save-baseline', help='Store the results as the new baseline in this file')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='Allowed regression, as a fraction')
+    args = parser.parse_args()
+
+    setup_django()
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    from authentication.models import User
+    from benchmarks.seed import seed
+    from library.models import Book
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench_load.sqlite3')
+    with benchmark_database(db_path):
+        seed(users=args.users, books=args.books, borrows=args.borrows, skew=args.skew, log=lambda message: None)
+        # Readers start without open borrows so the limit only depends on the run
+        readers = User.objects.filter(active_borrow_count=0).order_by('pk')[:args.readers]
+        tokens = [str(AccessToken.for_user(user)) for user in readers]
+        book_ids = [str(pk) for pk in Book.objects.order_by('pk').values_list('pk', flat=True)]
+        results = run(args.server, args, tokens, book_ids, db_path)
+
+    for name, result in results.items():
+        if result['requests']:
+            print(
+                f"{name:28} {result['rps']:>8.1f} req/s  median {result['median_ms']:>8.2f} ms  "
+                f"p95 {result['p95_ms']:>8.2f} ms  p99 {result['p99_ms']:>8.2f} ms  "
+                f"({result['rejected']} rejected, {result['errors']} errors)"
+            )
+
+    if args.output:
+        save_results(args.output, results, vars(args))
+    if args.save_baseline:
+        save_results(args.save_baseline, results, vars(args))
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        if regressions:
+            print(f'{len(regressions)} figures regressed by more than {args.tolerance:.0%}')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
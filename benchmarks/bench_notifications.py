@@ -0,0 +1,125 @@
+"""
+Throughput of the due date reminders against the locmem e-mail backend:
+one task per borrow versus the batched ``send_due_date_notifications``.
+
+    python -m benchmarks.bench_notifications --borrows 20000 --chunk-size 500
+
+The locmem backend takes the SMTP round trips out of the picture, so the
+numbers compare the query and rendering cost of the two pipelines.
+"""
+import argparse
+import json
+import time
+from datetime import timedelta
+
+from benchmarks.harness import benchmark_database, setup_django
+
+
+def seed_due_borrows(count, batch_size=5000):
+    """Create ``count`` open borrows spread over the next 24 hours."""
+    from django.utils import timezone
+
+    from authentication.models import User
+    from library.models import Author, Book, Borrow
+
+    now = timezone.now()
+    User.objects.bulk_create(
+        User(username=f'reader{i}', email=f'reader{i}@example.com') for i in range(max(1, count // 3))
+    )
+    users = list(User.objects.order_by('pk'))
+    author = Author.objects.create(name='Author')
+    books = Book.objects.bulk_create(
+        Book(title=f'Book {i:06d}', author=author) for i in range(max(1, count // 10))
+    )
+    step = timedelta(hours=23) / count
+    Borrow.objects.bulk_create(
+        (
+            Borrow(
+                user=users[i % len(users)],
+                book=books[i % len(books)],
+                borrow_date=now - timedelta(days=13),
+                due_date=now + timedelta(minutes=30) + step * i,
+            )
+            for i in range(count)
+        ),
+        batch_size=batch_size,
+    )
+
+
+def reset_markers():
+    from library.models import Borrow
+
+    Borrow.objects.update(due_notification_sent_at=None)
+
+
+def run_per_borrow():
+    """The old pipeline: one task, one query and one connection per borrow."""
+    from library.models import Borrow
+    from library.tasks import send_due_date_notification
+
+    for borrow_id in Borrow.objects.filter(returned=False).values_list('pk', flat=True):
+        send_due_date_notification(borrow_id)
+
+
+def run_batched(chunk_size):
+    from library.tasks import send_due_date_notifications
+
+    send_due_date_notifications(chunk_size=chunk_size)
+
+
+def timed(func, count):
+    from django.core import mail
+    from django.db import connection
+
+    queries = 0
+
+    def count_queries(execute, sql, params, many, context):
+        nonlocal queries
+        queries += 1
+        return execute(sql, params, many, context)
+
+    reset_markers()
+    mail.outbox = []
+    with connection.execute_wrapper(count_queries):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+    assert len(mail.outbox) == count, (len(mail.outbox), count)
+    return {
+        'seconds': round(elapsed, 3),
+        'messages_per_second': round(count / elapsed, 1),
+        'queries': queries,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--borrows', type=int, default=5000)
+    parser.add_argument('--chunk-size', type=int, default=500)
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.test.utils import override_settings
+
+    with override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'):
+        with benchmark_database():
+            seed_due_borrows(args.borrows)
+            results = {
+                'per borrow': timed(run_per_borrow, args.borrows),
+                'batched': timed(lambda: run_batched(args.chunk_size), args.borrows),
+            }
+
+    for name, result in results.items():
+        print(
+            f"{name:12} {result['seconds']:>8.3f} s  {result['messages_per_second']:>10.1f} msg/s"
+            f"  {result['queries']:>7} queries"
+        )
+
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump({'results': results, 'args': vars(args)}, fh, indent=2)
+
+
+if __name__ == '__main__':
+    main()
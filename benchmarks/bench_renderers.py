@@ -0,0 +1,84 @@
+"""
+pytest-benchmark microbenchmarks of JSON rendering: DRF's ``JSONRenderer``
+against ``FastJSONRenderer`` with orjson and with the standard library, on
+book and borrow lists up to a bulk-sized batch, and cached detail payloads
+rendered from their data against written out as fragments (alone, as
+book_detail sends one, and a hundred in a list).
+
+    pytest benchmarks/bench_renderers.py --benchmark-group-by=param
+"""
+import pytest
+
+SIZES = (100, 1000, 10000)
+
+RENDERERS = ('drf', 'fast', 'fast-stdlib')
+
+
+@pytest.fixture(params=SIZES, ids=lambda size: f'{size} rows')
+def size(request):
+    return request.param
+
+
+@pytest.fixture(params=RENDERERS)
+def render(request):
+    from unittest import mock
+
+    from rest_framework.renderers import JSONRenderer
+
+    from utils.renderers import FastJSONRenderer
+
+    if request.param == 'drf':
+        yield JSONRenderer().render
+    elif request.param == 'fast':
+        yield FastJSONRenderer().render
+    else:
+        with mock.patch('utils.renderers.orjson', None):
+            yield FastJSONRenderer().render
+
+
+def _rows(serializer_class, queryset, size):
+    rows = serializer_class.represent_rows(serializer_class.get_row_queryset(queryset)[:size])
+    # Repeat the dataset for sizes beyond it
+    return (rows * (size // len(rows) + 1))[:size]
+
+
+def test_book_list(benchmark, dataset, size, render):
+    from library.models import Book
+    from library.serializers import BookSerializer
+
+    data = {'next': None, 'previous': None, 'results': _rows(BookSerializer, Book.objects.all(), size)}
+    assert benchmark(render, data)
+
+
+def test_borrow_list(benchmark, dataset, size, render):
+    from library.models import Borrow
+    from library.serializers import BorrowSerializer
+
+    data = {'next': None, 'previous': None, 'results': _rows(BorrowSerializer, Borrow.objects.all(), size)}
+    assert benchmark(render, data)
+
+
+@pytest.mark.parametrize('spliced', (False, True), ids=('data', 'fragments'))
+def test_cached_details(benchmark, dataset, spliced):
+    """100 cached book detail entries, rendered from their data or spliced in."""
+    from library.cache import detail_entry
+    from library.models import Book
+    from library.serializers import BookSerializer
+    from utils.renderers import FastJSONRenderer
+
+    books = BookSerializer.get_optimized_queryset(Book.objects.all())[:100]
+    entries = [detail_entry(BookSerializer, book)['data'] for book in books]
+    payload = entries if spliced else [entry.data for entry in entries]
+    assert benchmark(FastJSONRenderer().render, payload)
+
+
+@pytest.mark.parametrize('spliced', (False, True), ids=('data', 'fragment'))
+def test_cached_detail_response(benchmark, dataset, spliced):
+    """One cached book detail entry as the whole response, as book_detail sends it."""
+    from library.cache import detail_entry
+    from library.models import Book
+    from library.serializers import BookSerializer
+    from utils.renderers import FastJSONRenderer
+
+    entry = detail_entry(BookSerializer, BookSerializer.get_optimized_queryset(Book.objects.all())[0])['data']
+    assert benchmark(FastJSONRenderer().render, entry if spliced else entry.data)
@@ -0,0 +1,140 @@
+"""
+Cost of the reservation queue operations on popular titles, at several
+queue depths: joining the queue, handing a returned copy to the next in
+line, and the queue position shown to the last holder. Each title also has
+as many served (fulfilled or cancelled) holds ahead of its waiting ones.
+Finally the pickup notices for a batch of held copies are sent through
+``send_reservation_notifications`` against the locmem e-mail backend.
+
+    python -m benchmarks.bench_reservations --holds 1000 5000 20000 --notify 1000
+
+Joining and handing over read the ends of the (book, position) indexes, so
+they should not grow with the depth; the queue position is a count over
+the waiting holds ahead and does.
+"""
+import argparse
+import json
+import time
+
+from benchmarks.harness import benchmark_database, measure, setup_django, summarize
+
+
+def seed_queues(depths, batch_size=5000):
+    """A book per depth, each with that many served holds followed by that many waiting ones."""
+    from authentication.models import User
+    from library.models import Author, Book, Reservation
+
+    User.objects.bulk_create(
+        (User(username=f'holder{i}', email=f'holder{i}@example.com') for i in range(max(depths) + 1)),
+        batch_size=batch_size,
+    )
+    users = list(User.objects.order_by('pk').values_list('pk', flat=True))
+    author = Author.objects.create(name='Author')
+    books = {}
+    for depth in depths:
+        book = books[depth] = Book.objects.create(
+            title=f'Popular {depth}', author=author, total_copies=1, available_copies=0,
+        )
+        served = (Reservation.FULFILLED, Reservation.CANCELLED)
+        Reservation.objects.bulk_create(
+            (
+                Reservation(
+                    user_id=users[i % depth], book=book, position=i + 1,
+                    status=served[i % 2] if i < depth else Reservation.WAITING,
+                )
+                for i in range(2 * depth)
+            ),
+            batch_size=batch_size,
+        )
+    # The last user is kept out of every queue to join them
+    return books, users[-1]
+
+
+def rolled_back(func):
+    """``func`` run in a transaction that is rolled back, so the queue stays as seeded."""
+    from django.db import transaction
+
+    def run():
+        with transaction.atomic():
+            func()
+            transaction.set_rollback(True)
+    return run
+
+
+def time_notifications(book, count):
+    from django.core import mail
+    from django.db import connection
+
+    from library.models import Reservation
+    from library.tasks import send_reservation_notifications
+
+    Reservation.hold_copies(book.pk, count)
+    queries = 0
+
+    def count_queries(execute, sql, params, many, context):
+        nonlocal queries
+        queries += 1
+        return execute(sql, params, many, context)
+
+    mail.outbox = []
+    with connection.execute_wrapper(count_queries):
+        start = time.perf_counter()
+        send_reservation_notifications()
+        elapsed = time.perf_counter() - start
+    assert len(mail.outbox) == count, (len(mail.outbox), count)
+    return {
+        'seconds': round(elapsed, 3),
+        'messages_per_second': round(count / elapsed, 1),
+        'queries': queries,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--holds', type=int, nargs='+', default=[1000, 5000, 20000], help='Waiting holds per title')
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--notify', type=int, default=1000, help='Pickup notices to send in one run')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.test.utils import override_settings
+
+    from authentication.models import User
+    from library.models import Reservation
+    from library.serializers import ReservationSerializer
+
+    results = {}
+    with override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'):
+        with benchmark_database():
+            books, outsider_id = seed_queues(args.holds)
+            outsider = User.objects.get(pk=outsider_id)
+            for depth, book in books.items():
+                last = Reservation.objects.filter(book=book).order_by('-position').first()
+                operations = {
+                    'join queue': lambda: Reservation.enqueue(outsider, book.pk),
+                    'next in line': lambda: Reservation.hold_copies(book.pk),
+                    'queue position': lambda: ReservationSerializer(last).data,
+                }
+                for name, func in operations.items():
+                    results[f'{depth} holds {name}'] = summarize(
+                        measure(rolled_back(func), repeat=args.repeat, warmup=10),
+                    )
+            results['notifications'] = time_notifications(books[max(books)], min(args.notify, max(books)))
+
+    for name, result in results.items():
+        if 'median_ms' in result:
+            print(f"{name:32} median {result['median_ms']:.3f} ms  p95 {result['p95_ms']:.3f} ms")
+    notifications = results['notifications']
+    print(
+        f"{'notifications':32} {notifications['seconds']:.3f} s  "
+        f"{notifications['messages_per_second']:.1f} msg/s  {notifications['queries']} queries"
+    )
+
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump({'results': results, 'args': vars(args)}, fh, indent=2)
+
+
+if __name__ == '__main__':
+    main()
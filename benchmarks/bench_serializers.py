@@ -0,0 +1,118 @@
+"""
+pytest-benchmark microbenchmarks of list serialization, one API page
+(``API_PAGE_SIZE`` rows by default), the largest page and a bulk-sized
+batch, with the queries the list views run. Each serializer is measured
+on model instances and on the ``values()`` rows of ``represent_rows()``,
+which the list views use.
+
+    pytest benchmarks/bench_serializers.py --benchmark-autosave --benchmark-storage=benchmarks/baselines
+    pytest benchmarks/bench_serializers.py --benchmark-storage=benchmarks/baselines \\
+        --benchmark-compare --benchmark-compare-fail=median:10%
+
+``--benchmark-compare`` compares with the latest saved run and
+``--benchmark-compare-fail`` fails the run on a regression.
+"""
+import pytest
+
+PAGE_SIZES = (20, 100, 1000)
+
+
+@pytest.fixture(params=PAGE_SIZES, ids=lambda size: f'{size} rows')
+def page_size(request):
+    return request.param
+
+
+def test_book_serializer(benchmark, dataset, page_size):
+    from library.models import Book
+    from library.serializers import BookSerializer
+
+    books = list(BookSerializer.get_optimized_queryset(Book.objects.order_by('title'))[:page_size])
+    data = benchmark(lambda: BookSerializer(books, many=True).data)
+    assert len(data) == page_size
+
+
+def test_borrow_serializer(benchmark, dataset, page_size):
+    from library.models import Borrow
+    from library.serializers import BorrowSerializer
+
+    borrows = list(BorrowSerializer.get_optimized_queryset(Borrow.objects.order_by('-borrow_date'))[:page_size])
+    data = benchmark(lambda: BorrowSerializer(borrows, many=True).data)
+    assert len(data) == page_size
+
+
+def test_book_rows(benchmark, dataset, page_size):
+    from library.models import Book
+    from library.serializers import BookSerializer
+
+    rows = list(BookSerializer.get_row_queryset(Book.objects.order_by('title'))[:page_size])
+    data = benchmark(lambda: BookSerializer.represent_rows(rows))
+    assert len(data) == page_size
+
+
+def test_borrow_rows(benchmark, dataset, page_size):
+    from library.models import Borrow
+    from library.serializers import BorrowSerializer
+
+    rows = list(BorrowSerializer.get_row_queryset(Borrow.objects.order_by('-borrow_date'))[:page_size])
+    data = benchmark(lambda: BorrowSerializer.represent_rows(rows))
+    assert len(data) == page_size
+
+
+def test_book_page_with_query(benchmark, dataset):
+    """A book list page as the view builds it: the keyset query plus serialization."""
+    from library.models import Book
+    from library.serializers import BookSerializer
+
+    def page():
+        books = BookSerializer.get_optimized_queryset(Book.objects.order_by('title', 'id'))[:20]
+        return BookSerializer(books, many=True).data
+
+    assert len(benchmark(page)) == 20
+
+
+def test_book_rows_page_with_query(benchmark, dataset):
+    from library.models import Book
+    from library.serializers import BookSerializer
+
+    def page():
+        rows = BookSerializer.get_row_queryset(Book.objects.order_by('title', 'id'), 'title')[:20]
+        return BookSerializer.represent_rows(rows)
+
+    assert len(benchmark(page)) == 20
+
+
+def test_borrow_page_with_query(benchmark, dataset):
+    """A borrow list page of the most active reader (the skewed seed gives one)."""
+    from django.db.models import Count
+
+    from authentication.models import User
+    from library.models import Borrow
+    from library.serializers import BorrowSerializer
+
+    reader = User.objects.annotate(total=Count('borrows')).order_by('-total').first()
+
+    def page():
+        borrows = BorrowSerializer.get_optimized_queryset(
+            Borrow.objects.filter(user=reader).order_by('-borrow_date', '-id'),
+        )[:20]
+        return BorrowSerializer(borrows, many=True).data
+
+    assert len(benchmark(page)) == 20
+
+
+def test_borrow_rows_page_with_query(benchmark, dataset):
+    from django.db.models import Count
+
+    from authentication.models import User
+    from library.models import Borrow
+    from library.serializers import BorrowSerializer
+
+    reader = User.objects.annotate(total=Count('borrows')).order_by('-total').first()
+
+    def page():
+        rows = BorrowSerializer.get_row_queryset(
+            Borrow.objects.filter(user=reader).order_by('-borrow_date', '-id'), 'borrow_date',
+        )[:20]
+        return BorrowSerializer.represent_rows(rows)
+
+    assert len(benchmark(page)) == 20
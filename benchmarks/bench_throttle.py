@@ -0,0 +1,82 @@
+"""
+Per-request overhead of the throttles: DRF's timestamp-history
+``UserRateThrottle`` against the sliding window counter in
+``utils.throttling``.
+
+    python -m benchmarks.bench_throttle --requests 20000 --rate 10000/hour
+    python -m benchmarks.bench_throttle --redis redis://localhost:6379/1
+
+The history throttle's cost grows with the number of requests already in
+the window; the counter's does not, so the rate should be high enough for
+the window to fill up.
+"""
+import argparse
+import json
+import time
+from types import SimpleNamespace
+
+from benchmarks.harness import setup_django, summarize
+
+
+def run(throttle_class, rate, requests, users):
+    """Time ``allow_request`` for ``requests`` calls spread over ``users``."""
+    timings = []
+    allowed = 0
+    throttle_class = type(throttle_class.__name__, (throttle_class,), {'rate': rate, 'scope': None})
+    for i in range(requests):
+        request = SimpleNamespace(user=SimpleNamespace(is_authenticated=True, pk=i % users))
+        throttle = throttle_class()
+        start = time.perf_counter()
+        allowed += throttle.allow_request(request, None)
+        timings.append((time.perf_counter() - start) * 1000)
+    return {'allowed': allowed, **summarize(timings)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--users', type=int, default=1)
+    parser.add_argument('--rate', default='10000/hour')
+    parser.add_argument('--redis', help='Redis URL to run against instead of the local memory cache')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.core.cache import caches
+    from django.test.utils import override_settings
+    from rest_framework.throttling import UserRateThrottle
+
+    from utils.throttling import SlidingWindowThrottleMixin
+
+    if args.redis:
+        backend = {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': args.redis}
+    else:
+        backend = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+
+    class HistoryThrottle(UserRateThrottle):
+        pass
+
+    class CounterThrottle(SlidingWindowThrottleMixin, UserRateThrottle):
+        pass
+
+    results = {}
+    with override_settings(CACHES={'default': backend}, THROTTLE_CACHE='default'):
+        for name, throttle_class in (('history', HistoryThrottle), ('counter', CounterThrottle)):
+            caches['default'].clear()
+            # The history throttle reads the module-level default cache
+            throttle_class.cache = caches['default']
+            results[name] = run(throttle_class, args.rate, args.requests, args.users)
+
+    for name, result in results.items():
+        print(
+            f"{name:8} allowed {result['allowed']:>7}  median {result['median_ms']:.4f} ms"
+            f"  p95 {result['p95_ms']:.4f} ms  max {result['max_ms']:.4f} ms"
+        )
+
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump({'results': results, 'args': vars(args)}, fh, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,20 @@
+"""
+pytest setup of the serializer microbenchmarks: Django is configured once
+and the ``dataset`` fixture seeds a throwaway database for the session.
+"""
+import pytest
+
+from benchmarks.harness import benchmark_database, setup_django
+
+
+def pytest_configure(config):
+    setup_django()
+
+
+@pytest.fixture(scope='session')
+def dataset():
+    from benchmarks.seed import seed
+
+    with benchmark_database():
+        seed(users=200, authors=100, books=2000, borrows=20000, skew=1.0, log=lambda message: None)
+        yield
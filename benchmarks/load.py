@@ -0,0 +1,129 @@
+"""
+Helpers of the HTTP load benchmarks: running the project under gunicorn or
+uvicorn against a seeded database, latency statistics, and comparing
+results with a stored baseline.
+"""
+import http.client
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+from benchmarks.harness import summarize
+
+SERVERS = ('wsgi', 'asgi', 'asgi-sync')
+
+# Extra environment of each server (see benchmarks/server.py)
+SERVER_ENV = {
+    'wsgi': {},
+    'asgi': {'BENCH_SERVER': 'asgi'},
+    # The sync views under ASGI, each request crossing one sync_to_async bridge
+    'asgi-sync': {'BENCH_SERVER': 'asgi', 'API_ASYNC_VIEWS': '0'},
+}
+
+
+def server_command(name, port, workers, wsgi_threads=1):
+    if name == 'wsgi':
+        return [
+            sys.executable, '-m', 'gunicorn', 'benchmarks.server:application',
+            '--bind', f'127.0.0.1:{port}', '--workers', str(workers),
+            '--threads', str(wsgi_threads), '--log-level', 'warning',
+        ]
+    return [
+        sys.executable, '-m', 'uvicorn', 'benchmarks.server:application',
+        '--host', '127.0.0.1', '--port', str(port), '--workers', str(workers),
+        '--log-level', 'warning', '--no-access-log',
+    ]
+
+
+def wait_for(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/api/category/')
+            conn.getresponse().read()
+            return
+        except (OSError, http.client.HTTPException):
+            time.sleep(0.2)
+    raise RuntimeError(f'Server on port {port} did not start')
+
+
+@contextmanager
+def running_server(name, db_path, port, workers, wsgi_threads=1):
+    """Run server ``name`` on ``db_path`` for the duration of the block."""
+    env = {**os.environ, 'BENCH_DB': db_path, **SERVER_ENV[name]}
+    server = subprocess.Popen(server_command(name, port, workers, wsgi_threads), env=env)
+    try:
+        wait_for(port)
+        yield server
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def latency_stats(latencies, duration):
+    """Throughput and latency percentiles of a list of latencies (ms)."""
+    if not latencies:
+        return {'requests': 0, 'rps': 0.0}
+    ordered = sorted(latencies)
+    return {
+        'requests': len(ordered),
+        'rps': round(len(ordered) / duration, 1),
+        'p99_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 3),
+        **summarize(ordered),
+    }
+
+
+def environment():
+    """Where a result was measured; results only compare on the same machine."""
+    return {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def save_results(path, results, args):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as fh:
+        json.dump({'results': results, 'args': args, 'environment': environment()}, fh, indent=2)
+
+
+# Metric -> True if higher is better
+COMPARED_METRICS = {'rps': True, 'median_ms': False, 'p99_ms': False}
+
+
+def compare(results, baseline_path, tolerance):
+    """
+    Print each metric against the baseline in ``baseline_path``.
+
+    Returns the regressions: metrics more than ``tolerance`` (a fraction)
+    worse than the baseline.
+    """
+    with open(baseline_path) as fh:
+        baseline = json.load(fh)
+    if baseline.get('environment') != environment():
+        print('warning: the baseline was measured on a different machine')
+
+    regressions = []
+    for name, result in results.items():
+        previous = baseline['results'].get(name)
+        if not previous:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            old, new = previous.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            flag = ''
+            if worse > tolerance:
+                flag = '  REGRESSION'
+                regressions.append((name, metric, old, new))
+            print(f'{name:24} {metric:9} {old:>10.2f} -> {new:>10.2f}  ({change:+.1%}){flag}')
+    return regressions
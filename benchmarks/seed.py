@@ -0,0 +1,129 @@
+"""Deterministic dataset generator for the benchmarks."""
+import io
+import itertools
+import random
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from authentication.models import User
+from library.models import Author, Book, Borrow, Category
+from library.search import rebuild_search_index
+
+LOAN_DAYS = 14
+
+
+def _batched(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _uuid(rng):
+    return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+
+def _picker(rng, items, skew):
+    """
+    Function drawing from ``items``: uniformly without ``skew``, otherwise
+    with Zipf weights (rank ** -skew) over a shuffled order of the items.
+    """
+    if not skew:
+        return lambda: rng.choice(items)
+    ranked = list(items)
+    random.Random(len(ranked)).shuffle(ranked)
+    cum_weights = list(itertools.accumulate(rank ** -skew for rank in range(1, len(ranked) + 1)))
+    return lambda: rng.choices(ranked, cum_weights=cum_weights)[0]
+
+
+def seed(users=1000, authors=500, categories=20, books=10000, borrows=100000,
+         open_ratio=0.05, random_seed=42, batch_size=5000, skew=0.0, log=print):
+    """
+    Fill the current database with a reproducible catalog and borrow history.
+
+    The same arguments always produce the same rows and primary keys, with
+    dates relative to now, so timings from different runs are comparable.
+    With ``skew`` (around 1 is realistic) borrows follow a Zipf distribution:
+    a few books and readers account for most of the history.
+    """
+    rng = random.Random(random_seed)
+    now = timezone.now().replace(microsecond=0)
+    password = make_password('benchmark')
+
+    User.objects.bulk_create(
+        User(
+            username=f'user{i}', email=f'user{i}@example.com', first_name='Bench',
+            password=password,
+        )
+        for i in range(users)
+    )
+    user_ids = list(User.objects.order_by('pk').values_list('pk', flat=True))
+    log(f'users: {len(user_ids)}')
+
+    author_rows = [Author(id=_uuid(rng), name=f'Author {i}', bio=f'Biography of author {i}') for i in range(authors)]
+    Author.objects.bulk_create(author_rows, batch_size=batch_size)
+    category_rows = [Category(id=_uuid(rng), name=f'Category {i}') for i in range(categories)]
+    Category.objects.bulk_create(category_rows, batch_size=batch_size)
+    log(f'authors: {authors}, categories: {categories}')
+
+    book_ids = []
+    for batch in _batched(range(books), batch_size):
+        rows = []
+        for i in batch:
+            copies = rng.randint(1, 10)
+            rows.append(Book(
+                id=_uuid(rng),
+                title=f'Book {i:08d}',
+                description=f'Description of book {i}',
+                author=rng.choice(author_rows),
+                category=rng.choice(category_rows),
+                total_copies=copies,
+                available_copies=copies,
+            ))
+        Book.objects.bulk_create(rows)
+        book_ids.extend(row.id for row in rows)
+    log(f'books: {len(book_ids)}')
+
+    pick_user = _picker(rng, user_ids, skew)
+    pick_book = _picker(rng, book_ids, skew)
+    span = timedelta(days=730).total_seconds()
+    for done, batch in enumerate(_batched(range(borrows), batch_size), start=1):
+        rows = []
+        for _ in batch:
+            borrow_date = now - timedelta(seconds=rng.uniform(0, span))
+            due_date = borrow_date + timedelta(days=LOAN_DAYS)
+            returned = borrow_date < now - timedelta(days=LOAN_DAYS * 2) or rng.random() > open_ratio
+            return_date = borrow_date + timedelta(days=rng.uniform(1, LOAN_DAYS * 1.5)) if returned else None
+            rows.append(Borrow(
+                id=_uuid(rng),
+                user_id=pick_user(),
+                book_id=pick_book(),
+                borrow_date=borrow_date,
+                due_date=due_date,
+                return_date=min(return_date, now) if return_date else None,
+                returned=returned,
+            ))
+        Borrow.objects.bulk_create(rows)
+        if done % 20 == 0:
+            log(f'borrows: {done * batch_size}')
+    log(f'borrows: {borrows}')
+
+    # Keep the denormalized counters consistent with the generated history.
+    open_borrows = (
+        Borrow.objects.filter(book=OuterRef('pk'), returned=False)
+        .order_by().values('book').annotate(count=Count('pk')).values('count')
+    )
+    Book.objects.update(total_copies=F('total_copies') + Coalesce(Subquery(open_borrows), 0))
+    call_command('reconcile_borrow_counts', batch_size=batch_size, stdout=io.StringIO())
+    rebuild_search_index(Book, batch_size=batch_size)
+    rebuild_search_index(Author, batch_size=batch_size)
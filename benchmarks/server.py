@@ -0,0 +1,25 @@
+"""
+WSGI/ASGI entry point for ``bench_asgi``: the project's application, pointed
+at the benchmark database with the throttle limits raised out of the way.
+
+    BENCH_DB=/tmp/bench.sqlite3 gunicorn benchmarks.server:application
+    BENCH_DB=/tmp/bench.sqlite3 BENCH_SERVER=asgi uvicorn benchmarks.server:application
+"""
+import logging
+import os
+
+from django.conf import settings
+
+if os.environ.get('BENCH_SERVER') == 'asgi':
+    from core.asgi import application  # noqa: F401
+else:
+    from core.wsgi import application  # noqa: F401
+
+from utils.throttling import BurstRateThrottle, SustainedRateThrottle  # noqa: E402
+
+settings.DATABASES['default']['NAME'] = os.environ['BENCH_DB']
+# The throttles still count every request, they just never refuse one
+SustainedRateThrottle.rate = '100000000/hour'
+BurstRateThrottle.rate = '100000000/hour'
+# Refused borrows are part of the workload, not worth a log line each
+logging.getLogger('django.request').setLevel(logging.ERROR)
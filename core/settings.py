@@ -51,11 +51,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'utils.instrumentation.InstrumentationMiddleware',
+    'utils.query_analysis.QueryAnalysisMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'utils.audit.AuditContextMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -95,6 +98,57 @@ DATABASES = {
 }
 
 
+# Cache
+# Local memory per process by default; set REDIS_CACHE_URL to share the cache
+# (detail payloads, throttling counters) between workers.
+
+REDIS_CACHE_URL = os.environ.get('REDIS_CACHE_URL')
+if REDIS_CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_CACHE_URL,
+            # Fail fast when Redis is down instead of stalling requests
+            'OPTIONS': {
+                'socket_connect_timeout': 0.5,
+                'socket_timeout': 0.5,
+            },
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Seconds an authenticated user row stays cached between requests
+JWT_USER_CACHE_TIMEOUT = int(os.environ.get('JWT_USER_CACHE_TIMEOUT', 60))
+
+# Cache alias holding the throttle counters, and how long to count in-process
+# after it could not be reached
+THROTTLE_CACHE = os.environ.get('THROTTLE_CACHE', 'default')
+THROTTLE_FALLBACK_SECONDS = int(os.environ.get('THROTTLE_FALLBACK_SECONDS', 30))
+
+# Rows fetched and written per chunk by the streaming borrow export
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 2000))
+
+# Seconds a serialized book/author/category detail payload stays cached
+LIBRARY_DETAIL_CACHE_TIMEOUT = int(os.environ.get('LIBRARY_DETAIL_CACHE_TIMEOUT', 300))
+
+# Book availability (library.availability): seconds a book's available copies
+# stay cached, and the change feed streamed under ASGI: whether changes are
+# published (off by default, as every borrow and return then writes the event
+# log; turn it on in every process that serves writes or streams), how often
+# each process polls for them, how long they are kept, and how long one
+# stream stays open before the client reconnects
+AVAILABILITY_CACHE_TIMEOUT = int(os.environ.get('AVAILABILITY_CACHE_TIMEOUT', 300))
+AVAILABILITY_STREAM = bool(int(os.environ.get('AVAILABILITY_STREAM', 0)))
+AVAILABILITY_STREAM_POLL_INTERVAL = float(os.environ.get('AVAILABILITY_STREAM_POLL_INTERVAL', 0.5))
+AVAILABILITY_EVENT_TIMEOUT = int(os.environ.get('AVAILABILITY_EVENT_TIMEOUT', 300))
+AVAILABILITY_STREAM_MAX_AGE = int(os.environ.get('AVAILABILITY_STREAM_MAX_AGE', 300))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -141,13 +195,41 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'authentication.jwt_auth.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
+    # orjson-backed when it is installed, same output as DRF's JSONRenderer
+    'DEFAULT_RENDERER_CLASSES': [
+        'utils.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
+# Cursor pagination for list endpoints: default page size and the upper
+# bound for the ``page_size`` query parameter
+API_PAGE_SIZE = int(os.environ.get('API_PAGE_SIZE', 20))
+API_MAX_PAGE_SIZE = int(os.environ.get('API_MAX_PAGE_SIZE', 100))
+
+# Route the catalog read endpoints to their native async views
+# (library.views.async_views). core.asgi turns this on by default.
+API_ASYNC_VIEWS = bool(int(os.environ.get('API_ASYNC_VIEWS', 0)))
+
+# Request instrumentation (utils.instrumentation): the fraction of requests
+# measured, how many measurements /api/instrumentation/ summarizes, and
+# whether measured responses carry a Server-Timing header
+INSTRUMENTATION_SAMPLE_RATE = float(os.environ.get('INSTRUMENTATION_SAMPLE_RATE', 0.01))
+INSTRUMENTATION_BUFFER_SIZE = int(os.environ.get('INSTRUMENTATION_BUFFER_SIZE', 10000))
+INSTRUMENTATION_SERVER_TIMING = bool(int(os.environ.get('INSTRUMENTATION_SERVER_TIMING', 1)))
+
+# Query analysis (utils.query_analysis), meant for staging: log requests that
+# run one query fingerprint more than QUERY_ANALYSIS_MAX_REPEATS times, or a
+# query slower than QUERY_ANALYSIS_SLOW_MS
+QUERY_ANALYSIS = bool(int(os.environ.get('QUERY_ANALYSIS', 0)))
+QUERY_ANALYSIS_MAX_REPEATS = int(os.environ.get('QUERY_ANALYSIS_MAX_REPEATS', 5))
+QUERY_ANALYSIS_SLOW_MS = int(os.environ.get('QUERY_ANALYSIS_SLOW_MS', 100))
+
 # JWT Settings
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
@@ -182,3 +264,43 @@ CELERY_TIMEZONE = 'UTC'
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_ACCEPT_CONTENT = ['json']
+CELERY_BEAT_SCHEDULE = {
+    'send-due-date-notifications': {
+        'task': 'library.tasks.send_due_date_notifications',
+        'schedule': 60 * 60,
+    },
+    'sweep-overdue-borrows': {
+        'task': 'library.tasks.sweep_overdue_borrows',
+        'schedule': 60 * 60,
+    },
+    'rollup-borrow-stats': {
+        'task': 'library.tasks.rollup_borrow_stats',
+        'schedule': 15 * 60,
+    },
+    'send-reservation-notifications': {
+        'task': 'library.tasks.send_reservation_notifications',
+        'schedule': 60,
+    },
+    'expire-reservations': {
+        'task': 'library.tasks.expire_reservations',
+        'schedule': 15 * 60,
+    },
+}
+
+# Due date reminders: borrows due within the window are notified once, in
+# chunks of DUE_NOTIFICATION_CHUNK_SIZE
+DUE_NOTIFICATION_WINDOW_HOURS = int(os.environ.get('DUE_NOTIFICATION_WINDOW_HOURS', 24))
+DUE_NOTIFICATION_CHUNK_SIZE = int(os.environ.get('DUE_NOTIFICATION_CHUNK_SIZE', 500))
+
+# Reservations: hours a returned copy is held for the next user in line,
+# and pickup notices sent per chunk
+RESERVATION_HOLD_HOURS = int(os.environ.get('RESERVATION_HOLD_HOURS', 72))
+RESERVATION_NOTIFICATION_CHUNK_SIZE = int(os.environ.get('RESERVATION_NOTIFICATION_CHUNK_SIZE', 500))
+
+# Overdue sweep: open borrows are re-projected this many at a time
+OVERDUE_SWEEP_CHUNK_SIZE = int(os.environ.get('OVERDUE_SWEEP_CHUNK_SIZE', 1000))
+
+# Statistics: days the periodic rollup recomputes, and how long an answer of
+# the statistics endpoints is cached (a new rollup invalidates it sooner)
+STATS_ROLLUP_DAYS = int(os.environ.get('STATS_ROLLUP_DAYS', 2))
+STATS_CACHE_TIMEOUT = int(os.environ.get('STATS_CACHE_TIMEOUT', 15 * 60))
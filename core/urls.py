@@ -10,4 +10,7 @@ urlpatterns = [
     path('api/', include('library.urls.category_urls')),
     path('api/', include('library.urls.book_urls')),
     path('api/', include('library.urls.borrow_urls')),
+    path('api/', include('library.urls.reservation_urls')),
+    path('api/', include('library.urls.stats_urls')),
+    path('api/', include('library.urls.instrumentation_urls')),
 ]
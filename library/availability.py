@@ -0,0 +1,219 @@
+"""
+Available copies of books, for clients that only need that figure.
+
+Each book's ``available_copies`` is cached under its own key, which makes
+a ``{book_id: available_copies}`` map that ``/api/book/availability/``
+answers batches of ids from. Code that changes the count calls
+``changed(*book_ids)``. Once the transaction commits, the counts of those
+books are read back in one query and written to the map. With
+``AVAILABILITY_STREAM`` on, the change is also appended to a short event
+log in the cache.
+
+Under ASGI, ``/api/book/availability/stream/`` pushes each change to its
+clients as a Server-Sent Event. One ``AvailabilityFeed`` per process polls
+the event log and fans the changes out to every stream of that process. A
+stream opens with a snapshot of the books it follows, so a client that
+reconnects has not missed anything.
+"""
+import asyncio
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, transaction
+
+from utils.instrumentation import record_cache
+from utils.renderers import dumps
+
+SEQUENCE_KEY = 'library:availability:sequence'
+
+# Events a feed reads from the log per poll; a feed that falls further
+# behind skips ahead
+MAX_EVENTS_PER_POLL = 1000
+# Changes a stream may have waiting before it is closed as too slow
+STREAM_QUEUE_SIZE = 256
+# Seconds between keepalive comments on an idle stream
+HEARTBEAT_INTERVAL = 15
+
+
+def cache_key(pk):
+    return f'library:availability:{pk}'
+
+
+def event_key(sequence):
+    return f'library:availability:event:{sequence}'
+
+
+def _book_model():
+    from library.models import Book
+    return Book
+
+
+def _merge(book_ids, cached):
+    """Split ``book_ids`` into the cached counts and the ids still to fetch."""
+    found = {}
+    for pk in book_ids:
+        copies = cached.get(cache_key(pk))
+        record_cache(copies is not None)
+        if copies is not None:
+            found[pk] = copies
+    return found, [pk for pk in book_ids if pk not in found]
+
+
+def get_availability(book_ids):
+    """``{book_id: available_copies}`` of ``book_ids``, None for books that do not exist."""
+    found, missing = _merge(book_ids, cache.get_many([cache_key(pk) for pk in book_ids]))
+    if missing:
+        fetched = dict(_book_model().objects.filter(pk__in=missing).values_list('pk', 'available_copies'))
+        cache.set_many(
+            {cache_key(pk): copies for pk, copies in fetched.items()}, settings.AVAILABILITY_CACHE_TIMEOUT,
+        )
+        found.update(fetched)
+    return {str(pk): found.get(pk) for pk in book_ids}
+
+
+async def aget_availability(book_ids):
+    """``get_availability()`` for the async views."""
+    found, missing = _merge(book_ids, await cache.aget_many([cache_key(pk) for pk in book_ids]))
+    if missing:
+        queryset = _book_model().objects.filter(pk__in=missing).values_list('pk', 'available_copies')
+        fetched = {pk: copies async for pk, copies in queryset}
+        await cache.aset_many(
+            {cache_key(pk): copies for pk, copies in fetched.items()}, settings.AVAILABILITY_CACHE_TIMEOUT,
+        )
+        found.update(fetched)
+    return {str(pk): found.get(pk) for pk in book_ids}
+
+
+def changed(*book_ids):
+    """Refresh the counts of ``book_ids`` once the current transaction commits."""
+    if book_ids:
+        # The change is committed by then, so a failed refresh is only logged
+        transaction.on_commit(lambda: refresh(book_ids), robust=True)
+
+
+def refresh(book_ids):
+    try:
+        counts = dict(_book_model().objects.filter(pk__in=book_ids).values_list('pk', 'available_copies'))
+    except DatabaseError:
+        # Drop the stale counts; the next read fetches them
+        cache.delete_many([cache_key(pk) for pk in book_ids])
+        raise
+    cache.set_many({cache_key(pk): copies for pk, copies in counts.items()}, settings.AVAILABILITY_CACHE_TIMEOUT)
+    # Deleted books
+    cache.delete_many([cache_key(pk) for pk in book_ids if pk not in counts])
+    if settings.AVAILABILITY_STREAM:
+        publish({str(pk): counts.get(pk) for pk in book_ids})
+
+
+def publish(changes):
+    """Append ``{book_id: available_copies}`` changes to the event log."""
+    cache.add(SEQUENCE_KEY, 0, None)
+    sequence = cache.incr(SEQUENCE_KEY)
+    cache.set(event_key(sequence), changes, settings.AVAILABILITY_EVENT_TIMEOUT)
+
+
+class Subscriber:
+    """One stream's view of the feed: the books it follows and its pending changes."""
+
+    def __init__(self, book_ids):
+        self.book_ids = {str(pk) for pk in book_ids} if book_ids else None
+        self.queue = asyncio.Queue(STREAM_QUEUE_SIZE)
+        self.overflowed = False
+
+    def send(self, changes):
+        if self.book_ids is not None:
+            changes = {pk: copies for pk, copies in changes.items() if pk in self.book_ids}
+            if not changes:
+                return
+        try:
+            self.queue.put_nowait(changes)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class AvailabilityFeed:
+    """
+    Follows the event log for the streams of this process.
+
+    The poller runs while any stream is open. An event announced by the
+    sequence but not stored yet is waited for one poll, then skipped.
+    """
+
+    def __init__(self):
+        self.subscribers = set()
+        self.sequence = None
+        self.task = None
+        self._waited = None
+
+    def subscribe(self, book_ids=None):
+        subscriber = Subscriber(book_ids)
+        self.subscribers.add(subscriber)
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self.run())
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+
+    async def run(self):
+        while self.subscribers:
+            await self.poll()
+            await asyncio.sleep(settings.AVAILABILITY_STREAM_POLL_INTERVAL)
+        # The next subscriber starts from the then current sequence
+        self.sequence = None
+
+    async def poll(self):
+        latest = await cache.aget(SEQUENCE_KEY) or 0
+        if self.sequence is None or latest < self.sequence or latest - self.sequence > MAX_EVENTS_PER_POLL:
+            self.sequence = latest
+            return
+        if latest == self.sequence:
+            return
+
+        sequences = range(self.sequence + 1, latest + 1)
+        events = await cache.aget_many([event_key(sequence) for sequence in sequences])
+        for sequence in sequences:
+            changes = events.get(event_key(sequence))
+            if changes is None and self._waited != sequence:
+                self._waited = sequence
+                return
+            if changes is not None:
+                for subscriber in list(self.subscribers):
+                    subscriber.send(changes)
+            self.sequence = sequence
+
+
+feed = AvailabilityFeed()
+
+
+def sse_event(changes):
+    return b'event: availability\ndata: ' + dumps(changes) + b'\n\n'
+
+
+async def stream(book_ids=None):
+    """
+    Server-Sent Events of the availability changes of ``book_ids`` (of every
+    book without them), starting with a snapshot of ``book_ids``.
+
+    The stream ends after ``AVAILABILITY_STREAM_MAX_AGE`` seconds, or when
+    the client falls too far behind; ``retry`` has it reconnect.
+    """
+    subscriber = feed.subscribe(book_ids)
+    try:
+        yield b'retry: 1000\n\n'
+        if book_ids:
+            yield sse_event(await aget_availability(book_ids))
+        deadline = time.monotonic() + settings.AVAILABILITY_STREAM_MAX_AGE
+        while not subscriber.overflowed:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                changes = await asyncio.wait_for(subscriber.queue.get(), min(remaining, HEARTBEAT_INTERVAL))
+            except asyncio.TimeoutError:
+                yield b': keepalive\n\n'
+                continue
+            yield sse_event(changes)
+    finally:
+        feed.unsubscribe(subscriber)
@@ -0,0 +1,157 @@
+"""
+Read-through cache of serialized detail payloads.
+
+Entries are keyed by model and primary key. They are dropped once the
+transaction that changed the row commits (see ``library.signals`` and the
+inventory helpers on ``Book``). A short-lived lock makes sure a burst of
+misses on the same key rebuilds it once instead of stampeding the database.
+
+A rebuild reads the row and then caches it, and an invalidation can commit
+in between. So every invalidation also stores a new random token for the
+key, and an entry is written with the token read before the row was, and
+only while that token is still the current one. An entry whose token is no
+longer current counts as a miss, so a payload built from a row read before
+a change is never served.
+"""
+import asyncio
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from utils.conditional import make_etag
+from utils.instrumentation import record_cache
+from utils.renderers import JSONFragment, dumps
+
+# Bumped whenever the shape of an entry changes, so a deploy never reads
+# entries written by the previous code (v3: (token, payload) pairs)
+KEY_VERSION = 3
+
+LOCK_TIMEOUT = 5
+LOCK_POLL_INTERVAL = 0.02
+LOCK_WAIT = 1.0
+
+
+def cache_key(model, pk):
+    return f'library:v{KEY_VERSION}:{model._meta.label_lower}:{pk}'
+
+
+def token_key(key):
+    return f'{key}:token'
+
+
+def _cached(values, key):
+    entry = values.get(key)
+    token = values.get(token_key(key))
+    payload = entry[1] if entry is not None and entry[0] == token else None
+    return payload, token
+
+
+def normalize_pk(model, pk):
+    """Return ``pk`` in its canonical form, or None if it is not a valid key."""
+    try:
+        return model._meta.pk.to_python(pk)
+    except ValidationError:
+        return None
+
+
+def detail_entry(serializer_class, instance):
+    """
+    Detail cache entry of ``instance``: its serialized data, also kept
+    encoded as JSON, and validators.
+    """
+    timestamps = [stamp for stamp in serializer_class.get_timestamps(instance) if stamp]
+    data = dict(serializer_class(instance).data)
+    return {
+        'data': JSONFragment(dumps(data), data),
+        'version': make_etag(instance.pk, *timestamps),
+        'last_modified': max(timestamps),
+    }
+
+
+def entry_data(request, entry):
+    """The response data of ``entry``: its JSON when the renderer splices it in as is."""
+    if getattr(request.accepted_renderer, 'splices_fragments', False):
+        return entry['data']
+    return entry['data'].data
+
+
+def get_or_build(model, pk, build):
+    """
+    Return the cached payload for ``model``/``pk``, building it on a miss.
+
+    ``build`` returns the payload, or None when the row does not exist (a
+    miss is not cached). While one caller rebuilds a key, the others wait
+    for its result for up to ``LOCK_WAIT`` seconds before building it
+    themselves.
+    """
+    key = cache_key(model, pk)
+    payload, token = _cached(cache.get_many([key, token_key(key)]), key)
+    record_cache(payload is not None)
+    if payload is not None:
+        return payload
+
+    lock_key = f'{key}:lock'
+    if cache.add(lock_key, 1, LOCK_TIMEOUT):
+        try:
+            payload = build()
+            # Not once an invalidation has committed since the token was read
+            if payload is not None and cache.get(token_key(key)) == token:
+                cache.set(key, (token, payload), settings.LIBRARY_DETAIL_CACHE_TIMEOUT)
+        finally:
+            cache.delete(lock_key)
+        return payload
+
+    deadline = time.monotonic() + LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        payload, _ = _cached(cache.get_many([key, token_key(key)]), key)
+        if payload is not None:
+            return payload
+    return build()
+
+
+async def aget_or_build(model, pk, build):
+    """``get_or_build()`` for the async views; ``build`` is a coroutine function."""
+    key = cache_key(model, pk)
+    payload, token = _cached(await cache.aget_many([key, token_key(key)]), key)
+    record_cache(payload is not None)
+    if payload is not None:
+        return payload
+
+    lock_key = f'{key}:lock'
+    if await cache.aadd(lock_key, 1, LOCK_TIMEOUT):
+        try:
+            payload = await build()
+            if payload is not None and await cache.aget(token_key(key)) == token:
+                await cache.aset(key, (token, payload), settings.LIBRARY_DETAIL_CACHE_TIMEOUT)
+        finally:
+            await cache.adelete(lock_key)
+        return payload
+
+    deadline = time.monotonic() + LOCK_WAIT
+    while time.monotonic() < deadline:
+        await asyncio.sleep(LOCK_POLL_INTERVAL)
+        payload, _ = _cached(await cache.aget_many([key, token_key(key)]), key)
+        if payload is not None:
+            return payload
+    return await build()
+
+
+def invalidate(model, *pks):
+    """Drop the cached payloads of ``pks`` once the current transaction commits."""
+    keys = [cache_key(model, pk) for pk in pks]
+    if not keys:
+        return
+
+    def drop():
+        cache.delete_many(keys)
+        # Outlives any entry written with the previous token
+        cache.set_many(
+            {token_key(key): uuid.uuid4().hex for key in keys}, 2 * settings.LIBRARY_DETAIL_CACHE_TIMEOUT,
+        )
+
+    transaction.on_commit(drop)
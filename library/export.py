@@ -0,0 +1,125 @@
+"""
+Streaming export of the borrow history as CSV or NDJSON.
+
+Rows are read with ``values_list`` and ``iterator()``, so only one chunk of
+tuples is in memory at a time, and are turned into text a chunk at a time
+as well. Both the export endpoint and ``manage.py export_borrows`` consume
+the generator returned by ``export_lines``. Under ASGI the endpoint streams
+it through ``aexport_lines`` instead: Django would otherwise turn a sync
+iterator into a list in a worker thread before sending the first byte.
+"""
+import csv
+import io
+import json
+from datetime import date, datetime, time
+from uuid import UUID
+
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from library.models import Borrow
+
+EXPORT_FORMATS = ('csv', 'ndjson')
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# (column name, field path) of every exported column
+EXPORT_COLUMNS = (
+    ('id', 'id'),
+    ('user', 'user_id'),
+    ('user_username', 'user__username'),
+    ('book', 'book_id'),
+    ('book_title', 'book__title'),
+    ('borrow_date', 'borrow_date'),
+    ('due_date', 'due_date'),
+    ('return_date', 'return_date'),
+    ('returned', 'returned'),
+)
+
+
+def parse_moment(value):
+    """
+    Parse an ISO date or datetime filter value into an aware datetime.
+
+    A bare date means midnight at its start; raises ValueError if ``value``
+    is neither.
+    """
+    try:
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            moment = datetime.combine(day, time.min) if day else None
+    except ValueError:
+        # Well formed, but not a real date or time ("2026-02-30")
+        moment = None
+    if moment is None:
+        raise ValueError(f"Invalid date: '{value}'.")
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def export_queryset(date_from=None, date_to=None, user=None, book=None):
+    """Borrows to export, in (borrow_date, id) order, as value tuples."""
+    borrows = Borrow.objects.all()
+    if date_from:
+        borrows = borrows.filter(borrow_date__gte=date_from)
+    if date_to:
+        borrows = borrows.filter(borrow_date__lt=date_to)
+    if user:
+        borrows = borrows.filter(user_id=user)
+    if book:
+        borrows = borrows.filter(book_id=book)
+    return borrows.order_by('borrow_date', 'id').values_list(*(path for _, path in EXPORT_COLUMNS))
+
+
+def _format_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    return value
+
+
+def export_lines(queryset, export_format, chunk_size=2000):
+    """Yield the export as text, one chunk of rows per item."""
+    header = [name for name, _ in EXPORT_COLUMNS]
+    rows = queryset.iterator(chunk_size=chunk_size)
+
+    if export_format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(header)
+        for count, row in enumerate(rows, start=1):
+            writer.writerow([_format_value(value) for value in row])
+            if count % chunk_size == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+        return
+
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(header, map(_format_value, row)))))
+        if len(lines) >= chunk_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+async def aexport_lines(queryset, export_format, chunk_size=2000):
+    """``export_lines()`` for ASGI: each chunk is built in the request's worker thread."""
+    chunks = export_lines(queryset, export_format, chunk_size)
+    next_chunk = sync_to_async(next)
+    try:
+        while (chunk := await next_chunk(chunks, None)) is not None:
+            yield chunk
+    finally:
+        # Close the database cursor in the thread that opened it
+        await sync_to_async(chunks.close)()
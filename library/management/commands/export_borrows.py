@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from library.cache import normalize_pk
+from library.export import EXPORT_FORMATS, export_lines, export_queryset, parse_moment
+from library.models import Book
+
+
+class Command(BaseCommand):
+    help = "Stream the borrow history to a file (or stdout) as CSV or NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv')
+        parser.add_argument('--output', help='File to write to (default: stdout).')
+        parser.add_argument('--from', dest='date_from', help='Only borrows made on or after this date.')
+        parser.add_argument('--to', dest='date_to', help='Only borrows made before this date.')
+        parser.add_argument('--user', type=int, help='Only borrows of this user ID.')
+        parser.add_argument('--book', help='Only borrows of this book ID.')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        book = None
+        if options['book']:
+            book = normalize_pk(Book, options['book'])
+            if book is None:
+                raise CommandError(f"Invalid book ID: '{options['book']}'.")
+
+        try:
+            queryset = export_queryset(
+                date_from=parse_moment(options['date_from']) if options['date_from'] else None,
+                date_to=parse_moment(options['date_to']) if options['date_to'] else None,
+                user=options['user'],
+                book=book,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        chunks = export_lines(queryset, options['format'], options['chunk_size'])
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+        with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+            for chunk in chunks:
+                output.write(chunk)
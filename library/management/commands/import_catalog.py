@@ -0,0 +1,191 @@
+import csv
+import json
+import os
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from authentication.models import User
+from library.models import Author, Book, Category
+from library.search import index_rows
+from utils.audit import audit_as
+
+TEXT_COLUMNS = ('title', 'author', 'description', 'author_bio', 'category')
+
+
+def parse_copies(value, default):
+    """A copies column as an int; ``default`` when it is empty."""
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise TypeError('copies must be whole numbers')
+    return int(value)
+
+
+class Command(BaseCommand):
+    help = (
+        "Load books from a CSV or JSONL file, creating their authors and categories. "
+        "Columns: title, author, and optionally description, author_bio, category, "
+        "total_copies and available_copies."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=('csv', 'jsonl'), help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--resume', action='store_true',
+            help='Continue after the last batch recorded in the checkpoint file.',
+        )
+        parser.add_argument('--checkpoint', help='Checkpoint file (default: <path>.checkpoint).')
+        parser.add_argument('--skip-invalid', action='store_true', help='Skip invalid rows instead of stopping.')
+        parser.add_argument('--user', help='Username the new rows are attributed to.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        checkpoint = options['checkpoint'] or f'{path}.checkpoint'
+        batch_size = options['batch_size']
+
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"User '{options['user']}' not found.")
+
+        # Book ids are derived from an id of the import run and the row
+        # number. --resume carries on with the run of the checkpoint, so the
+        # rows of a batch committed but not checkpointed are recognized and
+        # skipped; any other run, even of a file of the same name, gets new ids
+        start_row = 0
+        import_id = str(uuid.uuid4())
+        if options['resume'] and os.path.exists(checkpoint):
+            with open(checkpoint) as fh:
+                state = json.load(fh)
+            start_row = state['rows']
+            # Checkpoints written before runs had an id used the file name
+            import_id = state.get('import_id') or os.path.basename(path)
+            self.stdout.write(f'Resuming after row {start_row}.')
+        namespace = uuid.uuid5(uuid.NAMESPACE_URL, f'import_catalog:{import_id}')
+        # Recorded before the first batch commits
+        self.save_checkpoint(checkpoint, start_row, import_id)
+
+        # In-memory dedup maps of the rows that already exist
+        authors = dict(Author.objects.order_by('-created_at').values_list('name', 'pk'))
+        categories = dict(Category.objects.values_list('name', 'pk'))
+
+        self.imported = self.skipped = 0
+        self.started = time.perf_counter()
+        batch = []
+        row_number = start_row
+        with open(path, newline='', encoding='utf-8') as fh, audit_as(user):
+            for row_number, raw in enumerate(self.read_rows(fh, file_format), start=1):
+                if row_number <= start_row:
+                    continue
+                built = self.build_book(raw, row_number, namespace, options['skip_invalid'])
+                if built is not None:
+                    batch.append(built)
+                if len(batch) >= batch_size:
+                    self.write_batch(batch, authors, categories)
+                    self.save_checkpoint(checkpoint, row_number, import_id)
+                    batch = []
+            if batch:
+                self.write_batch(batch, authors, categories)
+            self.save_checkpoint(checkpoint, row_number, import_id)
+
+        elapsed = time.perf_counter() - self.started
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {self.imported} books ({self.skipped} skipped) in {elapsed:.1f}s, '
+            f'{self.imported / elapsed if elapsed else 0:.0f} rows/s.'
+        ))
+
+    def read_rows(self, fh, file_format):
+        """Raw rows: dicts for CSV, lines still to be decoded for JSONL."""
+        if file_format == 'csv':
+            yield from csv.DictReader(fh)
+            return
+        for line in fh:
+            if line.strip():
+                yield line
+
+    def parse_row(self, raw):
+        """The row of ``raw`` as a dict, with every text column a string or None."""
+        row = json.loads(raw) if isinstance(raw, str) else raw
+        if not isinstance(row, dict):
+            raise TypeError('a row must be an object')
+        for column in TEXT_COLUMNS:
+            if row.get(column) is not None and not isinstance(row[column], str):
+                raise TypeError(f'{column} must be a string')
+        return row
+
+    def build_book(self, raw, row_number, namespace, skip_invalid):
+        """(book, row) for ``raw`` with the book's author/category still unresolved, or None."""
+        try:
+            row = self.parse_row(raw)
+            title = (row.get('title') or '').strip()
+            author = (row.get('author') or '').strip()
+            if not title or not author:
+                raise ValueError('title and author are required')
+            total_copies = parse_copies(row.get('total_copies'), 1)
+            available_copies = parse_copies(row.get('available_copies'), total_copies)
+            if total_copies < 0 or not 0 <= available_copies <= total_copies:
+                raise ValueError('copies out of range')
+        except (ValueError, TypeError, AttributeError) as e:
+            if not skip_invalid:
+                raise CommandError(f'Row {row_number}: {e}. Fix it and rerun with --resume.')
+            self.skipped += 1
+            return None
+        return Book(
+            id=uuid.uuid5(namespace, str(row_number)),
+            title=title[:200],
+            description=row.get('description') or None,
+            total_copies=total_copies,
+            available_copies=available_copies,
+        ), row
+
+    @transaction.atomic
+    def write_batch(self, batch, authors, categories):
+        existing = set(Book.objects.filter(pk__in=[book.pk for book, _ in batch]).values_list('pk', flat=True))
+        if existing:
+            self.skipped += len(existing)
+            batch = [(book, row) for book, row in batch if book.pk not in existing]
+
+        new_authors = {}
+        new_categories = {}
+        for book, row in batch:
+            name = row['author'].strip()[:100]
+            if name not in authors and name not in new_authors:
+                new_authors[name] = Author(name=name, bio=row.get('author_bio') or None)
+            category = (row.get('category') or '').strip()[:50]
+            if category and category not in categories and category not in new_categories:
+                new_categories[category] = Category(name=category)
+
+        if new_authors:
+            Author.objects.bulk_create(new_authors.values())
+            index_rows(Author, [(author.pk, author.name, author.bio) for author in new_authors.values()])
+            authors.update((name, author.pk) for name, author in new_authors.items())
+        if new_categories:
+            Category.objects.bulk_create(new_categories.values())
+            categories.update((name, category.pk) for name, category in new_categories.items())
+
+        books = []
+        for book, row in batch:
+            book.author_id = authors[row['author'].strip()[:100]]
+            book.category_id = categories.get((row.get('category') or '').strip()[:50])
+            books.append(book)
+        Book.objects.bulk_create(books)
+        index_rows(Book, [(book.pk, book.title, book.description) for book in books])
+
+        self.imported += len(books)
+        elapsed = time.perf_counter() - self.started
+        self.stdout.write(f'{self.imported} books, {self.imported / elapsed:.0f} rows/s')
+
+    def save_checkpoint(self, checkpoint, rows, import_id):
+        """Record that the first ``rows`` rows of run ``import_id`` are committed."""
+        tmp = f'{checkpoint}.tmp'
+        with open(tmp, 'w') as fh:
+            json.dump({'rows': rows, 'import_id': import_id}, fh)
+        os.replace(tmp, checkpoint)
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from library.models import Author, Book
+from library.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for books and authors.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        for model in (Book, Author):
+            count = rebuild_search_index(model, batch_size=options['batch_size'])
+            self.stdout.write(f'Indexed {count} {model._meta.verbose_name_plural}.')
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from authentication.models import User
+from library.models import Borrow
+
+
+class Command(BaseCommand):
+    help = "Recompute every user's active_borrow_count from the Borrow table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only report how many users have a drifted counter.',
+        )
+
+    def handle(self, *args, **options):
+        actual = Coalesce(Subquery(
+            Borrow.objects.filter(user=OuterRef('pk'), returned=False)
+            .order_by()
+            .values('user')
+            .annotate(count=Count('pk'))
+            .values('count')
+        ), 0)
+
+        checked = fixed = 0
+        last_pk = 0
+        while True:
+            # Walk users in primary key batches so a large table is never
+            # locked or scanned in one statement.
+            pks = list(
+                User.objects.filter(pk__gt=last_pk).order_by('pk')
+                .values_list('pk', flat=True)[:options['batch_size']]
+            )
+            if not pks:
+                break
+            last_pk = pks[-1]
+            checked += len(pks)
+
+            drifted = (
+                User.objects.filter(pk__in=pks)
+                .annotate(actual=actual)
+                .exclude(active_borrow_count=F('actual'))
+                .values('pk')
+            )
+            if options['dry_run']:
+                fixed += drifted.count()
+            else:
+                fixed += User.objects.filter(pk__in=drifted).update(active_borrow_count=actual)
+
+        verb = 'drifted' if options['dry_run'] else 'fixed'
+        self.stdout.write(f'Checked {checked} users, {fixed} {verb}.')
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from library.stats import rollup_daily_stats
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily borrow/return statistics of the last N days from the Borrow table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        rows = rollup_daily_stats(options['days'], batch_size=options['batch_size'])
+        self.stdout.write(f"Rolled up {rows} book days over the last {options['days']} days.")
@@ -0,0 +1,62 @@
+from django.db import migrations
+
+# (model, FTS table, key column, searchable fields); must match library.search.
+SEARCH_TABLES = [
+    ('Book', 'library_book_fts', 'book_id', ('title', 'description')),
+    ('Author', 'library_author_fts', 'author_id', ('name', 'bio')),
+]
+
+ROWID_MASK = (1 << 63) - 1
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for model_name, table, key, fields in SEARCH_TABLES:
+            schema_editor.execute(
+                f"CREATE VIRTUAL TABLE {table} USING fts5("
+                f"{key} UNINDEXED, {', '.join(fields)}, "
+                f"tokenize = 'unicode61 remove_diacritics 2')"
+            )
+            model = apps.get_model('library', model_name)
+            rows = [
+                (pk.int & ROWID_MASK, pk.hex, *values)
+                for pk, *values in model.objects.values_list('pk', *fields).iterator()
+            ]
+            with schema_editor.connection.cursor() as cursor:
+                cursor.executemany(
+                    f"INSERT INTO {table} (rowid, {key}, {', '.join(fields)}) "
+                    f"VALUES (%s, %s, {', '.join(['%s'] * len(fields))})",
+                    rows,
+                )
+    elif vendor == 'postgresql':
+        from django.contrib.postgres.indexes import GinIndex
+        from django.contrib.postgres.search import SearchVector
+
+        for model_name, table, key, fields in SEARCH_TABLES:
+            first, *rest = fields
+            vector = SearchVector(first, weight='A', config='english')
+            for field in rest:
+                vector = vector + SearchVector(field, weight='B', config='english')
+            model = apps.get_model('library', model_name)
+            schema_editor.add_index(model, GinIndex(vector, name=f'{table}_gin'))
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for model_name, table, key, fields in SEARCH_TABLES:
+        if vendor == 'sqlite':
+            schema_editor.execute(f'DROP TABLE IF EXISTS {table}')
+        elif vendor == 'postgresql':
+            schema_editor.execute(f'DROP INDEX IF EXISTS {table}_gin')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0003_borrow_book_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='borrow',
+            name='due_notification_sent_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:03
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0004_borrow_due_notification_sent_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='borrow',
+            name='overdue',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='borrow',
+            name='projected_penalty',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='OverdueSnapshot',
+            fields=[
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created At')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Last Modified At')),
+                ('id', models.UUIDField(db_index=True, default=uuid.uuid4, editable=False, primary_key=True, serialize=False, unique=True)),
+                ('date', models.DateField(unique=True)),
+                ('overdue_borrows', models.PositiveIntegerField(default=0)),
+                ('overdue_users', models.PositiveIntegerField(default=0)),
+                ('projected_penalty_total', models.PositiveIntegerField(default=0)),
+                ('max_days_overdue', models.PositiveIntegerField(default=0)),
+                ('created_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='%(class)s_created_by', to=settings.AUTH_USER_MODEL, verbose_name='Created By')),
+                ('updated_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='%(class)s_updated_by', to=settings.AUTH_USER_MODEL, verbose_name='Last Modified By')),
+            ],
+            options={
+                'ordering': ['-date'],
+            },
+        ),
+    ]
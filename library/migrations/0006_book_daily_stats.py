@@ -0,0 +1,59 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:19
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0005_overdue_sweep'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookDailyStats',
+            fields=[
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created At')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Last Modified At')),
+                ('id', models.UUIDField(db_index=True, default=uuid.uuid4, editable=False, primary_key=True, serialize=False, unique=True)),
+                ('date', models.DateField()),
+                ('borrows', models.PositiveIntegerField(default=0)),
+                ('returns', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Book daily stats',
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='borrow',
+            index=models.Index(fields=['return_date'], name='borrow_return_date_idx'),
+        ),
+        migrations.AddField(
+            model_name='bookdailystats',
+            name='book',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='library.book'),
+        ),
+        migrations.AddField(
+            model_name='bookdailystats',
+            name='created_by',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='%(class)s_created_by', to=settings.AUTH_USER_MODEL, verbose_name='Created By'),
+        ),
+        migrations.AddField(
+            model_name='bookdailystats',
+            name='updated_by',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='%(class)s_updated_by', to=settings.AUTH_USER_MODEL, verbose_name='Last Modified By'),
+        ),
+        migrations.AddIndex(
+            model_name='bookdailystats',
+            index=models.Index(fields=['date', 'book'], name='book_daily_stats_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='bookdailystats',
+            constraint=models.UniqueConstraint(fields=('book', 'date'), name='book_daily_stats_unique'),
+        ),
+    ]
@@ -1,8 +1,21 @@
-from django.db import models
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Least
 from authentication.models import User
 from django.utils import timezone
 from datetime import timedelta
 from utils.mixins import BaseModel
+from library import availability, cache
+
+# Maximum number of books a user may have borrowed at the same time.
+MAX_ACTIVE_BORROWS = 3
+
+# Maximum number of items in one batch borrow or return request.
+MAX_BATCH_ITEMS = 100
+
+# Maximum number of open reservations a user may have at the same time.
+MAX_ACTIVE_RESERVATIONS = 5
 
 # Create your models here.
 class Author(BaseModel):
@@ -43,11 +56,64 @@ class Book(BaseModel):
     
     class Meta:
         ordering = ['title']
+        indexes = [
+            # Keyset pagination of the catalog by (title, id)
+            models.Index(fields=['title', 'id'], name='book_title_id_idx'),
+        ]
     
     def is_available(self):
         """Check if the book has available copies."""
         return self.available_copies > 0
 
+    @classmethod
+    def checkout_copy(cls, book_id):
+        """
+        Take one copy of a book off the shelf.
+
+        Runs as a single conditional UPDATE so concurrent borrows of the last
+        copy cannot oversell it. Returns False when no copy was available.
+        """
+        updated = cls.objects.filter(pk=book_id, available_copies__gt=0).update(
+            available_copies=F('available_copies') - 1,
+            updated_at=timezone.now(),
+        )
+        if updated:
+            cache.invalidate(cls, book_id)
+            availability.changed(book_id)
+        return updated == 1
+
+    @classmethod
+    def return_copy(cls, book_id, copies=1):
+        """Put copies of a book back on the shelf, never above total_copies."""
+        updated = cls.objects.filter(pk=book_id, available_copies__lt=F('total_copies')).update(
+            available_copies=Least(F('available_copies') + copies, F('total_copies')),
+            updated_at=timezone.now(),
+        )
+        if updated:
+            cache.invalidate(cls, book_id)
+            availability.changed(book_id)
+        return updated == 1
+
+
+    @classmethod
+    def set_total_copies(cls, book_id, total_copies):
+        """
+        Change the number of copies of a book, moving available_copies by
+        the same amount.
+
+        Runs as a single conditional UPDATE against the current counts, so a
+        checkout or return committed meanwhile is kept. Returns False when
+        more copies are on loan than ``total_copies``.
+        """
+        updated = cls.objects.filter(pk=book_id, available_copies__gte=F('total_copies') - total_copies).update(
+            available_copies=F('available_copies') + total_copies - F('total_copies'),
+            total_copies=total_copies,
+            updated_at=timezone.now(),
+        )
+        if updated:
+            cache.invalidate(cls, book_id)
+            availability.changed(book_id)
+        return updated == 1
 
 class Borrow(BaseModel):
     """Model to store borrowing records."""
@@ -57,6 +123,11 @@ class Borrow(BaseModel):
     due_date = models.DateTimeField()
     return_date = models.DateTimeField(null=True, blank=True)
     returned = models.BooleanField(default=False)
+    # Set when the due-date reminder is claimed, so it is sent only once
+    due_notification_sent_at = models.DateTimeField(null=True, blank=True)
+    # Maintained by the periodic overdue sweep for open borrows
+    overdue = models.BooleanField(default=False)
+    projected_penalty = models.PositiveIntegerField(default=0)
     
     def __str__(self):
         return f"{self.user.username} borrowed {self.book.title}"
@@ -86,4 +157,203 @@ class Borrow(BaseModel):
         return max(0, days_late)  # 1 point per day late
     
     class Meta:
-        ordering = ['-borrow_date']
\ No newline at end of file
+        ordering = ['-borrow_date']
+        indexes = [
+            # Keyset pages of (borrow_date, id), scanned backwards for the
+            # default newest-first order: per user, per user and returned
+            # flag, per book, and across every borrow for admins
+            models.Index(fields=['user', 'borrow_date', 'id'], name='borrow_user_date_idx'),
+            models.Index(fields=['user', 'returned', 'borrow_date', 'id'], name='borrow_user_returned_idx'),
+            models.Index(fields=['book', 'borrow_date', 'id'], name='borrow_book_date_idx'),
+            models.Index(fields=['borrow_date', 'id'], name='borrow_date_id_idx'),
+            # Due-date reminders and overdue sweeps only look at open borrows
+            models.Index(
+                fields=['due_date'],
+                condition=models.Q(returned=False),
+                name='borrow_open_due_idx',
+            ),
+            # Daily statistics rollup of recent returns
+            models.Index(fields=['return_date'], name='borrow_return_date_idx'),
+        ]
+
+
+class Reservation(BaseModel):
+    """A user's place in the hold queue of a book that had no copy left."""
+    WAITING = 'waiting'
+    READY = 'ready'
+    FULFILLED = 'fulfilled'
+    CANCELLED = 'cancelled'
+    EXPIRED = 'expired'
+    STATUS_CHOICES = [
+        (WAITING, 'Waiting'),
+        (READY, 'Ready for pickup'),
+        (FULFILLED, 'Fulfilled'),
+        (CANCELLED, 'Cancelled'),
+        (EXPIRED, 'Expired'),
+    ]
+    # A user holds at most one open reservation per book
+    OPEN = (WAITING, READY)
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reservations')
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='reservations')
+    # Ticket number in the book's queue; the next in line is the lowest waiting one
+    position = models.PositiveBigIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=WAITING)
+    # Set when a returned copy is held for the user, who may borrow it until expires_at
+    ready_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+    # Set when the pickup notice is claimed, so it is sent only once
+    notified_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.user_id} #{self.position} for {self.book_id} ({self.status})"
+
+    class Meta:
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'position'], name='reservation_book_position_unique'),
+            models.UniqueConstraint(
+                fields=['user', 'book'],
+                condition=Q(status__in=['waiting', 'ready']),
+                name='reservation_user_book_open_unique',
+            ),
+        ]
+        indexes = [
+            # Head of a book's queue: only waiting holds, so the next in line
+            # is the first entry whatever the queue's history
+            models.Index(
+                fields=['book', 'position'],
+                condition=Q(status='waiting'),
+                name='reservation_waiting_idx',
+            ),
+            # A user's reservations, newest first
+            models.Index(fields=['user', 'created_at', 'id'], name='reservation_user_created_idx'),
+            # Pickup notices to send and held copies to expire
+            models.Index(
+                fields=['ready_at', 'id'],
+                condition=Q(status='ready', notified_at__isnull=True),
+                name='reservation_unnotified_idx',
+            ),
+            models.Index(
+                fields=['expires_at'],
+                condition=Q(status='ready'),
+                name='reservation_ready_expiry_idx',
+            ),
+        ]
+
+    @classmethod
+    def enqueue(cls, user, book_id):
+        """
+        Add a reservation for ``user`` at the end of the book's queue.
+
+        Its position is one past the book's last ticket, read backwards from
+        the (book, position) index. A concurrent reservation that took the
+        same ticket makes the insert fail the unique constraint, and it is
+        retried with the next one. IntegrityError means the user already
+        has an open reservation for the book.
+        """
+        for attempt in range(3):
+            last = (
+                cls.objects.filter(book_id=book_id).order_by('-position')
+                .values_list('position', flat=True).first()
+            )
+            try:
+                with transaction.atomic():
+                    return cls.objects.create(user=user, book_id=book_id, position=(last or 0) + 1)
+            except IntegrityError:
+                if attempt == 2 or cls.objects.filter(user=user, book_id=book_id, status__in=cls.OPEN).exists():
+                    raise
+
+    @classmethod
+    def hold_copies(cls, book_id, copies=1, now=None):
+        """
+        Hold up to ``copies`` returned copies of a book for the first users
+        waiting in its queue, in FIFO order, and return their reservation ids.
+
+        The head of the queue is read from the partial index on waiting
+        (book, position), so this costs the same with ten or ten thousand
+        holds on the title. Call it in the transaction returning the copies.
+        """
+        now = now or timezone.now()
+        held = []
+        while len(held) < copies:
+            ids = list(
+                cls.objects.filter(book_id=book_id, status=cls.WAITING).order_by('position')
+                .values_list('pk', flat=True)[:copies - len(held)]
+            )
+            if not ids:
+                break
+            updated = cls.objects.filter(pk__in=ids, status=cls.WAITING).update(
+                status=cls.READY,
+                ready_at=now,
+                expires_at=now + timedelta(hours=settings.RESERVATION_HOLD_HOURS),
+                updated_at=now,
+            )
+            if updated != len(ids):
+                # Some were cancelled in the meantime; keep the ones this call readied
+                ids = cls.objects.filter(pk__in=ids, status=cls.READY, ready_at=now).values_list('pk', flat=True)
+            held.extend(ids)
+        return held
+
+    @classmethod
+    def release_copies(cls, book_id, copies=1, now=None):
+        """Hold copies for the next users in line and put the rest back on the shelf."""
+        held = cls.hold_copies(book_id, copies, now)
+        if len(held) < copies:
+            Book.return_copy(book_id, copies - len(held))
+        return held
+
+    @classmethod
+    def fulfil(cls, user_id, book_ids, now=None):
+        """
+        Mark the user's ready reservations for ``book_ids`` fulfilled and
+        return the ids of those books, whose held copies the user may borrow.
+        Holds past their pickup window no longer count, even before
+        ``expire_reservations`` passes their copies on.
+        """
+        now = now or timezone.now()
+        ready = cls.objects.filter(
+            user_id=user_id, book_id__in=book_ids, status=cls.READY, expires_at__gte=now,
+        )
+        if not ready.update(status=cls.FULFILLED, updated_at=now):
+            return set()
+        return set(
+            cls.objects.filter(user_id=user_id, book_id__in=book_ids, status=cls.FULFILLED, updated_at=now)
+            .values_list('book_id', flat=True)
+        )
+
+class OverdueSnapshot(BaseModel):
+    """Daily totals of the overdue sweep, so reports do not scan Borrow."""
+    date = models.DateField(unique=True)
+    overdue_borrows = models.PositiveIntegerField(default=0)
+    overdue_users = models.PositiveIntegerField(default=0)
+    projected_penalty_total = models.PositiveIntegerField(default=0)
+    max_days_overdue = models.PositiveIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.date}: {self.overdue_borrows} overdue borrows"
+    
+    class Meta:
+        ordering = ['-date']
+
+
+class BookDailyStats(BaseModel):
+    """Borrows and returns of a book per day, rolled up from Borrow."""
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='daily_stats')
+    date = models.DateField()
+    borrows = models.PositiveIntegerField(default=0)
+    returns = models.PositiveIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.book_id} on {self.date}: {self.borrows} borrows, {self.returns} returns"
+    
+    class Meta:
+        verbose_name_plural = "Book daily stats"
+        ordering = ['-date']
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'date'], name='book_daily_stats_unique'),
+        ]
+        indexes = [
+            # Statistics endpoints aggregate a range of days
+            models.Index(fields=['date', 'book'], name='book_daily_stats_date_idx'),
+        ]
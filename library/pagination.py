@@ -0,0 +1,26 @@
+from utils.pagination import KeysetPagination
+
+
+class BookPagination(KeysetPagination):
+    ordering = 'title'
+    ordering_fields = ('title', 'created_at')
+
+
+class AuthorPagination(KeysetPagination):
+    ordering = 'name'
+    ordering_fields = ('name', 'created_at')
+
+
+class CategoryPagination(KeysetPagination):
+    ordering = 'name'
+    ordering_fields = ('name', 'created_at')
+
+
+class BorrowPagination(KeysetPagination):
+    ordering = '-borrow_date'
+    ordering_fields = ('borrow_date', 'due_date', 'created_at')
+
+
+class ReservationPagination(KeysetPagination):
+    ordering = '-created_at'
+    ordering_fields = ('created_at',)
@@ -0,0 +1,189 @@
+"""
+Full-text search for the catalog.
+
+On SQLite every searchable model gets an FTS5 table (``<db_table>_fts``)
+that is kept in sync from the post_save/post_delete signals and ranked with
+bm25. On PostgreSQL the search runs against a GIN-indexed tsvector
+expression, so no side table has to be maintained. Any other backend falls
+back to ``icontains`` filtering.
+
+Every search annotates ``search_rank`` (higher is better), which the list
+views use as the default ordering of search results.
+"""
+import re
+
+from django.db import connections
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from library.models import Author, Book
+
+# Searchable text fields per model; the first field weighs the most.
+SEARCH_FIELDS = {
+    Book: ('title', 'description'),
+    Author: ('name', 'bio'),
+}
+
+# Text search configuration for the PostgreSQL tsvector expressions.
+SEARCH_CONFIG = 'english'
+
+# bm25 column weights: the key column is not searchable, then the fields.
+FTS_WEIGHTS = (0.0, 5.0, 1.0)
+
+MAX_SEARCH_TERMS = 10
+
+_ROWID_MASK = (1 << 63) - 1
+
+
+def search(queryset, text):
+    """Filter ``queryset`` down to rows matching ``text`` and rank them."""
+    terms = re.findall(r'\w+', text)[:MAX_SEARCH_TERMS]
+    if not terms:
+        return queryset.none().annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+    vendor = connections[queryset.db].vendor
+    if vendor == 'sqlite':
+        return _sqlite_search(queryset, terms)
+    if vendor == 'postgresql':
+        return _postgres_search(queryset, terms)
+    return _fallback_search(queryset, terms)
+
+
+def fts_table(model):
+    return f'{model._meta.db_table}_fts'
+
+
+def fts_key_column(model):
+    return f'{model._meta.model_name}_id'
+
+
+def fts_rowid(pk):
+    """Stable 63-bit FTS rowid derived from a UUID primary key."""
+    return pk.int & _ROWID_MASK
+
+
+def _sqlite_search(queryset, terms):
+    model = queryset.model
+    table = fts_table(model)
+    # Every term is matched as a prefix: "tolk" finds "Tolkien".
+    match = ' '.join(f'"{term}"*' for term in terms)
+    weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+    return queryset.extra(
+        tables=[table],
+        where=[
+            f'{table}.{fts_key_column(model)} = {model._meta.db_table}.{model._meta.pk.column}',
+            f'{table} MATCH %s',
+        ],
+        params=[match],
+    ).annotate(
+        search_rank=RawSQL(f'-bm25({table}, {weights})', [], output_field=FloatField()),
+    )
+
+
+def search_vector(model):
+    """The tsvector expression the PostgreSQL GIN index is built on."""
+    from django.contrib.postgres.search import SearchVector
+
+    first, *rest = SEARCH_FIELDS[model]
+    vector = SearchVector(first, weight='A', config=SEARCH_CONFIG)
+    for field in rest:
+        vector = vector + SearchVector(field, weight='B', config=SEARCH_CONFIG)
+    return vector
+
+
+def _postgres_search(queryset, terms):
+    from django.contrib.postgres.search import SearchQuery, SearchRank
+
+    query = SearchQuery(
+        ' & '.join(f'{term}:*' for term in terms),
+        search_type='raw',
+        config=SEARCH_CONFIG,
+    )
+    vector = search_vector(queryset.model)
+    return queryset.alias(search_vector=vector).filter(search_vector=query).annotate(
+        search_rank=SearchRank(vector, query),
+    )
+
+
+def _fallback_search(queryset, terms):
+    condition = Q()
+    for term in terms:
+        term_condition = Q()
+        for field in SEARCH_FIELDS[queryset.model]:
+            term_condition |= Q(**{f'{field}__icontains': term})
+        condition &= term_condition
+    return queryset.filter(condition).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+def update_search_index(instance):
+    """Insert or refresh the FTS row of ``instance``."""
+    connection = connections[instance._state.db or 'default']
+    if connection.vendor != 'sqlite':
+        return
+
+    model = type(instance)
+    fields = SEARCH_FIELDS[model]
+    table = fts_table(model)
+    rowid = fts_rowid(instance.pk)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE rowid = %s', [rowid])
+        cursor.execute(
+            f'INSERT INTO {table} (rowid, {fts_key_column(model)}, {", ".join(fields)}) '
+            f'VALUES (%s, %s, {", ".join(["%s"] * len(fields))})',
+            [rowid, instance.pk.hex, *(getattr(instance, field) for field in fields)],
+        )
+
+
+def remove_from_search_index(instance):
+    connection = connections[instance._state.db or 'default']
+    if connection.vendor != 'sqlite':
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {fts_table(type(instance))} WHERE rowid = %s',
+            [fts_rowid(instance.pk)],
+        )
+
+
+def index_rows(model, rows, using='default'):
+    """
+    Add ``(pk, field values...)`` rows to the FTS table in one batch.
+
+    Used by bulk paths that bypass the model signals; the rows must not be
+    indexed yet.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+
+    fields = SEARCH_FIELDS[model]
+    sql = (
+        f'INSERT INTO {fts_table(model)} (rowid, {fts_key_column(model)}, {", ".join(fields)}) '
+        f'VALUES (%s, %s, {", ".join(["%s"] * len(fields))})'
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [(fts_rowid(pk), pk.hex, *values) for pk, *values in rows])
+
+
+def rebuild_search_index(model, batch_size=5000, using='default'):
+    """Drop and rebuild the FTS rows of ``model``; returns the row count."""
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return 0
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {fts_table(model)}')
+
+    fields = SEARCH_FIELDS[model]
+    rows = model.objects.using(using).order_by().values_list('pk', *fields)
+    batch = []
+    count = 0
+    for row in rows.iterator(chunk_size=batch_size):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            index_rows(model, batch, using)
+            count += len(batch)
+            batch = []
+    index_rows(model, batch, using)
+    return count + len(batch)
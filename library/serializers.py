@@ -1,26 +1,182 @@
-from rest_framework import serializers
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+from django.conf import settings
 from django.utils import timezone
 from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
 from authentication.models import User
-from library.models import Author, Category, Book, Borrow
+from library.models import Author, Category, Book, Borrow, Reservation, MAX_ACTIVE_BORROWS, MAX_BATCH_ITEMS
+from utils.instrumentation import InstrumentedSerializerMixin, serializer_timer
 
 
-class AuthorSerializer(serializers.ModelSerializer):
+class OptimizedQuerysetMixin:
+    """
+    Lets a serializer declare how a list queryset must be shaped for it.
+
+    Views pass their queryset through ``get_optimized_queryset()`` before
+    serializing, so every related field the serializer reads is joined in
+    the same query instead of being loaded lazily per row.
+
+    ``timestamp_fields`` lists the ``updated_at`` of the row and of every
+    related row embedded in the output; they are what the ETag and
+    Last-Modified validators are computed from.
+
+    List views can also fetch ``values()`` rows with ``get_row_queryset()``
+    and turn them into the same representation with ``represent_rows()``,
+    which skips building model instances and DRF's per-field dispatch.
+    ``row_methods`` tells it how to compute the ``SerializerMethodField``s.
+    """
+    select_related_fields = ()
+    only_fields = ()
+    timestamp_fields = ('updated_at',)
+    # SerializerMethodField name -> (values() paths it reads, name of a
+    # classmethod computing it from a row and the request's current time)
+    row_methods = {}
+
+    @classmethod
+    def get_optimized_queryset(cls, queryset):
+        if cls.select_related_fields:
+            queryset = queryset.select_related(*cls.select_related_fields)
+        if cls.only_fields:
+            queryset = queryset.only(*cls.only_fields)
+        return queryset
+
+    @classmethod
+    def get_timestamps(cls, instance):
+        if isinstance(instance, dict):
+            return [instance[path.replace('.', '__')] for path in cls.timestamp_fields]
+        timestamps = []
+        for path in cls.timestamp_fields:
+            value = instance
+            for attr in path.split('.'):
+                value = getattr(value, attr)
+                if value is None:
+                    break
+            timestamps.append(value)
+        return timestamps
+
+    @classmethod
+    def get_row_plan(cls):
+        # Built once per class, on first use
+        plan = cls.__dict__.get('_row_plan')
+        if plan is None:
+            plan = cls._row_plan = RowPlan(cls)
+        return plan
+
+    @classmethod
+    def get_row_queryset(cls, queryset, *extra):
+        """``queryset`` as ``values()`` dicts of what ``represent_rows()`` reads, plus ``extra``."""
+        return queryset.values(*dict.fromkeys((*cls.get_row_plan().paths, *extra)))
+
+    @classmethod
+    def represent_rows(cls, rows, now=None):
+        """
+        ``cls(instances, many=True).data`` for the ``values()`` rows of those
+        instances. ``now`` is the one current time the row methods use.
+        """
+        with serializer_timer():
+            return cls.get_row_plan().represent(rows, now or timezone.now())
+
+
+class RowPlan:
+    """
+    How a serializer's output is read from a ``values()`` row: for every
+    readable field, in output order, the row key and how its value is
+    converted.
+
+    As in DRF, a related pk is output as is, None stays None, and a field
+    sourced through a relation that is null is left out. Fields use their
+    own ``to_representation``, except ISO 8601 datetimes, converted the
+    same way with the current timezone looked up once per call instead of
+    once per value.
+    """
+
+    def __init__(self, serializer_class):
+        self.entries = []
+        paths = ['id']
+        for name, field in serializer_class().fields.items():
+            if field.write_only:
+                continue
+            if isinstance(field, serializers.SerializerMethodField):
+                reads, method = serializer_class.row_methods[name]
+                paths.extend(reads)
+                self.entries.append((name, None, getattr(serializer_class, method), ()))
+                continue
+            attrs = field.source_attrs
+            key = '__'.join(attrs)
+            relations = tuple('__'.join(attrs[:depth]) for depth in range(1, len(attrs)))
+            paths.extend((*relations, key))
+            self.entries.append((name, key, field, relations))
+        paths.extend(path.replace('.', '__') for path in serializer_class.timestamp_fields)
+        self.paths = tuple(dict.fromkeys(paths))
+
+    def represent(self, rows, now):
+        field_timezone = timezone.get_current_timezone() if settings.USE_TZ else None
+        entries = [
+            (name, key, self.converter(convert, field_timezone), relations, key is None)
+            for name, key, convert, relations in self.entries
+        ]
+        output = []
+        for row in rows:
+            data = {}
+            for name, key, convert, relations, computed in entries:
+                if computed:
+                    data[name] = convert(row, now)
+                    continue
+                if relations and any(row[relation] is None for relation in relations):
+                    continue
+                value = row[key]
+                data[name] = value if value is None or convert is None else convert(value)
+            output.append(data)
+        return output
+
+    @staticmethod
+    def converter(field, field_timezone):
+        if not isinstance(field, serializers.Field):
+            # A row method
+            return field
+        if isinstance(field, serializers.RelatedField):
+            return None
+        if (
+            isinstance(field, serializers.DateTimeField)
+            and field_timezone is not None
+            and not hasattr(field, 'timezone')
+            and str(getattr(field, 'format', api_settings.DATETIME_FORMAT)).lower() == ISO_8601
+        ):
+            def isoformat(value):
+                if timezone.is_naive(value):
+                    return field.to_representation(value)
+                value = value.astimezone(field_timezone).isoformat()
+                return value[:-6] + 'Z' if value.endswith('+00:00') else value
+            return isoformat
+        return field.to_representation
+
+
+class AuthorSerializer(InstrumentedSerializerMixin, OptimizedQuerysetMixin, serializers.ModelSerializer):
     class Meta:
         model = Author
         fields = ['id', 'name', 'bio', 'created_at', 'updated_at']
         read_only_fields = ['created_at', 'updated_at']
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(InstrumentedSerializerMixin, OptimizedQuerysetMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ['id', 'name', 'created_at', 'updated_at']
         read_only_fields = ['created_at', 'updated_at']
 
-class BookSerializer(serializers.ModelSerializer):
+class BookSerializer(InstrumentedSerializerMixin, OptimizedQuerysetMixin, serializers.ModelSerializer):
     author_name = serializers.CharField(source='author.name', read_only=True)
     category_name = serializers.CharField(source='category.name', read_only=True)
-    
+
+    select_related_fields = ('author', 'category')
+    only_fields = (
+        'id', 'title', 'description', 'author', 'author__name', 'author__updated_at',
+        'category', 'category__name', 'category__updated_at',
+        'total_copies', 'available_copies', 'created_at', 'updated_at',
+    )
+    timestamp_fields = ('updated_at', 'author.updated_at', 'category.updated_at')
+
     class Meta:
         model = Book
         fields = [
@@ -30,27 +186,50 @@ class BookSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['created_at', 'updated_at', 'available_copies']
     
-    def validate(self, data):
-        # Ensure available_copies doesn't exceed total_copies
-        if 'total_copies' in data and self.instance:
-            borrowed = self.instance.total_copies - self.instance.available_copies
-            if data['total_copies'] < borrowed:
-                raise serializers.ValidationError(
-                    f"Total copies cannot be less than currently borrowed books ({borrowed})"
-                )
-        return data
-    
     def create(self, validated_data):
         # Set available_copies equal to total_copies when creating a new book
         validated_data['available_copies'] = validated_data.get('total_copies', 1)
         return super().create(validated_data)
 
-class BorrowSerializer(serializers.ModelSerializer):
+    def update(self, instance, validated_data):
+        # Checkouts and returns move the copy counts with conditional updates
+        # that may commit during this request, so the counts read with the
+        # instance are never written back: total_copies is changed against
+        # the current row, and the other fields are saved on their own.
+        total_copies = validated_data.pop('total_copies', None)
+        with transaction.atomic():
+            if total_copies is not None and not Book.set_total_copies(instance.pk, total_copies):
+                current = Book.objects.only('total_copies', 'available_copies').get(pk=instance.pk)
+                borrowed = current.total_copies - current.available_copies
+                raise serializers.ValidationError({
+                    api_settings.NON_FIELD_ERRORS_KEY: [
+                        f"Total copies cannot be less than currently borrowed books ({borrowed})"
+                    ],
+                })
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+            instance.save(update_fields=[*validated_data, 'updated_at', 'updated_by'])
+        instance.refresh_from_db(fields=['total_copies', 'available_copies'])
+        return instance
+
+class BorrowSerializer(InstrumentedSerializerMixin, OptimizedQuerysetMixin, serializers.ModelSerializer):
     book_title = serializers.CharField(source='book.title', read_only=True)
     user_username = serializers.CharField(source='user.username', read_only=True)
     days_remaining = serializers.SerializerMethodField()
     is_overdue = serializers.SerializerMethodField()
-    
+
+    select_related_fields = ('user', 'book')
+    only_fields = (
+        'id', 'user', 'user__username', 'user__updated_at', 'book', 'book__title', 'book__updated_at',
+        'borrow_date', 'due_date', 'return_date', 'returned',
+        'created_at', 'updated_at',
+    )
+    timestamp_fields = ('updated_at', 'user.updated_at', 'book.updated_at')
+    row_methods = {
+        'days_remaining': (('returned', 'due_date'), 'row_days_remaining'),
+        'is_overdue': (('returned', 'return_date', 'due_date'), 'row_is_overdue'),
+    }
+
     class Meta:
         model = Borrow
         fields = [
@@ -74,6 +253,19 @@ class BorrowSerializer(serializers.ModelSerializer):
     
     def get_is_overdue(self, obj):
         return obj.is_overdue()
+
+    @classmethod
+    def row_days_remaining(cls, row, now):
+        if row['returned']:
+            return 0
+        return max(0, (row['due_date'].date() - now.date()).days)
+
+    @classmethod
+    def row_is_overdue(cls, row, now):
+        # Borrow.is_overdue() with the request's current time
+        if row['returned']:
+            return row['return_date'] > row['due_date']
+        return now > row['due_date']
     
     def validate(self, data):
         user = self.context['request'].user
@@ -83,9 +275,8 @@ class BorrowSerializer(serializers.ModelSerializer):
         if book and book.available_copies <= 0:
             raise serializers.ValidationError(f"Book '{book.title}' is not available for borrowing.")
         
-        # Check user's active borrows (max 3)
-        active_borrows = Borrow.objects.filter(user=user, returned=False).count()
-        if active_borrows >= 3:
+        # Check user's active borrows (max 3); create() enforces it atomically
+        if user.active_borrow_count >= MAX_ACTIVE_BORROWS:
             raise serializers.ValidationError(
                 "You have reached the maximum limit of 3 borrowed books. Please return a book before borrowing another."
             )
@@ -98,17 +289,63 @@ class BorrowSerializer(serializers.ModelSerializer):
         
         # Use atomic transaction to ensure consistency
         with transaction.atomic():
+            # Count the borrow against the user's limit
+            if not User.claim_borrow_slot(validated_data['user'].pk, MAX_ACTIVE_BORROWS):
+                raise serializers.ValidationError(
+                    "You have reached the maximum limit of 3 borrowed books. Please return a book before borrowing another."
+                )
+            
             # Decrease available copies
             book = validated_data['book']
-            if book.available_copies <= 0:
+            if not Book.checkout_copy(book.pk):
                 raise serializers.ValidationError("Book is not available for borrowing.")
             
-            book.available_copies -= 1
-            book.save()
-            
             # Create borrow record
             return super().create(validated_data)
 
+class ReservationSerializer(InstrumentedSerializerMixin, OptimizedQuerysetMixin, serializers.ModelSerializer):
+    book_title = serializers.CharField(source='book.title', read_only=True)
+    user_username = serializers.CharField(source='user.username', read_only=True)
+    queue_position = serializers.SerializerMethodField()
+
+    select_related_fields = ('user', 'book')
+    only_fields = (
+        'id', 'user', 'user__username', 'user__updated_at', 'book', 'book__title', 'book__updated_at',
+        'position', 'status', 'ready_at', 'expires_at', 'created_at', 'updated_at',
+    )
+    timestamp_fields = ('updated_at', 'user.updated_at', 'book.updated_at')
+
+    class Meta:
+        model = Reservation
+        fields = [
+            'id', 'user', 'user_username', 'book', 'book_title', 'status',
+            'queue_position', 'ready_at', 'expires_at', 'created_at', 'updated_at'
+        ]
+        read_only_fields = fields
+
+    @classmethod
+    def get_optimized_queryset(cls, queryset):
+        # Holds ahead of each waiting one, counted in the same query
+        ahead = (
+            Reservation.objects.filter(
+                book=OuterRef('book'), status=Reservation.WAITING, position__lt=OuterRef('position'),
+            )
+            .order_by().values('book').annotate(count=Count('pk')).values('count')
+        )
+        return super().get_optimized_queryset(queryset).annotate(holds_ahead=Coalesce(Subquery(ahead), 0))
+
+    def get_queue_position(self, obj):
+        """1 for the next in line; None once the reservation no longer waits."""
+        if obj.status != Reservation.WAITING:
+            return None
+        ahead = getattr(obj, 'holds_ahead', None)
+        if ahead is None:
+            ahead = Reservation.objects.filter(
+                book_id=obj.book_id, status=Reservation.WAITING, position__lt=obj.position,
+            ).count()
+        return ahead + 1
+
+
 class ReturnBookSerializer(serializers.Serializer):
     borrow_id = serializers.CharField()
     
@@ -131,10 +368,52 @@ class ReturnBookSerializer(serializers.Serializer):
         return value
 
 
-class PenaltyPointsSerializer(serializers.ModelSerializer):
+class BatchBorrowSerializer(serializers.Serializer):
+    books = serializers.ListField(child=serializers.UUIDField(), allow_empty=False, max_length=MAX_BATCH_ITEMS)
+    # Staff may check books out on behalf of another user
+    user = serializers.PrimaryKeyRelatedField(queryset=User.objects.all(), required=False)
+    
+    def validate_books(self, value):
+        if len(set(value)) != len(value):
+            raise serializers.ValidationError("Each book may only be listed once.")
+        return value
+    
+    def validate_user(self, value):
+        request_user = self.context['request'].user
+        if value != request_user and not request_user.is_staff:
+            raise serializers.ValidationError("You can only borrow books for yourself.")
+        return value
+
+
+class BatchReturnSerializer(serializers.Serializer):
+    borrows = serializers.ListField(child=serializers.UUIDField(), allow_empty=False, max_length=MAX_BATCH_ITEMS)
+    
+    def validate_borrows(self, value):
+        if len(set(value)) != len(value):
+            raise serializers.ValidationError("Each borrow may only be listed once.")
+        return value
+
+
+class PenaltyPointsSerializer(InstrumentedSerializerMixin, serializers.ModelSerializer):
     username = serializers.CharField(source='user.username', read_only=True)
+    projected_penalty_points = serializers.SerializerMethodField()
     
     class Meta:
         model = User
-        fields = ['id', 'username', 'penalty_points']
-        read_only_fields = ['id', 'username', 'penalty_points']
\ No newline at end of file
+        fields = ['id', 'username', 'penalty_points', 'projected_penalty_points']
+        read_only_fields = ['id', 'username', 'penalty_points', 'projected_penalty_points']
+    
+    def get_projected_penalty_points(self, obj):
+        # The async view awaits the total itself and passes it in
+        if 'projected_penalty_points' in self.context:
+            return self.context['projected_penalty_points']
+        return self.projected_penalty_queryset(obj).aggregate(total=self.projected_penalty_total())['total']
+
+    @staticmethod
+    def projected_penalty_queryset(user):
+        # Accrued so far on open overdue borrows, as of the last overdue sweep
+        return user.borrows.filter(returned=False, overdue=True)
+
+    @staticmethod
+    def projected_penalty_total():
+        return Coalesce(Sum('projected_penalty'), 0)
\ No newline at end of file
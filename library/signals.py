@@ -0,0 +1,44 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from library import availability, cache, search
+from library.models import Author, Book, Category
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=Author)
+def update_search_index(sender, instance, **kwargs):
+    """Keep the full-text index in step with the catalog."""
+    search.update_search_index(instance)
+
+
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=Author)
+def remove_from_search_index(sender, instance, **kwargs):
+    search.remove_from_search_index(instance)
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def invalidate_book_cache(sender, instance, **kwargs):
+    cache.invalidate(Book, instance.pk)
+    availability.changed(instance.pk)
+
+
+@receiver(post_save, sender=Author)
+@receiver(pre_delete, sender=Author)
+@receiver(post_save, sender=Category)
+@receiver(pre_delete, sender=Category)
+def invalidate_catalog_cache(sender, instance, **kwargs):
+    """
+    Drop the cached entry and the cached books that embed its name.
+
+    Deletes are handled before the fact: once a category is gone its books
+    have already been detached and can no longer be looked up by it.
+    """
+    cache.invalidate(sender, instance.pk)
+    if kwargs.get('created'):
+        return
+    relation = 'author' if sender is Author else 'category'
+    book_ids = Book.objects.filter(**{relation: instance.pk}).values_list('pk', flat=True)
+    cache.invalidate(Book, *book_ids)
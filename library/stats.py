@@ -0,0 +1,83 @@
+"""
+Daily borrow/return rollups behind the statistics endpoints.
+
+``rollup_daily_stats`` recomputes ``BookDailyStats`` for the last few days
+from ``Borrow``; the periodic ``rollup_borrow_stats`` task keeps recent
+days fresh and ``manage.py rollup_borrow_stats --days N`` backfills. The
+statistics endpoints only ever read the rollup, and cache their answers
+under the rollup version so a new rollup makes them stale.
+"""
+import time as clock
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from library.models import BookDailyStats, Borrow
+from utils.instrumentation import record_cache
+
+VERSION_KEY = 'library:stats:version'
+
+
+def rollup_daily_stats(days=2, batch_size=5000):
+    """
+    Rebuild the rollup rows of the last ``days`` days (today included).
+
+    Borrows and returns are counted per book and day with two GROUP BY
+    queries over the borrow_date and return_date indexes, and the rows of
+    those days are replaced in one transaction. Returns the number of rows
+    written.
+    """
+    first_day = timezone.localdate() - timedelta(days=days - 1)
+    since = timezone.make_aware(datetime.combine(first_day, time.min))
+
+    counts = defaultdict(lambda: [0, 0])
+    for column, index in (('borrow_date', 0), ('return_date', 1)):
+        grouped = (
+            Borrow.objects.filter(**{f'{column}__gte': since})
+            .annotate(day=TruncDate(column))
+            .order_by()
+            .values_list('book_id', 'day')
+            .annotate(count=Count('id'))
+        )
+        for book_id, day, count in grouped:
+            counts[book_id, day][index] = count
+
+    with transaction.atomic():
+        BookDailyStats.objects.filter(date__gte=first_day).delete()
+        BookDailyStats.objects.bulk_create(
+            (
+                BookDailyStats(book_id=book_id, date=day, borrows=borrows, returns=returns)
+                for (book_id, day), (borrows, returns) in counts.items()
+            ),
+            batch_size=batch_size,
+        )
+        transaction.on_commit(bump_version)
+    return len(counts)
+
+
+def stats_version():
+    return cache.get_or_set(VERSION_KEY, clock.time_ns, None)
+
+
+def bump_version():
+    """Make every cached statistics answer stale."""
+    cache.set(VERSION_KEY, clock.time_ns(), None)
+
+
+def cached_stats(name, params, build):
+    """Answer of statistics endpoint ``name`` for ``params``, from the cache if fresh."""
+    # The day is part of the key since the day ranges end today
+    parts = (stats_version(), name, timezone.localdate(), *params)
+    key = 'library:stats:' + ':'.join(str(part) for part in parts)
+    answer = cache.get(key)
+    record_cache(answer is not None)
+    if answer is None:
+        answer = build()
+        cache.set(key, answer, settings.STATS_CACHE_TIMEOUT)
+    return answer
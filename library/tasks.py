@@ -1,22 +1,31 @@
+import logging
+from collections import Counter, defaultdict
+from datetime import timedelta
+
 from celery import shared_task
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage, get_connection
 from django.conf import settings
-from .models import Borrow
+from django.db import transaction
+from django.db.models import Count, Min, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import Borrow, OverdueSnapshot, Reservation
+from .stats import rollup_daily_stats
 
-@shared_task
-def send_due_date_notification(borrow_id):
-    """Send email notification for a specific book due date."""
-    try:
-        borrow = Borrow.objects.get(id=borrow_id)
-        
-        if not borrow.user.email or borrow.returned:
-            return f"Skipped notification for borrow {borrow_id}"
-        
-        book_title = borrow.book.title
-        due_date = borrow.due_date.strftime('%Y-%m-%d')
-        
-        subject = f'Library Notification: Book Due Today - {book_title}'
-        message = f"""
+logger = logging.getLogger(__name__)
+
+# Columns needed to render a reminder
+NOTIFICATION_FIELDS = ('id', 'due_date', 'user__username', 'user__email', 'book__title')
+RESERVATION_NOTIFICATION_FIELDS = ('id', 'ready_at', 'expires_at', 'user__username', 'user__email', 'book__title')
+
+
+def build_due_date_message(borrow, connection=None):
+    """Render the due date reminder for a borrow."""
+    book_title = borrow.book.title
+    due_date = borrow.due_date.strftime('%Y-%m-%d')
+
+    subject = f'Library Notification: Book Due Today - {book_title}'
+    message = f"""
             Hello {borrow.user.username},
 
             This is a reminder that your borrowed book "{book_title}" is due ({due_date}).
@@ -26,18 +35,293 @@ def send_due_date_notification(borrow_id):
             Thank you,
             Library Management System
         """
-        
-        send_mail(
-            subject,
-            message,
-            settings.DEFAULT_FROM_EMAIL,
-            [borrow.user.email],
-            fail_silently=False,
-        )
-        
+    return EmailMessage(
+        subject,
+        message,
+        settings.DEFAULT_FROM_EMAIL,
+        [borrow.user.email],
+        connection=connection,
+    )
+
+
+def claim_due_notifications(borrow_ids):
+    """
+    Mark the given borrows as notified and return the ones this call claimed.
+
+    The conditional UPDATE only stamps borrows nobody has claimed yet, so
+    overlapping runs never send the same reminder twice.
+    """
+    claimed_at = timezone.now()
+    Borrow.objects.filter(pk__in=borrow_ids, due_notification_sent_at__isnull=True).update(
+        due_notification_sent_at=claimed_at,
+    )
+    return (
+        Borrow.objects.filter(pk__in=borrow_ids, due_notification_sent_at=claimed_at)
+        .select_related('user', 'book')
+        .only(*NOTIFICATION_FIELDS)
+        .order_by('due_date', 'id')
+    )
+
+
+@shared_task
+def send_due_date_notification(borrow_id):
+    """Send email notification for a specific book due date."""
+    try:
+        borrow = Borrow.objects.select_related('user', 'book').get(id=borrow_id)
+
+        if not borrow.user.email or borrow.returned:
+            return f"Skipped notification for borrow {borrow_id}"
+
+        if not claim_due_notifications([borrow.pk]).exists():
+            return f"Notification already sent for borrow {borrow_id}"
+
+        build_due_date_message(borrow).send(fail_silently=False)
+
         return f"Due date notification sent for borrow {borrow_id}"
-        
+
     except Borrow.DoesNotExist:
         return f"Borrow {borrow_id} not found"
     except Exception as e:
+        Borrow.objects.filter(pk=borrow_id).update(due_notification_sent_at=None)
         return f"Error sending notification for borrow {borrow_id}: {str(e)}"
+
+
+@shared_task
+def send_due_date_notifications(window_hours=None, chunk_size=None):
+    """
+    Remind every borrower whose book falls due within the next hours.
+
+    Runs periodically from celery beat. Open borrows in the window are read
+    a chunk at a time in (due_date, id) order, claimed with one UPDATE per
+    chunk and sent over a single mail connection. A reminder that fails to
+    send is unclaimed again so a later run retries it.
+    """
+    window_hours = window_hours or settings.DUE_NOTIFICATION_WINDOW_HOURS
+    chunk_size = chunk_size or settings.DUE_NOTIFICATION_CHUNK_SIZE
+    now = timezone.now()
+    pending = (
+        Borrow.objects.filter(
+            returned=False,
+            due_notification_sent_at__isnull=True,
+            due_date__gte=now,
+            due_date__lt=now + timedelta(hours=window_hours),
+        )
+        .exclude(user__email__isnull=True)
+        .exclude(user__email='')
+        .order_by('due_date', 'id')
+    )
+
+    sent = failed = 0
+    connection = None
+    position = None
+    try:
+        while True:
+            chunk = pending
+            if position:
+                due_date, pk = position
+                chunk = chunk.filter(Q(due_date__gt=due_date) | Q(due_date=due_date, id__gt=pk))
+            rows = list(chunk.values_list('due_date', 'id')[:chunk_size])
+            if not rows:
+                break
+            position = rows[-1]
+
+            if connection is None:
+                # Opened explicitly so every message reuses it
+                connection = get_connection()
+                connection.open()
+
+            failed_ids = []
+            for borrow in claim_due_notifications([pk for _, pk in rows]):
+                try:
+                    connection.send_messages([build_due_date_message(borrow, connection)])
+                    sent += 1
+                except Exception:
+                    logger.exception("Error sending notification for borrow %s", borrow.pk)
+                    failed_ids.append(borrow.pk)
+            if failed_ids:
+                Borrow.objects.filter(pk__in=failed_ids).update(due_notification_sent_at=None)
+                failed += len(failed_ids)
+    finally:
+        if connection is not None:
+            connection.close()
+
+    return f"Sent {sent} due date notifications ({failed} failed)"
+
+
+def build_reservation_message(reservation, connection=None):
+    """Render the pickup notice for a reservation whose copy is held."""
+    book_title = reservation.book.title
+    expires_at = reservation.expires_at.strftime('%Y-%m-%d %H:%M')
+
+    subject = f'Library Notification: Your Reserved Book Is Ready - {book_title}'
+    message = f"""
+            Hello {reservation.user.username},
+
+            A copy of "{book_title}" is being held for you.
+
+            Please borrow it before {expires_at}, after which it goes to the next reader in line.
+
+            Thank you,
+            Library Management System
+        """
+    return EmailMessage(
+        subject,
+        message,
+        settings.DEFAULT_FROM_EMAIL,
+        [reservation.user.email],
+        connection=connection,
+    )
+
+
+@shared_task
+def send_reservation_notifications(chunk_size=None):
+    """
+    Tell every user whose reserved copy is now held that it is ready.
+
+    Runs every minute from celery beat, so the copies returned in between go
+    out as one batch. Unnotified ready reservations are read a chunk at a
+    time in (ready_at, id) order, claimed with one UPDATE per chunk and sent
+    over a single mail connection, like the due date reminders.
+    """
+    chunk_size = chunk_size or settings.RESERVATION_NOTIFICATION_CHUNK_SIZE
+    pending = (
+        Reservation.objects.filter(status=Reservation.READY, notified_at__isnull=True)
+        .exclude(user__email__isnull=True)
+        .exclude(user__email='')
+        .order_by('ready_at', 'id')
+    )
+
+    sent = failed = 0
+    connection = None
+    position = None
+    try:
+        while True:
+            chunk = pending
+            if position:
+                ready_at, pk = position
+                chunk = chunk.filter(Q(ready_at__gt=ready_at) | Q(ready_at=ready_at, id__gt=pk))
+            rows = list(chunk.values_list('ready_at', 'id')[:chunk_size])
+            if not rows:
+                break
+            position = rows[-1]
+
+            # Claimed like claim_due_notifications, so overlapping runs
+            # never send the same notice twice
+            claimed_at = timezone.now()
+            ids = [pk for _, pk in rows]
+            Reservation.objects.filter(pk__in=ids, notified_at__isnull=True).update(notified_at=claimed_at)
+            claimed = (
+                Reservation.objects.filter(pk__in=ids, notified_at=claimed_at)
+                .select_related('user', 'book')
+                .only(*RESERVATION_NOTIFICATION_FIELDS)
+                .order_by('ready_at', 'id')
+            )
+
+            if connection is None:
+                # Opened explicitly so every message reuses it
+                connection = get_connection()
+                connection.open()
+
+            failed_ids = []
+            for reservation in claimed:
+                try:
+                    connection.send_messages([build_reservation_message(reservation, connection)])
+                    sent += 1
+                except Exception:
+                    logger.exception("Error sending notification for reservation %s", reservation.pk)
+                    failed_ids.append(reservation.pk)
+            if failed_ids:
+                Reservation.objects.filter(pk__in=failed_ids).update(notified_at=None)
+                failed += len(failed_ids)
+    finally:
+        if connection is not None:
+            connection.close()
+
+    return f"Sent {sent} reservation notifications ({failed} failed)"
+
+
+@shared_task
+def expire_reservations():
+    """
+    Expire ready reservations whose copy was not borrowed in time.
+
+    Each held copy goes to the next user in the book's queue, or back on the
+    shelf when nobody is waiting.
+    """
+    now = timezone.now()
+    expired = 0
+    with transaction.atomic():
+        overdue = Reservation.objects.filter(status=Reservation.READY, expires_at__lt=now)
+        rows = list(overdue.values_list('id', 'book_id'))
+        if rows:
+            # Only the ones still ready, in case they were borrowed meanwhile
+            Reservation.objects.filter(pk__in=[pk for pk, _ in rows], status=Reservation.READY).update(
+                status=Reservation.EXPIRED, updated_at=now,
+            )
+            copies = Counter(
+                Reservation.objects.filter(pk__in=[pk for pk, _ in rows], status=Reservation.EXPIRED, updated_at=now)
+                .values_list('book_id', flat=True)
+            )
+            for book_id, count in copies.items():
+                Reservation.release_copies(book_id, count, now)
+            expired = sum(copies.values())
+
+    return f"Expired {expired} reservations"
+
+
+@shared_task
+def sweep_overdue_borrows(chunk_size=None):
+    """
+    Flag overdue open borrows and project the penalty they have accrued.
+
+    Runs periodically from celery beat. Open borrows past their due date are
+    read a chunk at a time in (due_date, id) order along the partial index on
+    open due dates. Rows whose flag or projection is stale are grouped by
+    days late and each group is written with one UPDATE. The totals are then
+    aggregated into today's OverdueSnapshot.
+    """
+    chunk_size = chunk_size or settings.OVERDUE_SWEEP_CHUNK_SIZE
+    now = timezone.now()
+    overdue = Borrow.objects.filter(returned=False, due_date__lt=now).order_by('due_date', 'id')
+
+    updated = 0
+    position = None
+    while True:
+        chunk = overdue
+        if position:
+            due_date, pk = position
+            chunk = chunk.filter(Q(due_date__gt=due_date) | Q(due_date=due_date, id__gt=pk))
+        rows = list(chunk.values_list('due_date', 'id', 'overdue', 'projected_penalty')[:chunk_size])
+        if not rows:
+            break
+        position = rows[-1][:2]
+
+        # Same rule as Borrow.calculate_penalty: 1 point per full day late
+        stale = defaultdict(list)
+        for due_date, pk, flagged, projected in rows:
+            days_late = (now - due_date).days
+            if not flagged or projected != days_late:
+                stale[days_late].append(pk)
+        for days_late, ids in stale.items():
+            updated += Borrow.objects.filter(pk__in=ids, returned=False).update(
+                overdue=True, projected_penalty=days_late,
+            )
+
+    totals = Borrow.objects.filter(returned=False, due_date__lt=now).aggregate(
+        overdue_borrows=Count('id'),
+        overdue_users=Count('user', distinct=True),
+        projected_penalty_total=Coalesce(Sum('projected_penalty'), 0),
+        oldest_due_date=Min('due_date'),
+    )
+    oldest_due_date = totals.pop('oldest_due_date')
+    totals['max_days_overdue'] = (now - oldest_due_date).days if oldest_due_date else 0
+    OverdueSnapshot.objects.update_or_create(date=timezone.localdate(now), defaults=totals)
+
+    return f"Updated {updated} overdue borrows ({totals['overdue_borrows']} overdue)"
+
+
+@shared_task
+def rollup_borrow_stats(days=None):
+    """Refresh the daily borrow/return rollups of the most recent days."""
+    rows = rollup_daily_stats(days or settings.STATS_ROLLUP_DAYS)
+    return f"Rolled up {rows} book days"
@@ -1,3 +1,1912 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import datetime
+import decimal
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import CommandError, call_command
+from django.core.cache import cache, caches
+from django.core.cache.backends.redis import RedisCache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import OperationalError, connection, transaction
+from django.db.backends.signals import connection_created
+from django.db.models import F
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import path
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, force_authenticate
+from rest_framework_simplejwt.tokens import AccessToken
+
+from authentication.models import User
+from library import availability, export, tasks
+from library.cache import cache_key, get_or_build, invalidate
+from library.models import (
+    MAX_ACTIVE_RESERVATIONS, Author, Book, BookDailyStats, Borrow, Category, OverdueSnapshot, Reservation,
+)
+from library.search import rebuild_search_index, search
+from library.views import async_views, book_views, borrow_views
+from library.serializers import BookSerializer, BorrowSerializer
+from library.stats import bump_version, cached_stats, rollup_daily_stats
+from library.tasks import (
+    expire_reservations, send_due_date_notifications, send_reservation_notifications,
+    sweep_overdue_borrows,
+)
+from library.views.borrow_views import _update_rows
+from library.views.reservation_views import RESERVATION_LIMIT_MESSAGE
+from utils.audit import audit_as
+from utils.query_analysis import QueryAnalysisMiddleware, QueryRecorder, assert_max_queries, fingerprint
+from utils.renderers import FastJSONRenderer, JSONFragment, dumps
+from utils import instrumentation, query_analysis, throttling
+from utils.throttling import BurstRateThrottle, LocalCounterStore, SlidingWindowThrottleMixin, SustainedRateThrottle
+
+
+class ListQueryCountTests(TestCase):
+    """List serialization must cost the same number of queries at any size."""
+
+    sizes = (1, 100, 10000)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='reader@example.com', username='reader', password='secret')
+        cls.author = Author.objects.create(name='Author')
+        cls.category = Category.objects.create(name='Category')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_books(self, count):
+        Book.objects.all().delete()
+        Book.objects.bulk_create(
+            Book(title=f'Book {i:05d}', author=self.author, category=self.category)
+            for i in range(count)
+        )
+
+    def create_borrows(self, count):
+        self.create_books(1)
+        book = Book.objects.get()
+        now = timezone.now()
+        Borrow.objects.bulk_create(
+            Borrow(user=self.user, book=book, borrow_date=now, due_date=now)
+            for _ in range(count)
+        )
+
+    def test_book_serializer_query_count(self):
+        for size in self.sizes:
+            with self.subTest(size=size):
+                self.create_books(size)
+                queryset = BookSerializer.get_optimized_queryset(Book.objects.all())
+                with self.assertNumQueries(1):
+                    data = BookSerializer(queryset, many=True).data
+                self.assertEqual(len(data), size)
+                self.assertEqual(data[0]['author_name'], 'Author')
+                self.assertEqual(data[0]['category_name'], 'Category')
+
+    def test_borrow_serializer_query_count(self):
+        for size in self.sizes:
+            with self.subTest(size=size):
+                self.create_borrows(size)
+                queryset = BorrowSerializer.get_optimized_queryset(Borrow.objects.all())
+                with self.assertNumQueries(1):
+                    data = BorrowSerializer(queryset, many=True).data
+                self.assertEqual(len(data), size)
+                self.assertEqual(data[0]['user_username'], 'reader')
+                self.assertEqual(data[0]['book_title'], 'Book 00000')
+
+    def test_book_list_query_count(self):
+        for size in self.sizes:
+            with self.subTest(size=size):
+                self.create_books(size)
+                with self.assertNumQueries(1):
+                    response = self.client.get('/api/book/', {'page_size': 100})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['results']), min(size, 100))
+
+    def test_borrow_list_query_count(self):
+        for size in self.sizes:
+            with self.subTest(size=size):
+                self.create_borrows(size)
+                with self.assertNumQueries(1):
+                    response = self.client.get('/api/borrow/', {'page_size': 100})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['results']), min(size, 100))
+
+
+class KeysetPaginationTests(TestCase):
+    """Cursors must walk a list both ways without skipping or repeating a row."""
+
+    titles = ('A', 'A', 'A', 'B', 'B', 'C', 'C')
+
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(name='Author')
+        Book.objects.bulk_create(Book(title=title, author=author) for title in cls.titles)
+        cls.ordered = [str(pk) for pk in Book.objects.order_by('title', 'id').values_list('id', flat=True)]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def get(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def walk(self, params):
+        """Follow the next links from the first page, then the previous links back."""
+        pages = [self.get('/api/book/', params)]
+        while pages[-1]['next']:
+            pages.append(self.get(pages[-1]['next']))
+        forward = [[book['id'] for book in page['results']] for page in pages]
+
+        page, backward = pages[-1], []
+        while page['previous']:
+            page = self.get(page['previous'])
+            backward.insert(0, [book['id'] for book in page['results']])
+        return forward, backward
+
+    def test_walks_forward_and_back_over_ties(self):
+        forward, backward = self.walk({'page_size': 2})
+        self.assertEqual([len(page) for page in forward], [2, 2, 2, 1])
+        self.assertEqual(sum(forward, []), self.ordered)
+        # The same pages, back to a first page without a previous link
+        self.assertEqual(backward, forward[:-1])
+
+    def test_descending(self):
+        forward, backward = self.walk({'page_size': 3, 'ordering': '-title'})
+        self.assertEqual(
+            sum(forward, []),
+            [str(pk) for pk in Book.objects.order_by('-title', '-id').values_list('id', flat=True)],
+        )
+        self.assertEqual(backward, forward[:-1])
+
+    def test_ordering_must_be_whitelisted(self):
+        data = self.get('/api/book/', {'page_size': 100, 'ordering': 'isbn'})
+        self.assertEqual([book['id'] for book in data['results']], self.ordered)
+
+    @override_settings(API_MAX_PAGE_SIZE=3)
+    def test_page_size_is_capped(self):
+        data = self.get('/api/book/', {'page_size': 100})
+        self.assertEqual([book['id'] for book in data['results']], self.ordered[:3])
+        self.assertIsNotNone(data['next'])
+
+    def test_invalid_cursor(self):
+        tampered = base64.urlsafe_b64encode(b'{"p":["A","not-a-uuid"]}').decode()
+        for cursor in ('garbage', tampered, base64.urlsafe_b64encode(b'{"q":1}').decode()):
+            with self.subTest(cursor=cursor):
+                response = self.client.get('/api/book/', {'cursor': cursor})
+                self.assertEqual(response.status_code, 404)
+                self.assertEqual(response.data['detail'], 'Invalid cursor.')
+
+
+class RowRepresentationTests(TestCase):
+    """represent_rows() must render byte for byte what the serializer renders."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='reader@example.com', username='reader', password='secret')
+        author = Author.objects.create(name='Author', bio='Bio')
+        category = Category.objects.create(name='Category')
+        book = Book.objects.create(title='Categorized', description='Text', author=author, category=category)
+        Book.objects.create(title='Uncategorized', author=author, total_copies=3, available_copies=2)
+        now = timezone.now()
+        Borrow.objects.bulk_create([
+            # Current, overdue, returned on time and returned late
+            Borrow(user=cls.user, book=book, borrow_date=now, due_date=now + timedelta(days=14)),
+            Borrow(user=cls.user, book=book, borrow_date=now - timedelta(days=20), due_date=now - timedelta(days=6)),
+            Borrow(
+                user=cls.user, book=book, borrow_date=now - timedelta(days=10), due_date=now + timedelta(days=4),
+                return_date=now, returned=True,
+            ),
+            Borrow(
+                user=cls.user, book=book, borrow_date=now - timedelta(days=30), due_date=now - timedelta(days=16),
+                return_date=now - timedelta(days=1, microseconds=1), returned=True,
+            ),
+        ])
+
+    def assert_same_output(self, serializer_class, queryset):
+        now = timezone.now()
+        instances = serializer_class.get_optimized_queryset(queryset)
+        rows = serializer_class.get_row_queryset(queryset)
+        with self.assertNumQueries(1):
+            data = serializer_class.represent_rows(rows, now)
+        self.assertEqual(
+            JSONRenderer().render(data),
+            JSONRenderer().render(serializer_class(instances, many=True).data),
+        )
+
+    def test_books(self):
+        self.assert_same_output(BookSerializer, Book.objects.order_by('title'))
+
+    def test_borrows(self):
+        self.assert_same_output(BorrowSerializer, Borrow.objects.order_by('due_date'))
+
+    def test_list_pages_through_rows(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        titles = []
+        url = '/api/book/?page_size=1'
+        while url:
+            response = client.get(url)
+            titles.extend(book['title'] for book in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(titles, ['Categorized', 'Uncategorized'])
+        response = client.get('/api/borrow/', {'ordering': 'due_date'})
+        self.assertEqual([borrow['is_overdue'] for borrow in response.data['results']], [True, True, False, False])
+
+
+class FastJSONRendererTests(TestCase):
+    """FastJSONRenderer must write what JSONRenderer writes, with either encoder."""
+
+    data = {
+        'id': uuid.UUID('0b0f8e49-6a43-4c1c-9d38-9f6f4c2b7f10'),
+        'utc': datetime.datetime(2026, 1, 2, 3, 4, 5, 678901, tzinfo=datetime.timezone.utc),
+        'offset': datetime.datetime(2026, 1, 2, tzinfo=datetime.timezone(datetime.timedelta(hours=2))),
+        'naive': datetime.datetime(2026, 1, 2, 3, 4),
+        'date': datetime.date(2026, 1, 2),
+        'decimal': decimal.Decimal('2.50'),
+        'text': 'caf\u00e9 \u2028 "quoted" \x00',
+        'numbers': [0, -1, 1.5, 2 ** 40],
+        'nested': {'empty': [], 'none': None, 'flag': True},
+    }
+
+    def render(self, data):
+        return FastJSONRenderer().render(data)
+
+    def test_matches_json_renderer(self):
+        expected = JSONRenderer().render(self.data)
+        self.assertEqual(self.render(self.data), expected)
+        with mock.patch('utils.renderers.orjson', None):
+            self.assertEqual(self.render(self.data), expected)
+        # Beyond orjson's 64 bits
+        self.assertEqual(self.render([2 ** 70]), JSONRenderer().render([2 ** 70]))
+
+    def test_splices_fragments(self):
+        fragment = JSONFragment(dumps(self.data))
+        expected = JSONRenderer().render({'results': [self.data, self.data]})
+        self.assertEqual(self.render({'results': [fragment, fragment]}), expected)
+        with mock.patch('utils.renderers.orjson', None):
+            self.assertEqual(self.render({'results': [fragment, fragment]}), expected)
+        self.assertEqual(self.render(fragment), fragment.encoded)
+
+        # The encoded bytes are written as they are, never encoded again
+        fragment = JSONFragment(b'{"price":2.50}', {'price': 2.5})
+        self.assertEqual(self.render({'book': fragment}), b'{"book":{"price":2.50}}')
+        with mock.patch('utils.renderers.orjson', None):
+            self.assertEqual(self.render({'book': fragment}), b'{"book":{"price":2.50}}')
+
+    def test_cached_detail_is_spliced(self):
+        cache.clear()
+        author = Author.objects.create(name='Author')
+        book = Book.objects.create(title='Title', author=author)
+        expected = JSONRenderer().render(BookSerializer(book).data)
+        client = APIClient()
+        for _ in range(2):
+            response = client.get(f'/api/book/{book.pk}/')
+            self.assertEqual(response.content, expected)
+            self.assertEqual(response.data['title'], 'Title')
+
+
+class DetailCacheTests(TestCase):
+    """Detail payloads must be built once, dropped on commit and rebuilt once."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(name='Author')
+        cls.book = Book.objects.create(title='Title', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_miss_builds_and_hit_does_not(self):
+        build = mock.Mock(return_value={'title': 'Title'})
+        self.assertEqual(get_or_build(Book, self.book.pk, build), {'title': 'Title'})
+        self.assertEqual(get_or_build(Book, self.book.pk, build), {'title': 'Title'})
+        build.assert_called_once_with()
+
+        # Missing rows are not cached
+        build = mock.Mock(return_value=None)
+        self.assertIsNone(get_or_build(Book, uuid.uuid4(), build))
+        self.assertIsNone(get_or_build(Book, uuid.uuid4(), build))
+        self.assertEqual(build.call_count, 2)
+
+    def test_detail_view_reads_through(self):
+        self.client.get(f'/api/book/{self.book.pk}/')
+        with self.assertNumQueries(0):
+            response = self.client.get(f'/api/book/{self.book.pk}/')
+        self.assertEqual(response.data['title'], 'Title')
+
+    def test_book_update_invalidates_after_commit(self):
+        self.client.get(f'/api/book/{self.book.pk}/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.title = 'Renamed'
+            self.book.save()
+            # Still cached until the transaction commits
+            self.assertIsNotNone(cache.get(cache_key(Book, self.book.pk)))
+        self.assertIsNone(cache.get(cache_key(Book, self.book.pk)))
+        self.assertEqual(self.client.get(f'/api/book/{self.book.pk}/').data['title'], 'Renamed')
+
+    def test_author_rename_invalidates_embedded_books(self):
+        self.client.get(f'/api/book/{self.book.pk}/')
+        self.client.get(f'/api/authors/{self.author.pk}/')
+        self.assertIsNotNone(cache.get(cache_key(Author, self.author.pk)))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.name = 'Renamed'
+            self.author.save()
+        self.assertIsNone(cache.get(cache_key(Author, self.author.pk)))
+        self.assertEqual(self.client.get(f'/api/book/{self.book.pk}/').data['author_name'], 'Renamed')
+
+    def test_concurrent_misses_wait_for_the_builder(self):
+        key = cache_key(Book, self.book.pk)
+        # Another caller holds the lock and fills the key shortly after
+        cache.add(f'{key}:lock', 1)
+        timer = threading.Timer(0.05, cache.set, (key, (None, {'title': 'Built elsewhere'})))
+        timer.start()
+        self.addCleanup(timer.cancel)
+        build = mock.Mock(return_value={'title': 'Built here'})
+        self.assertEqual(get_or_build(Book, self.book.pk, build), {'title': 'Built elsewhere'})
+        build.assert_not_called()
+
+    @mock.patch('library.cache.LOCK_WAIT', 0.05)
+    def test_waiters_build_once_the_lock_wait_is_over(self):
+        key = cache_key(Book, self.book.pk)
+        cache.add(f'{key}:lock', 1)
+        build = mock.Mock(return_value={'title': 'Built here'})
+        self.assertEqual(get_or_build(Book, self.book.pk, build), {'title': 'Built here'})
+        build.assert_called_once_with()
+        # Only the lock holder writes the entry
+        self.assertIsNone(cache.get(key))
+
+    def test_payload_built_before_an_invalidation_is_not_cached(self):
+        def build():
+            # The change commits while the payload is being built
+            with self.captureOnCommitCallbacks(execute=True):
+                Book.objects.filter(pk=self.book.pk).update(title='Renamed')
+                invalidate(Book, self.book.pk)
+            return {'title': 'Title'}
+
+        self.assertEqual(get_or_build(Book, self.book.pk, build), {'title': 'Title'})
+        self.assertIsNone(cache.get(cache_key(Book, self.book.pk)))
+        self.assertEqual(self.client.get(f'/api/book/{self.book.pk}/').data['title'], 'Renamed')
+
+    def test_entry_written_with_a_previous_token_is_not_served(self):
+        key = cache_key(Book, self.book.pk)
+        cache.set(key, (None, {'title': 'Stale'}))
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidate(Book, self.book.pk)
+        # A late write by a reader that read the token before the change
+        cache.set(key, (None, {'title': 'Stale'}))
+        build = mock.Mock(return_value={'title': 'Title'})
+        self.assertEqual(get_or_build(Book, self.book.pk, build), {'title': 'Title'})
+        build.assert_called_once_with()
+        self.assertEqual(get_or_build(Book, self.book.pk, build), {'title': 'Title'})
+        build.assert_called_once_with()
+
+
+class BookUpdateTests(TestCase):
+    """Updates must never write back copy counts read before a checkout or return."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(email='admin@example.com', username='admin', password='secret', is_admin=True)
+        cls.book = Book.objects.create(title='Title', author=Author.objects.create(name='Author'), total_copies=3, available_copies=3)
+
+    def update(self, book, **data):
+        serializer = BookSerializer(book, data=data, partial=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        return serializer.save()
+
+    def counts(self):
+        return Book.objects.values_list('total_copies', 'available_copies').get(pk=self.book.pk)
+
+    def test_checkout_during_an_update_is_kept(self):
+        stale = Book.objects.get(pk=self.book.pk)
+        self.assertTrue(Book.checkout_copy(self.book.pk))
+        self.update(stale, title='Renamed')
+        self.assertEqual(self.counts(), (3, 2))
+        self.assertEqual(Book.objects.get(pk=self.book.pk).title, 'Renamed')
+
+    def test_total_copies_moves_available_copies(self):
+        stale = Book.objects.get(pk=self.book.pk)
+        Book.checkout_copy(self.book.pk)
+        Book.checkout_copy(self.book.pk)
+        book = self.update(stale, total_copies=5)
+        self.assertEqual(self.counts(), (5, 3))
+        self.assertEqual((book.total_copies, book.available_copies), (5, 3))
+        self.update(stale, total_copies=2)
+        self.assertEqual(self.counts(), (2, 0))
+
+    def test_total_copies_below_borrowed_is_refused(self):
+        stale = Book.objects.get(pk=self.book.pk)
+        Book.checkout_copy(self.book.pk)
+        Book.checkout_copy(self.book.pk)
+        # Checked against the current row, not the one read with the instance
+        with self.assertRaises(ValidationError):
+            self.update(stale, total_copies=1)
+
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.put(f'/api/book/{self.book.pk}/', {'total_copies': 1, 'title': 'Renamed'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.data['non_field_errors'], ['Total copies cannot be less than currently borrowed books (2)'],
+        )
+        self.assertEqual(self.counts(), (3, 1))
+        self.assertEqual(Book.objects.get(pk=self.book.pk).title, 'Title')
+
+
+class ConditionalResponseTests(TestCase):
+    """Clients holding a current copy must get a 304, and a stale one the new page."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(name='Author')
+        cls.book = Book.objects.create(title='First', author=author)
+        cls.other = Book.objects.create(title='Second', author=author)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_detail_if_none_match(self):
+        url = f'/api/book/{self.book.pk}/'
+        response = self.client.get(url)
+        etag = response.headers['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.title = 'Renamed'
+            self.book.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_detail_if_modified_since(self):
+        url = f'/api/book/{self.book.pk}/'
+        last_modified = self.client.get(url).headers['Last-Modified']
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+        Book.objects.filter(pk=self.book.pk).update(updated_at=self.book.updated_at + timedelta(seconds=5))
+        cache.clear()
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 200)
+
+    def test_list_if_none_match(self):
+        response = self.client.get('/api/book/')
+        etag = response.headers['ETag']
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/book/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # The ETag covers the pagination links as well as the rows
+        response = self.client.get('/api/book/', {'page_size': 1}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_list_changes_when_a_row_is_deleted(self):
+        response = self.client.get('/api/book/')
+        self.assertNotIn('Last-Modified', response.headers)
+        etag = response.headers['ETag']
+
+        self.other.delete()
+        response = self.client.get('/api/book/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([book['title'] for book in response.data['results']], ['First'])
+
+
+class DueDateNotificationTests(TestCase):
+    """Due date reminders must go out once each, over one connection."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(name='Author')
+        cls.book = Book.objects.create(title='Title', author=author)
+        cls.users = [
+            User.objects.create_user(email=f'reader{i}@example.com', username=f'reader{i}', password='secret')
+            for i in range(5)
+        ]
+
+    def setUp(self):
+        now = timezone.now()
+        # Three borrows share a due date, so chunks end in the middle of a tie
+        due_dates = [now + timedelta(hours=1)] * 3 + [now + timedelta(hours=2), now + timedelta(hours=3)]
+        self.borrows = [
+            Borrow.objects.create(user=user, book=self.book, borrow_date=now, due_date=due_date)
+            for user, due_date in zip(self.users, due_dates)
+        ]
+        # Not due within the window, or already returned
+        Borrow.objects.create(user=self.users[0], book=self.book, borrow_date=now, due_date=now + timedelta(days=3))
+        Borrow.objects.create(
+            user=self.users[1], book=self.book, borrow_date=now, due_date=now + timedelta(hours=1), returned=True,
+        )
+
+    def recipients(self):
+        return sorted(message.to[0] for message in mail.outbox)
+
+    def test_chunks_send_every_reminder_once(self):
+        for chunk_size in (1, 2, 3, 500):
+            with self.subTest(chunk_size=chunk_size):
+                Borrow.objects.update(due_notification_sent_at=None)
+                mail.outbox = []
+                result = send_due_date_notifications(chunk_size=chunk_size)
+                self.assertEqual(result, 'Sent 5 due date notifications (0 failed)')
+                self.assertEqual(self.recipients(), [user.email for user in self.users])
+
+    def test_runs_do_not_send_twice(self):
+        send_due_date_notifications()
+        self.assertEqual(send_due_date_notifications(), 'Sent 0 due date notifications (0 failed)')
+        self.assertEqual(len(mail.outbox), 5)
+
+    def test_overlapping_runs_skip_claimed_borrows(self):
+        claim = tasks.claim_due_notifications
+
+        def claim_after_other_run(borrow_ids):
+            # Another run read the same chunk and claimed its first borrow first
+            claim(borrow_ids[:1])
+            return claim(borrow_ids)
+
+        with mock.patch('library.tasks.claim_due_notifications', side_effect=claim_after_other_run):
+            result = send_due_date_notifications(chunk_size=2)
+        self.assertEqual(result, 'Sent 2 due date notifications (0 failed)')
+        self.assertEqual(Borrow.objects.filter(due_notification_sent_at__isnull=False).count(), 5)
+
+    def test_failed_sends_are_unclaimed(self):
+        send = EmailBackend.send_messages
+
+        def fail_for_second_user(backend, messages):
+            if messages[0].to == [self.users[1].email]:
+                raise OSError('Connection reset')
+            return send(backend, messages)
+
+        with mock.patch.object(EmailBackend, 'send_messages', fail_for_second_user):
+            with self.assertLogs('library.tasks', 'ERROR'):
+                result = send_due_date_notifications(chunk_size=2)
+        self.assertEqual(result, 'Sent 4 due date notifications (1 failed)')
+        self.assertIsNone(Borrow.objects.get(pk=self.borrows[1].pk).due_notification_sent_at)
+
+        # The next run retries it
+        self.assertEqual(send_due_date_notifications(), 'Sent 1 due date notifications (0 failed)')
+        self.assertEqual(self.recipients().count(self.users[1].email), 1)
+
+    def test_single_connection(self):
+        with mock.patch('library.tasks.get_connection', wraps=mail.get_connection) as get_connection:
+            send_due_date_notifications(chunk_size=2)
+        get_connection.assert_called_once_with()
+        self.assertEqual(len(mail.outbox), 5)
+
+        # Nothing to send opens no connection
+        with mock.patch('library.tasks.get_connection', wraps=mail.get_connection) as get_connection:
+            send_due_date_notifications()
+        get_connection.assert_not_called()
+
+
+class OverdueSweepTests(TestCase):
+    """The overdue sweep must flag open borrows and keep one snapshot a day."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(name='Author')
+        cls.book = Book.objects.create(title='Title', author=author)
+        cls.first, cls.second = (
+            User.objects.create_user(email=f'{name}@example.com', username=name, password='secret')
+            for name in ('first', 'second')
+        )
+
+    def borrow(self, user, days_late, **kwargs):
+        now = timezone.now()
+        due_date = now - timedelta(days=days_late, hours=1)
+        return Borrow.objects.create(user=user, book=self.book, borrow_date=due_date, due_date=due_date, **kwargs)
+
+    def test_sweep_groups_updates_and_is_idempotent(self):
+        two_days = [self.borrow(self.first, 2), self.borrow(self.second, 2)]
+        five_days = self.borrow(self.first, 5)
+        # Already up to date, returned, and not due yet
+        current = self.borrow(self.second, 1, overdue=True, projected_penalty=1)
+        returned = self.borrow(self.second, 4, returned=True, return_date=timezone.now())
+        not_due = self.borrow(self.first, -2)
+
+        with CaptureQueriesContext(connection) as queries:
+            result = sweep_overdue_borrows()
+        self.assertEqual(result, 'Updated 3 overdue borrows (4 overdue)')
+        # One UPDATE per group of days late
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "library_borrow"')]
+        self.assertEqual(len(updates), 2)
+
+        projected = dict(Borrow.objects.values_list('pk', 'projected_penalty'))
+        self.assertEqual([projected[borrow.pk] for borrow in two_days], [2, 2])
+        self.assertEqual(projected[five_days.pk], 5)
+        self.assertEqual(projected[current.pk], 1)
+        self.assertEqual(projected[returned.pk], 0)
+        self.assertEqual(projected[not_due.pk], 0)
+        self.assertEqual(
+            set(Borrow.objects.filter(overdue=True).values_list('pk', flat=True)),
+            {borrow.pk for borrow in (*two_days, five_days, current)},
+        )
+
+        snapshot = OverdueSnapshot.objects.get()
+        self.assertEqual(snapshot.date, timezone.localdate())
+        self.assertEqual(
+            (snapshot.overdue_borrows, snapshot.overdue_users, snapshot.projected_penalty_total, snapshot.max_days_overdue),
+            (4, 2, 10, 5),
+        )
+
+        # A second run the same day has nothing to update and rewrites the snapshot
+        Borrow.objects.filter(pk=five_days.pk).update(returned=True, return_date=timezone.now())
+        self.assertEqual(sweep_overdue_borrows(chunk_size=2), 'Updated 0 overdue borrows (3 overdue)')
+        snapshot = OverdueSnapshot.objects.get()
+        self.assertEqual(
+            (snapshot.overdue_borrows, snapshot.overdue_users, snapshot.projected_penalty_total, snapshot.max_days_overdue),
+            (3, 2, 5, 2),
+        )
+
+
+class ThrottleTests(TestCase):
+    """The sliding window throttles must count allowed requests only."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='reader@example.com', username='reader', password='secret')
+
+    def setUp(self):
+        cache.clear()
+        self.request = RequestFactory().get('/api/borrow/')
+        self.request.user = self.user
+        self.now = 6000.0
+
+    def attempt(self, times=1):
+        throttle = BurstRateThrottle()
+        throttle.timer = lambda: self.now
+        return [throttle.allow_request(self.request, None) for _ in range(times)]
+
+    def test_refused_requests_are_not_counted(self):
+        self.assertEqual(self.attempt(10), [True] * 10)
+        self.assertEqual(self.attempt(20), [False] * 20)
+        self.assertEqual(cache.get(f'throttle_burst_{self.user.pk}:100'), 10)
+
+        # Halfway through the next window half of the previous 10 still
+        # count; had the refusals been counted, nothing would be allowed
+        self.now += 90
+        self.assertEqual(self.attempt(6), [True] * 5 + [False])
+
+    def test_async_refused_requests_are_not_counted(self):
+        throttle = BurstRateThrottle()
+        throttle.timer = lambda: self.now
+
+        async def attempt(times):
+            return [await throttle.aallow_request(self.request, None) for _ in range(times)]
+
+        self.assertEqual(asyncio.run(attempt(12)), [True] * 10 + [False] * 2)
+        self.assertEqual(cache.get(f'throttle_burst_{self.user.pk}:100'), 10)
+
+    def test_local_counters_while_the_cache_is_down(self):
+        self.addCleanup(setattr, SlidingWindowThrottleMixin, 'fallback_until', 0)
+        self.addCleanup(setattr, throttling, 'local_counters', throttling.local_counters)
+        throttling.local_counters = LocalCounterStore()
+
+        with mock.patch.object(caches[settings.THROTTLE_CACHE], 'incr', side_effect=ConnectionError('Cache is down')) as incr:
+            with self.assertLogs('utils.throttling', 'WARNING'):
+                self.assertEqual(self.attempt(12), [True] * 10 + [False] * 2)
+        # The shared cache is not tried again until the fallback period is over
+        incr.assert_called_once()
+        self.assertEqual(throttling.local_counters.get(f'throttle_burst_{self.user.pk}:100', self.now), 10)
+
+        # Counted in the shared cache again afterwards
+        self.now += settings.THROTTLE_FALLBACK_SECONDS
+        self.assertEqual(self.attempt(1), [True])
+        self.assertEqual(cache.get(f'throttle_burst_{self.user.pk}:100'), 1)
+
+
+class FakeRedis:
+    """Runs the throttle scripts as Redis would, and counts the round trips."""
+
+    def __init__(self):
+        self.values = {}
+        self.ttls = {}
+        self.round_trips = 0
+
+    def eval(self, script, numkeys, *keys_and_args):
+        self.round_trips += 1
+        keys, args = keys_and_args[:numkeys], keys_and_args[numkeys:]
+        if script == throttling.REDIS_COUNT:
+            self.values[keys[0]] = self.values.get(keys[0], 0) + 1
+            self.ttls.setdefault(keys[0], args[0])
+            previous = self.values.get(keys[1])
+            return [self.values[keys[0]], str(previous).encode() if previous is not None else 0]
+        if keys[0] in self.values:
+            self.values[keys[0]] -= 1
+            return self.values[keys[0]]
+        return 0
+
+
+class RedisThrottleTests(TestCase):
+    """On Redis, a request must be counted, with its TTL, in one round trip."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='reader@example.com', username='reader', password='secret')
+
+    def setUp(self):
+        self.redis = FakeRedis()
+        redis_cache = RedisCache('redis://localhost:6379', {})
+        redis_cache._cache = mock.Mock(get_client=mock.Mock(return_value=self.redis))
+        patcher = mock.patch('utils.throttling.caches', {settings.THROTTLE_CACHE: redis_cache})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.request = RequestFactory().get('/api/borrow/')
+        self.request.user = self.user
+        self.throttle = BurstRateThrottle()
+        self.throttle.timer = lambda: 6000.0
+        self.key = f':1:throttle_burst_{self.user.pk}:100'
+
+    def test_one_round_trip_per_allowed_request(self):
+        self.assertEqual([self.throttle.allow_request(self.request, None) for _ in range(10)], [True] * 10)
+        self.assertEqual(self.redis.round_trips, 10)
+        self.assertEqual(self.redis.values, {self.key: 10})
+        self.assertEqual(self.redis.ttls, {self.key: 2 * self.throttle.duration})
+
+    def test_refused_requests_are_taken_back(self):
+        self.redis.values[f':1:throttle_burst_{self.user.pk}:99'] = 10
+        self.assertFalse(self.throttle.allow_request(self.request, None))
+        self.assertEqual(self.redis.values[self.key], 0)
+
+        async def attempt():
+            return await self.throttle.aallow_request(self.request, None)
+
+        self.assertFalse(asyncio.run(attempt()))
+        self.assertEqual(self.redis.values[self.key], 0)
+        self.assertEqual(self.redis.round_trips, 4)
+
+
+class AuditFieldTests(TestCase):
+    """created_by and updated_by must name whoever made the change."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(email='admin@example.com', username='admin', password='secret', is_admin=True)
+        cls.author = Author.objects.create(name='Author')
+
+    def stamps(self, *books):
+        return [
+            Book.objects.values_list('created_by_id', 'updated_by_id').get(pk=book.pk)
+            for book in books
+        ]
+
+    def test_request_user_is_stamped(self):
+        # Authenticated by DRF after the middleware saw the request
+        client = APIClient(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.admin)}')
+        response = client.post('/api/book/', {'title': 'Created', 'author': str(self.author.pk)}, format='json')
+        self.assertEqual(response.status_code, 201)
+        book = Book.objects.get(title='Created')
+        self.assertEqual(self.stamps(book), [(self.admin.pk, None)])
+
+        Book.objects.filter(pk=book.pk).update(created_by=None)
+        response = client.put(f'/api/book/{book.pk}/', {'title': 'Updated'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.stamps(book), [(None, self.admin.pk)])
+
+    def test_audit_as_stamps_saves(self):
+        book = Book.objects.create(title='Unattributed', author=self.author)
+        self.assertEqual(self.stamps(book), [(None, None)])
+
+        with audit_as(self.admin):
+            created = Book.objects.create(title='Created', author=self.author)
+            book.title = 'Updated'
+            book.save()
+        self.assertEqual(self.stamps(created, book), [(self.admin.pk, None), (None, self.admin.pk)])
+
+    def test_audit_as_stamps_bulk_paths(self):
+        with audit_as(self.admin):
+            books = Book.objects.bulk_create(Book(title=f'Bulk {i}', author=self.author) for i in range(3))
+        self.assertEqual(self.stamps(*books), [(self.admin.pk, None)] * 3)
+
+        before = Book.objects.get(pk=books[0].pk).updated_at
+        for book in books:
+            book.title += ' updated'
+        with audit_as(self.admin):
+            Book.objects.bulk_update(books, ['title'])
+        self.assertEqual(self.stamps(*books), [(self.admin.pk, self.admin.pk)] * 3)
+        self.assertGreater(Book.objects.get(pk=books[0].pk).updated_at, before)
+
+        # Outside a request or audit_as() block the fields are left alone
+        others = Book.objects.bulk_create(Book(title=f'Other {i}', author=self.author) for i in range(2))
+        Book.objects.bulk_update(others, ['title'])
+        self.assertEqual(self.stamps(*others), [(None, None)] * 2)
+
+
+class BorrowExportTests(TestCase):
+    """The export must stream every matching borrow, and reject bad filters."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(email='admin@example.com', username='admin', password='secret', is_admin=True)
+        cls.reader = User.objects.create_user(email='reader@example.com', username='reader', password='secret')
+        author = Author.objects.create(name='Author')
+        cls.book = Book.objects.create(title='First', author=author)
+        cls.other = Book.objects.create(title='Second', author=author)
+        start = timezone.make_aware(datetime.datetime(2026, 3, 1))
+        cls.borrows = [
+            Borrow.objects.create(
+                user=cls.reader if i % 2 else cls.admin, book=cls.book if i < 3 else cls.other,
+                borrow_date=start + timedelta(days=i), due_date=start + timedelta(days=i + 14),
+            )
+            for i in range(5)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def export(self, **params):
+        response = self.client.get('/api/borrow/export/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    @override_settings(EXPORT_CHUNK_SIZE=2)
+    def test_csv_streams_in_chunks(self):
+        response = self.client.get('/api/borrow/export/')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="borrows.csv"')
+        chunks = list(response.streaming_content)
+        # Header with the first two rows, two more, and the last one
+        self.assertEqual(len(chunks), 3)
+
+        rows = list(csv.reader(io.StringIO(b''.join(chunks).decode())))
+        self.assertEqual(rows[0][:5], ['id', 'user', 'user_username', 'book', 'book_title'])
+        self.assertEqual([row[0] for row in rows[1:]], [str(borrow.pk) for borrow in self.borrows])
+        self.assertEqual(rows[2][2:5], ['reader', str(self.book.pk), 'First'])
+
+    def test_ndjson(self):
+        response, content = self.export(export_format='ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([row['id'] for row in rows], [str(borrow.pk) for borrow in self.borrows])
+        self.assertEqual(rows[0]['borrow_date'], self.borrows[0].borrow_date.isoformat())
+        self.assertIs(rows[0]['returned'], False)
+
+    def test_filters(self):
+        _, content = self.export(
+            export_format='ndjson', **{'from': '2026-03-02', 'to': '2026-03-05T00:00:00', 'book': str(self.book.pk)},
+        )
+        self.assertEqual([json.loads(line)['id'] for line in content.splitlines()], [str(self.borrows[i].pk) for i in (1, 2)])
+        _, content = self.export(export_format='ndjson', user=str(self.reader.pk))
+        self.assertEqual([json.loads(line)['id'] for line in content.splitlines()], [str(self.borrows[i].pk) for i in (1, 3)])
+
+    def test_invalid_parameters(self):
+        for params, detail in (
+            ({'export_format': 'xml'}, 'export_format must be one of: csv, ndjson.'),
+            ({'from': 'yesterday'}, "Invalid date: 'yesterday'."),
+            ({'to': '2026-02-30'}, "Invalid date: '2026-02-30'."),
+            ({'user': 'me'}, 'Invalid user ID.'),
+            ({'book': 'not-a-uuid'}, 'Invalid book ID.'),
+        ):
+            with self.subTest(params=params):
+                response = self.client.get('/api/borrow/export/', params)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.data['detail'], detail)
+
+    def test_admin_only(self):
+        self.client.force_authenticate(self.reader)
+        self.assertEqual(self.client.get('/api/borrow/export/').status_code, 403)
+
+    @override_settings(EXPORT_CHUNK_SIZE=2)
+    async def test_asgi_streams_without_buffering(self):
+        request = AsyncRequestFactory().get('/api/borrow/export/')
+        force_authenticate(request, self.admin)
+        response = await sync_to_async(borrow_views.borrow_export)(request)
+        self.assertTrue(response.is_async)
+
+        with mock.patch('library.export._format_value', side_effect=lambda value: value) as format_value:
+            chunks = aiter(response)
+            chunks_sent = [await anext(chunks)]
+            # Only the rows of the first chunk have been read
+            self.assertEqual(format_value.call_count, 2 * len(export.EXPORT_COLUMNS))
+            chunks_sent += [chunk async for chunk in chunks]
+        rows = list(csv.reader(io.StringIO(b''.join(chunks_sent).decode())))
+        self.assertEqual(len(chunks_sent), 3)
+        self.assertEqual([row[0] for row in rows[1:]], [str(borrow.pk) for borrow in self.borrows])
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('export_borrows', '--format', 'ndjson', '--book', str(self.other.pk), stdout=out)
+        self.assertEqual(
+            [json.loads(line)['id'] for line in out.getvalue().splitlines()],
+            [str(self.borrows[i].pk) for i in (3, 4)],
+        )
+
+        with self.assertRaisesMessage(CommandError, "Invalid book ID: 'not-a-uuid'."):
+            call_command('export_borrows', '--book', 'not-a-uuid', stdout=io.StringIO())
+        with self.assertRaisesMessage(CommandError, "Invalid date: 'yesterday'."):
+            call_command('export_borrows', '--from', 'yesterday', stdout=io.StringIO())
+
+
+class DailyStatsTests(TestCase):
+    """The rollup must replace the days it covers, and make cached answers stale."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(email='reader@example.com', username='reader', password='secret')
+        author = Author.objects.create(name='Author')
+        cls.book = Book.objects.create(title='First', author=author)
+        cls.other = Book.objects.create(title='Second', author=author)
+
+    def setUp(self):
+        cache.clear()
+
+    def borrow(self, book, days_ago, returned_days_ago=None):
+        now = timezone.now()
+        borrow_date = now - timedelta(days=days_ago)
+        return_date = now - timedelta(days=returned_days_ago) if returned_days_ago is not None else None
+        return Borrow.objects.create(
+            user=self.reader, book=book, borrow_date=borrow_date, due_date=borrow_date + timedelta(days=14),
+            returned=return_date is not None, return_date=return_date,
+        )
+
+    def rollup(self):
+        today = timezone.localdate()
+        return {
+            (title, (today - date).days): (borrows, returns)
+            for title, date, borrows, returns in BookDailyStats.objects.values_list(
+                'book__title', 'date', 'borrows', 'returns',
+            )
+        }
+
+    def test_rebuilds_days_that_already_have_stats(self):
+        self.borrow(self.book, 0)
+        self.borrow(self.book, 1, returned_days_ago=0)
+        self.borrow(self.other, 5)
+        # A stale row of a day being rebuilt, and a row of a day before the range
+        BookDailyStats.objects.create(book=self.other, date=timezone.localdate(), borrows=9, returns=9)
+        BookDailyStats.objects.create(book=self.other, date=timezone.localdate() - timedelta(days=5), borrows=7)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(rollup_daily_stats(days=2), 2)
+        self.assertEqual(self.rollup(), {('First', 0): (1, 1), ('First', 1): (1, 0), ('Second', 5): (7, 0)})
+
+        # A second run the same day gives the same rows
+        self.borrow(self.other, 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(rollup_daily_stats(days=2), 3)
+        self.assertEqual(
+            self.rollup(),
+            {('First', 0): (1, 1), ('First', 1): (1, 0), ('Second', 0): (1, 0), ('Second', 5): (7, 0)},
+        )
+
+    def test_cached_answers_are_stale_after_a_rollup(self):
+        build = mock.Mock(side_effect=[['first'], ['second']])
+        self.assertEqual(cached_stats('popular-books', (30, 10), build), ['first'])
+        self.assertEqual(cached_stats('popular-books', (30, 10), build), ['first'])
+        build.assert_called_once_with()
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            rollup_daily_stats()
+        self.assertIn(bump_version, callbacks)
+        self.assertEqual(cached_stats('popular-books', (30, 10), build), ['second'])
+
+    def test_endpoint_reads_the_rollup(self):
+        self.borrow(self.book, 0)
+        self.borrow(self.book, 1)
+        self.borrow(self.other, 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            rollup_daily_stats()
+        client = APIClient()
+        response = client.get('/api/stats/popular-books/', {'days': 7})
+        self.assertEqual([(row['title'], row['borrows']) for row in response.data], [('First', 2), ('Second', 1)])
+
+        # Answered from the cache until the next rollup
+        self.borrow(self.other, 0)
+        self.borrow(self.other, 0)
+        with self.assertNumQueries(0):
+            client.get('/api/stats/popular-books/', {'days': 7})
+        with self.captureOnCommitCallbacks(execute=True):
+            rollup_daily_stats()
+        response = client.get('/api/stats/popular-books/', {'days': 7})
+        self.assertEqual([(row['title'], row['borrows']) for row in response.data], [('Second', 3), ('First', 2)])
+
+
+class BorrowCountTests(TestCase):
+    """active_borrow_count must stay in bounds and be repairable from Borrow."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(name='Author')
+        cls.book = Book.objects.create(title='Title', author=author, total_copies=10, available_copies=10)
+
+    def create_user(self, name, open_borrows, count):
+        user = User.objects.create_user(email=f'{name}@example.com', username=name, password='secret')
+        now = timezone.now()
+        Borrow.objects.bulk_create(
+            Borrow(user=user, book=self.book, borrow_date=now, due_date=now) for _ in range(open_borrows)
+        )
+        Borrow.objects.create(user=user, book=self.book, due_date=now, returned=True, return_date=now)
+        User.objects.filter(pk=user.pk).update(active_borrow_count=count)
+        return user
+
+    def counts(self):
+        return dict(User.objects.values_list('username', 'active_borrow_count'))
+
+    def test_reconcile_fixes_drifted_counters(self):
+        self.create_user('exact', 2, 2)
+        self.create_user('high', 1, 3)
+        self.create_user('low', 2, 0)
+        self.create_user('idle', 0, 1)
+
+        out = io.StringIO()
+        call_command('reconcile_borrow_counts', '--batch-size', '2', stdout=out)
+        self.assertEqual(out.getvalue().strip(), 'Checked 4 users, 3 fixed.')
+        self.assertEqual(self.counts(), {'exact': 2, 'high': 1, 'low': 2, 'idle': 0})
+
+        out = io.StringIO()
+        call_command('reconcile_borrow_counts', stdout=out)
+        self.assertEqual(out.getvalue().strip(), 'Checked 4 users, 0 fixed.')
+
+    def test_reconcile_dry_run_changes_nothing(self):
+        self.create_user('high', 1, 3)
+        out = io.StringIO()
+        call_command('reconcile_borrow_counts', '--dry-run', stdout=out)
+        self.assertEqual(out.getvalue().strip(), 'Checked 1 users, 1 drifted.')
+        self.assertEqual(self.counts(), {'high': 3})
+
+    def test_slot_stays_within_limit_and_above_zero(self):
+        user = self.create_user('reader', 0, 0)
+        self.assertTrue(User.claim_borrow_slot(user.pk, limit=3, count=2))
+        self.assertFalse(User.claim_borrow_slot(user.pk, limit=3, count=2))
+        self.assertTrue(User.claim_borrow_slot(user.pk, limit=3))
+        self.assertEqual(self.counts(), {'reader': 3})
+
+        for _ in range(5):
+            User.release_borrow_slot(user.pk)
+        self.assertEqual(self.counts(), {'reader': 0})
+
+
+class SearchTests(TestCase):
+    """The FTS index must follow saves and deletes, and rank prefix matches."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(name='J. R. R. Tolkien')
+
+    def titles(self, text, queryset=None):
+        queryset = Book.objects.all() if queryset is None else queryset
+        return list(search(queryset, text).order_by('-search_rank').values_list('title', flat=True))
+
+    def test_index_follows_save_and_delete(self):
+        book = Book.objects.create(title='The Hobbit', author=self.author)
+        self.assertEqual(self.titles('hobbit'), ['The Hobbit'])
+
+        book.title = 'The Silmarillion'
+        book.save()
+        self.assertEqual(self.titles('hobbit'), [])
+        self.assertEqual(self.titles('silmarillion'), ['The Silmarillion'])
+
+        book.delete()
+        self.assertEqual(self.titles('silmarillion'), [])
+
+    def test_terms_match_prefixes(self):
+        Book.objects.create(title='The Hobbit', author=self.author)
+        Book.objects.create(title='The Fellowship of the Ring', author=self.author)
+        self.assertEqual(self.titles('hob'), ['The Hobbit'])
+        self.assertEqual(self.titles('fell ring'), ['The Fellowship of the Ring'])
+        self.assertEqual(list(search(Author.objects.all(), 'tolk').values_list('name', flat=True)), [self.author.name])
+
+    def test_title_matches_rank_above_description_matches(self):
+        Book.objects.create(title='Autumn Leaves', description='A book about dragons.', author=self.author)
+        Book.objects.create(title='Dragons of Autumn', author=self.author)
+        self.assertEqual(self.titles('dragons'), ['Dragons of Autumn', 'Autumn Leaves'])
+
+    def test_text_without_terms_matches_nothing(self):
+        Book.objects.create(title='The Hobbit', author=self.author)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.titles('  "*" -- '), [])
+
+    def test_rebuild_restores_rows_indexed_out_of_band(self):
+        book = Book.objects.create(title='The Hobbit', author=self.author)
+        # Bulk updates bypass the signals, so the index goes stale
+        Book.objects.filter(pk=book.pk).update(title='The Return of the King')
+        self.assertEqual(self.titles('king'), [])
+
+        self.assertEqual(rebuild_search_index(Book), 1)
+        self.assertEqual(self.titles('king'), ['The Return of the King'])
+        self.assertEqual(self.titles('hobbit'), [])
+
+    def test_book_list_orders_by_rank(self):
+        Book.objects.create(title='Autumn Leaves', description='Dragons, mostly.', author=self.author)
+        Book.objects.create(title='Dragons of Autumn', author=self.author)
+        client = APIClient()
+        response = client.get('/api/book/', {'search': 'dragon'})
+        self.assertEqual([book['title'] for book in response.data['results']], ['Dragons of Autumn', 'Autumn Leaves'])
+
+
+class SyncRoutes:
+    """The catalog reads served by the sync views, whatever API_ASYNC_VIEWS is."""
+    urlpatterns = [
+        path('api/book/', book_views.book_list),
+        path('api/book/<str:pk>/', book_views.book_detail),
+        path('api/users/<int:user_id>/penalties/', borrow_views.user_penalties),
+    ]
+
+
+class AsyncRoutes:
+    """The same reads served by their async versions."""
+    urlpatterns = [
+        path('api/book/', async_views.book_list),
+        path('api/book/<str:pk>/', async_views.book_detail),
+        path('api/users/<int:user_id>/penalties/', async_views.user_penalties),
+    ]
+
+
+@override_settings(ROOT_URLCONF=AsyncRoutes)
+class AsyncViewTests(TestCase):
+    """The async views must answer exactly like the sync ones they stand in for."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(email='admin@example.com', username='admin', password='secret', is_admin=True)
+        cls.reader = User.objects.create_user(email='reader@example.com', username='reader', password='secret')
+        author = Author.objects.create(name='Author')
+        category = Category.objects.create(name='Category')
+        cls.books = Book.objects.bulk_create(
+            Book(title=f'Book {i}', author=author, category=category if i % 2 else None) for i in range(3)
+        )
+        now = timezone.now()
+        Borrow.objects.create(user=cls.reader, book=cls.books[0], borrow_date=now - timedelta(days=20), due_date=now - timedelta(days=6))
+
+    def setUp(self):
+        cache.clear()
+
+    def auth(self, user):
+        # Per request: AsyncClient(headers=...) would put them in the ASGI scope
+        return {'Authorization': f'Bearer {AccessToken.for_user(user)}'} if user else {}
+
+    def sync_get(self, path, user=None, **params):
+        with override_settings(ROOT_URLCONF=SyncRoutes):
+            cache.clear()
+            client = APIClient()
+            if user:
+                client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+            response = client.get(path, params)
+        cache.clear()
+        return response
+
+    async def test_same_output_as_sync_views(self):
+        for path, user, params in (
+            ('/api/book/', None, {'page_size': 2}),
+            ('/api/book/', None, {'search': 'book', 'page_size': 2}),
+            (f'/api/book/{self.books[1].pk}/', None, {}),
+            (f'/api/users/{self.reader.pk}/penalties/', self.reader, {}),
+            (f'/api/users/{self.reader.pk}/penalties/', self.admin, {}),
+        ):
+            with self.subTest(path=path, params=params):
+                expected = await sync_to_async(self.sync_get)(path, user, **params)
+                response = await self.async_client.get(path, params, headers=self.auth(user))
+                self.assertEqual(response.status_code, expected.status_code)
+                self.assertEqual(response.content, expected.content)
+                self.assertEqual(response.get('ETag'), expected.get('ETag'))
+
+    async def test_unauthenticated(self):
+        path = f'/api/users/{self.reader.pk}/penalties/'
+        expected = await sync_to_async(self.sync_get)(path)
+        response = await self.async_client.get(path)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], expected['WWW-Authenticate'])
+        self.assertEqual(response.json(), expected.json())
+
+        response = await self.async_client.get(path, headers={'Authorization': 'Bearer not-a-token'})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], expected['WWW-Authenticate'])
+
+    @mock.patch.object(SustainedRateThrottle, 'rate', '2/minute')
+    async def test_throttled(self):
+        headers = self.auth(self.reader)
+        for _ in range(2):
+            self.assertEqual((await self.async_client.get('/api/book/', headers=headers)).status_code, 200)
+        response = await self.async_client.get('/api/book/', headers=headers)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Request was throttled.', response.json()['detail'])
+        self.assertTrue(0 < int(response['Retry-After']) <= 60)
+
+    async def test_if_none_match(self):
+        for path in ('/api/book/', f'/api/book/{self.books[0].pk}/'):
+            with self.subTest(path=path):
+                etag = (await self.async_client.get(path))['ETag']
+                response = await self.async_client.get(path, headers={'If-None-Match': etag})
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b'')
+
+    async def test_writes_go_to_the_sync_view(self):
+        path = f'/api/book/{self.books[0].pk}/'
+        response = await self.async_client.put(
+            path, {'title': 'Renamed'}, content_type='application/json', headers=self.auth(self.reader),
+        )
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.json(), {'detail': 'Permission denied.'})
+
+        response = await self.async_client.put(
+            path, {'title': 'Renamed'}, content_type='application/json', headers=self.auth(self.admin),
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['title'], 'Renamed')
+        self.assertEqual((await Book.objects.aget(pk=self.books[0].pk)).title, 'Renamed')
+
+
+@override_settings(INSTRUMENTATION_SAMPLE_RATE=1, INSTRUMENTATION_SERVER_TIMING=True)
+class InstrumentationTests(TestCase):
+    """Sampled requests must record their queries, serializer time and cache lookups."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(email='admin@example.com', username='admin', password='secret', is_admin=True)
+        cls.reader = User.objects.create_user(email='reader@example.com', username='reader', password='secret')
+        author = Author.objects.create(name='Author')
+        cls.book = Book.objects.create(title='Title', author=author)
+        now = timezone.now()
+        Borrow.objects.bulk_create(Borrow(user=cls.reader, book=cls.book, borrow_date=now, due_date=now) for _ in range(3))
+
+    def setUp(self):
+        cache.clear()
+        instrumentation.samples.clear()
+        self.addCleanup(instrumentation.samples.clear)
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def test_sampled_request_is_measured(self):
+        response = self.client.get('/api/borrow/')
+        self.assertRegex(
+            response['Server-Timing'],
+            r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="1 queries", serializer;dur=[\d.]+, cache;desc="0 hits, 0 misses"$',
+        )
+        [(view, wall, queries, db_time, serializer_time, hits, misses)] = instrumentation.samples.snapshot()
+        self.assertEqual((view, queries, hits, misses), ('borrow-list', 1, 0, 0))
+        self.assertGreater(wall, db_time)
+        self.assertGreater(db_time, 0)
+        self.assertGreater(serializer_time, 0)
+
+    def test_cache_lookups_are_counted(self):
+        for _ in range(2):
+            self.client.get(f'/api/book/{self.book.pk}/')
+        self.assertEqual(
+            [sample[5:] for sample in instrumentation.samples.snapshot()],
+            [(0, 1), (1, 0)],
+        )
+
+    def test_async_request_is_measured(self):
+        response = async_to_sync(self.async_client.get)('/api/book/')
+        self.assertIn('Server-Timing', response)
+        [sample] = instrumentation.samples.snapshot()
+        self.assertEqual(sample[0], 'book-list')
+        self.assertEqual(sample[2], 1)
+
+    @override_settings(INSTRUMENTATION_SAMPLE_RATE=0)
+    def test_unsampled_request_is_not_measured(self):
+        response = self.client.get('/api/borrow/')
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(instrumentation.samples.snapshot(), [])
+
+    def test_query_hooks_outlive_execute_wrapper_blocks(self):
+        hooks = [instrumentation.record_query, query_analysis._record_query]
+        # As on a connection opened before the hooks were connected
+        for hook in hooks:
+            if hook in connection.execute_wrappers:
+                connection.execute_wrappers.remove(hook)
+        self.addCleanup(query_analysis.install_query_hook)
+        self.addCleanup(instrumentation.install_query_hook)
+
+        def outer(execute, sql, params, many, context):
+            return execute(sql, params, many, context)
+
+        # execute_wrapper() pops the last wrapper when its block ends
+        with connection.execute_wrapper(outer):
+            instrumentation.install_query_hook()
+            with QueryRecorder():
+                pass
+        self.assertEqual(connection.execute_wrappers, hooks[::-1])
+
+    def test_new_connections_get_the_query_hooks(self):
+        def wrappers():
+            try:
+                connection.ensure_connection()
+                return list(connection.execute_wrappers)
+            finally:
+                connection.close()
+
+        def new_connection_wrappers():
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                return executor.submit(wrappers).result()
+
+        # The query analysis hook only once something records queries
+        connection_created.disconnect(query_analysis.install_query_hook)
+        self.assertEqual(new_connection_wrappers(), [instrumentation.record_query])
+        with override_settings(QUERY_ANALYSIS=False):
+            with self.assertRaises(MiddlewareNotUsed):
+                QueryAnalysisMiddleware(lambda request: None)
+        self.assertEqual(new_connection_wrappers(), [instrumentation.record_query])
+
+        with override_settings(QUERY_ANALYSIS=True):
+            QueryAnalysisMiddleware(lambda request: None)
+        self.assertCountEqual(new_connection_wrappers(), [instrumentation.record_query, query_analysis._record_query])
+        connection_created.disconnect(query_analysis.install_query_hook)
+        with QueryRecorder():
+            pass
+        self.assertCountEqual(new_connection_wrappers(), [instrumentation.record_query, query_analysis._record_query])
+
+    def test_summary_is_admin_only(self):
+        self.client.get('/api/borrow/')
+        response = self.client.get('/api/instrumentation/')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.client.delete('/api/instrumentation/').status_code, 403)
+
+        self.client.force_authenticate(self.admin)
+        summary = self.client.get('/api/instrumentation/').data
+        self.assertEqual(summary['views']['borrow-list']['requests'], 1)
+        self.assertEqual(summary['views']['borrow-list']['queries_per_request'], 1)
+        self.assertEqual(self.client.delete('/api/instrumentation/').status_code, 204)
+        # Only the DELETE itself, measured once the buffer was cleared
+        self.assertEqual([sample[0] for sample in instrumentation.samples.snapshot()], ['instrumentation'])
+
+
+class AvailabilityTests(TestCase):
+    """The availability map must follow borrows and returns, and feed its streams."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='reader@example.com', username='reader', password='secret')
+        cls.book = Book.objects.create(title='Title', author=Author.objects.create(name='Author'), total_copies=2, available_copies=2)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def availability(self):
+        return self.client.get('/api/book/availability/', {'ids': str(self.book.pk)})
+
+    def test_batch(self):
+        missing = uuid.uuid4()
+        response = self.client.get('/api/book/availability/', {'ids': f'{self.book.pk},{missing},{self.book.pk}'})
+        self.assertEqual(response.json(), {str(self.book.pk): 2, str(missing): None})
+        with self.assertNumQueries(0):
+            self.assertEqual(self.availability().json(), {str(self.book.pk): 2})
+        self.assertEqual(self.client.get('/api/book/availability/', {'ids': 'nope'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/book/availability/').status_code, 400)
+
+    def test_follows_borrows_and_returns(self):
+        self.availability()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/borrow/', {'book': str(self.book.pk)}, format='json')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.availability().json(), {str(self.book.pk): 1})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/return/', {'borrow_id': str(Borrow.objects.get().pk)}, format='json')
+        self.assertEqual(self.availability().json(), {str(self.book.pk): 2})
+
+    @override_settings(AVAILABILITY_STREAM_POLL_INTERVAL=0.01)
+    def test_stream(self):
+        book_id = str(self.book.pk)
+        # Cached, so the stream does not query from another thread
+        availability.get_availability([self.book.pk])
+
+        async def read():
+            events = availability.stream([self.book.pk])
+            received = [await events.__anext__(), await events.__anext__()]
+            await asyncio.sleep(0.05)
+            availability.publish({str(uuid.uuid4()): 0})
+            availability.publish({book_id: 1})
+            received.append(await asyncio.wait_for(events.__anext__(), 2))
+            await events.aclose()
+            return received
+
+        retry, snapshot, change = asyncio.run(read())
+        self.assertEqual(snapshot, f'event: availability\ndata: {{"{book_id}":2}}\n\n'.encode())
+        self.assertEqual(change, f'event: availability\ndata: {{"{book_id}":1}}\n\n'.encode())
+        self.assertFalse(availability.feed.subscribers)
+
+    def test_stream_view_accepts_event_source(self):
+        availability.get_availability([self.book.pk])
+        request = AsyncRequestFactory().get(
+            '/api/book/availability/stream/', {'ids': str(self.book.pk)}, headers={'Accept': 'text/event-stream'},
+        )
+
+        async def read():
+            response = await async_views.book_availability_stream(request)
+            events = aiter(response.streaming_content)
+            received = [await anext(events), await anext(events)]
+            await events.aclose()
+            return response, received
+
+        response, (retry, snapshot) = asyncio.run(read())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(snapshot, f'event: availability\ndata: {{"{self.book.pk}":2}}\n\n'.encode())
+
+
+class ReservationTests(TestCase):
+    """Returned copies must go to the reservation queue in FIFO order before the shelf."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader, cls.first, cls.second = (
+            User.objects.create_user(email=f'{name}@example.com', username=name, password='secret')
+            for name in ('reader', 'first', 'second')
+        )
+        cls.book = Book.objects.create(title='Title', author=Author.objects.create(name='Author'), total_copies=2, available_copies=2)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def as_user(self, user, method, path, data=None):
+        self.client.force_authenticate(user)
+        return getattr(self.client, method)(path, data, format='json')
+
+    def borrow_all(self):
+        return [
+            self.as_user(self.reader, 'post', '/api/borrow/', {'book': str(self.book.pk)}).json()['id']
+            for _ in range(self.book.total_copies)
+        ]
+
+    def reserve(self, user):
+        return self.as_user(user, 'post', '/api/reservation/', {'book': str(self.book.pk)})
+
+    def test_queue_is_served_in_order(self):
+        self.assertEqual(self.reserve(self.first).status_code, 400)
+        borrows = self.borrow_all()
+        first = self.reserve(self.first).json()
+        second = self.reserve(self.second).json()
+        self.assertEqual((first['queue_position'], second['queue_position']), (1, 2))
+        self.assertEqual(self.reserve(self.first).status_code, 400)
+
+        self.as_user(self.reader, 'post', '/api/return/', {'borrow_id': borrows[0]})
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 0)
+        self.assertEqual(Reservation.objects.get(pk=first['id']).status, Reservation.READY)
+        self.assertEqual(self.as_user(self.second, 'get', f"/api/reservation/{second['id']}/").json()['queue_position'], 1)
+
+        # The held copy is only for the first in line
+        self.assertEqual(self.as_user(self.second, 'post', '/api/borrow/', {'book': str(self.book.pk)}).status_code, 400)
+        response = self.as_user(self.first, 'post', '/api/borrow/batch/', {'books': [str(self.book.pk)]})
+        self.assertEqual(response.json()['borrowed'], 1)
+        self.assertEqual(Reservation.objects.get(pk=first['id']).status, Reservation.FULFILLED)
+
+        # Finding the next in line is one indexed read and one UPDATE
+        with self.assertNumQueries(2):
+            self.assertEqual(Reservation.hold_copies(self.book.pk), [uuid.UUID(second['id'])])
+
+    def test_borrower_cannot_reserve_their_own_book(self):
+        self.borrow_all()
+        response = self.reserve(self.reader)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"detail": "You are currently borrowing 'Title'."})
+        self.assertFalse(Reservation.objects.exists())
+
+    def test_expired_hold_cannot_be_borrowed(self):
+        borrows = self.borrow_all()
+        first = self.reserve(self.first).json()
+        self.as_user(self.reader, 'post', '/api/return/', {'borrow_id': borrows[0]})
+        Reservation.objects.filter(pk=first['id']).update(expires_at=timezone.now() - timedelta(minutes=1))
+
+        # Not expired by expire_reservations yet, but past its pickup window
+        self.assertEqual(self.as_user(self.first, 'post', '/api/borrow/', {'book': str(self.book.pk)}).status_code, 400)
+        response = self.as_user(self.first, 'post', '/api/borrow/batch/', {'books': [str(self.book.pk)]})
+        self.assertEqual(response.json()['borrowed'], 0)
+        self.assertEqual(Reservation.objects.get(pk=first['id']).status, Reservation.READY)
+
+    def test_cancelled_and_expired_holds_pass_the_copy_on(self):
+        borrows = self.borrow_all()
+        first = self.reserve(self.first).json()
+        second = self.reserve(self.second).json()
+        self.as_user(self.reader, 'post', '/api/return/batch/', {'borrows': borrows})
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 0)
+
+        # Nobody else is waiting, so the copy of a cancelled hold goes back on the shelf
+        self.assertEqual(self.as_user(self.first, 'delete', f"/api/reservation/{first['id']}/").status_code, 204)
+        self.assertEqual(self.as_user(self.first, 'delete', f"/api/reservation/{first['id']}/").status_code, 400)
+        self.assertEqual(self.as_user(self.first, 'get', f"/api/reservation/{second['id']}/").status_code, 403)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 1)
+
+        Reservation.objects.filter(pk=second['id']).update(expires_at=timezone.now() - datetime.timedelta(minutes=1))
+        expire_reservations()
+        self.assertEqual(Reservation.objects.get(pk=second['id']).status, Reservation.EXPIRED)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 2)
+
+    def test_copy_returned_while_reserving_goes_to_the_queue(self):
+        borrows = self.borrow_all()
+        enqueue = Reservation.enqueue
+
+        def enqueue_after_a_return(user, book_id):
+            # Lands between the availability check and the insert where
+            # rows are not locked
+            Book.return_copy(book_id)
+            Borrow.objects.filter(pk=borrows[0]).update(returned=True)
+            return enqueue(user, book_id)
+
+        with mock.patch.object(Reservation, 'enqueue', side_effect=enqueue_after_a_return):
+            response = self.reserve(self.first)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['status'], Reservation.READY)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 0)
+
+    def test_open_reservations_are_limited(self):
+        author = self.book.author
+        books = Book.objects.bulk_create(
+            Book(title=f'Gone {i}', author=author, total_copies=1, available_copies=0)
+            for i in range(MAX_ACTIVE_RESERVATIONS + 1)
+        )
+        for book in books[:-1]:
+            response = self.as_user(self.first, 'post', '/api/reservation/', {'book': str(book.pk)})
+            self.assertEqual(response.status_code, 201)
+        response = self.as_user(self.first, 'post', '/api/reservation/', {'book': str(books[-1].pk)})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['detail'], RESERVATION_LIMIT_MESSAGE)
+        self.assertEqual(Reservation.objects.filter(user=self.first).count(), MAX_ACTIVE_RESERVATIONS)
+
+    def test_pickup_notices_are_sent_once(self):
+        self.borrow_all()
+        self.reserve(self.first)
+        self.reserve(self.second)
+        self.as_user(self.reader, 'post', '/api/return/batch/', {
+            'borrows': [str(pk) for pk in Borrow.objects.values_list('pk', flat=True)],
+        })
+
+        send_reservation_notifications()
+        send_reservation_notifications()
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['first@example.com', 'second@example.com'])
+
+
+class BatchBorrowReturnTests(TestCase):
+    """Batch borrows and returns must settle every item on its own and apply totals in aggregate."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader, cls.other = (
+            User.objects.create_user(email=f'{name}@example.com', username=name, password='secret')
+            for name in ('reader', 'other')
+        )
+        cls.admin = User.objects.create_user(email='admin@example.com', username='admin', password='secret', is_admin=True)
+        author = Author.objects.create(name='Author')
+        cls.books = [Book.objects.create(title=f'Book {i}', author=author, total_copies=2, available_copies=2) for i in range(3)]
+        cls.unavailable = Book.objects.create(title='Gone', author=author, total_copies=1, available_copies=0)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def borrow(self, user, book, days_late=0):
+        now = timezone.now()
+        User.objects.filter(pk=user.pk).update(active_borrow_count=F('active_borrow_count') + 1)
+        Book.objects.filter(pk=book.pk).update(available_copies=F('available_copies') - 1)
+        due_date = now - timedelta(days=days_late, hours=1) if days_late else now + timedelta(days=14)
+        return Borrow.objects.create(user=user, book=book, borrow_date=due_date - timedelta(days=14), due_date=due_date)
+
+    def test_borrow_batch_settles_each_book(self):
+        self.borrow(self.reader, self.books[2])
+        missing = uuid.uuid4()
+        books = [missing, self.unavailable.pk, self.books[0].pk, self.books[1].pk, self.books[2].pk]
+        self.client.force_authenticate(User.objects.get(pk=self.reader.pk))
+        response = self.client.post('/api/borrow/batch/', {'books': [str(pk) for pk in books]}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['borrowed'], 2)
+        results = {str(result['book']): result for result in response.data['results']}
+        self.assertEqual(results[str(missing)]['detail'], 'Book not found.')
+        self.assertEqual(results[str(self.unavailable.pk)]['detail'], "Book 'Gone' is not available for borrowing.")
+        self.assertEqual([results[str(book.pk)]['status'] for book in self.books], ['borrowed', 'borrowed', 'failed'])
+        self.assertIn('maximum limit', results[str(self.books[2].pk)]['detail'])
+        self.assertEqual(User.objects.get(pk=self.reader.pk).active_borrow_count, 3)
+        self.assertEqual(
+            list(Book.objects.filter(pk__in=[book.pk for book in self.books]).order_by('title').values_list('available_copies', flat=True)),
+            [1, 1, 1],
+        )
+
+    def test_borrow_batch_rolls_back_when_the_slots_are_gone(self):
+        # The request's user still shows no borrows, as if a concurrent
+        # request had taken the slots after authentication
+        self.client.force_authenticate(User.objects.get(pk=self.reader.pk))
+        User.objects.filter(pk=self.reader.pk).update(active_borrow_count=2)
+        response = self.client.post(
+            '/api/borrow/batch/', {'books': [str(self.books[0].pk), str(self.books[1].pk)]}, format='json',
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('maximum limit', response.data['detail'])
+        self.assertFalse(Borrow.objects.exists())
+        self.assertEqual(sum(Book.objects.filter(pk__in=[book.pk for book in self.books]).values_list('available_copies', flat=True)), 6)
+
+    def test_update_rows_redoes_a_partial_batch_row_by_row(self):
+        books = [self.books[0].pk, self.unavailable.pk, self.books[1].pk]
+        updated = _update_rows(Book.objects.filter(available_copies__gt=0), books, available_copies=F('available_copies') - 1)
+        self.assertEqual(updated, {self.books[0].pk, self.books[1].pk})
+        self.assertEqual(
+            dict(Book.objects.filter(pk__in=books).values_list('title', 'available_copies')),
+            {'Book 0': 1, 'Gone': 0, 'Book 1': 1},
+        )
+
+    def test_return_batch_aggregates_across_users(self):
+        reader_borrows = [self.borrow(self.reader, self.books[0]), self.borrow(self.reader, self.books[0], days_late=3)]
+        other_borrows = [self.borrow(self.other, self.books[1], days_late=5)]
+        returned = self.borrow(self.other, self.books[2])
+        Borrow.objects.filter(pk=returned.pk).update(returned=True, return_date=timezone.now())
+        missing = uuid.uuid4()
+
+        # Only staff may return other users' books
+        self.client.force_authenticate(self.reader)
+        response = self.client.post('/api/return/batch/', {'borrows': [str(other_borrows[0].pk)]}, format='json')
+        self.assertEqual(response.data['results'][0]['detail'], 'Permission denied.')
+
+        self.client.force_authenticate(self.admin)
+        ids = [borrow.pk for borrow in reader_borrows + other_borrows] + [returned.pk, missing]
+        # The borrows, one UPDATE per table and the reservation queues, in savepoints
+        with self.assertNumQueries(9):
+            response = self.client.post('/api/return/batch/', {'borrows': [str(pk) for pk in ids]}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['returned'], response.data['penalty_points_added']), (3, 8))
+        self.assertEqual(
+            [result.get('detail') for result in response.data['results'][3:]],
+            ['This book has already been returned.', 'Borrow record not found.'],
+        )
+        self.assertEqual(
+            dict(User.objects.filter(pk__in=[self.reader.pk, self.other.pk]).values_list('username', 'penalty_points')),
+            {'reader': 3, 'other': 5},
+        )
+        self.assertEqual(
+            dict(User.objects.filter(pk__in=[self.reader.pk, self.other.pk]).values_list('username', 'active_borrow_count')),
+            {'reader': 0, 'other': 1},
+        )
+        self.assertEqual(
+            list(Book.objects.filter(pk__in=[book.pk for book in self.books]).order_by('title').values_list('available_copies', flat=True)),
+            [2, 2, 1],
+        )
+
+
+class ImportCatalogTests(TestCase):
+    """import_catalog must never mistake rows of another run for ones it already imported."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write(self, name, rows):
+        path = os.path.join(self.directory, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as fh:
+            fh.writelines(row if isinstance(row, str) else json.dumps(row) + '\n' for row in rows)
+        return path
+
+    def run_import(self, path, *args):
+        out = io.StringIO()
+        call_command('import_catalog', path, *args, stdout=out)
+        return out.getvalue()
+
+    def titles(self):
+        return sorted(Book.objects.values_list('title', flat=True))
+
+    def test_files_with_the_same_name_are_both_imported(self):
+        self.run_import(self.write('d1/catalog.jsonl', [{'title': 'A', 'author': 'X'}, {'title': 'B', 'author': 'X'}]))
+        output = self.run_import(self.write('d2/catalog.jsonl', [{'title': 'C', 'author': 'X'}, {'title': 'D', 'author': 'X'}]))
+        self.assertIn('Imported 2 books (0 skipped)', output)
+        self.assertEqual(self.titles(), ['A', 'B', 'C', 'D'])
+
+    def test_resume_skips_rows_committed_after_the_checkpoint(self):
+        rows = [{'title': 'A', 'author': 'X'}, {'title': 'B', 'author': 'X'}, '[1]\n', {'title': 'C', 'author': 'X'}]
+        path = self.write('catalog.jsonl', rows)
+        with self.assertRaisesMessage(CommandError, 'Row 3: a row must be an object. Fix it and rerun with --resume.'):
+            self.run_import(path, '--batch-size', '1')
+
+        # As if the process died after committing row 2 but before checkpointing it
+        checkpoint = f'{path}.checkpoint'
+        with open(checkpoint) as fh:
+            state = json.load(fh)
+        self.assertEqual(state['rows'], 2)
+        with open(checkpoint, 'w') as fh:
+            json.dump({**state, 'rows': 1}, fh)
+        rows[2] = {'title': 'Fixed', 'author': 'X'}
+        self.write('catalog.jsonl', rows)
+
+        output = self.run_import(path, '--resume', '--batch-size', '1')
+        self.assertIn('Imported 2 books (1 skipped)', output)
+        self.assertEqual(self.titles(), ['A', 'B', 'C', 'Fixed'])
+
+    def test_malformed_rows(self):
+        rows = [
+            'not json\n', '"x"\n', {'title': 1, 'author': 'X'}, {'title': 'A', 'author': ['X']},
+            {'title': 'A', 'author': 'X', 'total_copies': [2]}, {'title': 'A', 'author': 'X', 'available_copies': {}},
+            {'title': 'A', 'author': 'X', 'total_copies': 1, 'available_copies': 2},
+            {'title': 'Valid', 'author': 'X', 'total_copies': '2'},
+        ]
+        path = self.write('catalog.jsonl', rows)
+        for number, row in enumerate(rows[:-1], start=1):
+            with self.subTest(row=row), self.assertRaisesMessage(CommandError, 'Row 1: '):
+                self.run_import(self.write(f'row{number}.jsonl', [row]))
+
+        self.assertIn('Imported 1 books (7 skipped)', self.run_import(path, '--skip-invalid'))
+        self.assertEqual(list(Book.objects.values_list('title', 'total_copies', 'available_copies')), [('Valid', 2, 2)])
+
+
+class QueryAnalysisTests(TestCase):
+    """The N+1 detector must catch lazy relation loads and point at their origin."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='reader@example.com', username='reader', password='secret')
+        author = Author.objects.create(name='Author')
+        books = Book.objects.bulk_create(Book(title=f'Book {i}', author=author) for i in range(10))
+        now = timezone.now()
+        Borrow.objects.bulk_create(
+            Borrow(user=cls.user, book=book, borrow_date=now, due_date=now) for book in books
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_fingerprint_collapses_literals_and_in_lists(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE a = 'x''y' AND b = 42 AND c IN (%s, %s, %s) LIMIT 21"),
+            fingerprint("SELECT *  FROM t WHERE a = 'z' AND b = 7 AND c IN (%s) LIMIT 1"),
+        )
+
+    def test_flags_n_plus_one(self):
+        with self.assertRaises(AssertionError) as raised:
+            with assert_max_queries(max_repeats=2):
+                BorrowSerializer(Borrow.objects.all(), many=True).data
+        message = str(raised.exception)
+        self.assertIn('10x SELECT', message)
+        self.assertIn('library/tests.py', message)
+
+    def test_optimized_queryset_passes(self):
+        with assert_max_queries(1, max_repeats=1):
+            BorrowSerializer(BorrowSerializer.get_optimized_queryset(Borrow.objects.all()), many=True).data
+
+    def test_flags_slow_queries(self):
+        with self.assertRaises(AssertionError) as raised:
+            with assert_max_queries(slow_ms=-1):
+                Book.objects.count()
+        self.assertIn('budget -1 ms', str(raised.exception))
+
+    @assert_max_queries(3, max_repeats=1)
+    def test_borrow_list_as_decorator(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get('/api/borrow/', {'page_size': 100})
+        self.assertEqual(len(response.data['results']), 10)
+
+    @override_settings(QUERY_ANALYSIS=True, QUERY_ANALYSIS_MAX_REPEATS=2)
+    def test_middleware_logs_offenders(self):
+        def view(request):
+            BorrowSerializer(Borrow.objects.all(), many=True).data
+            return 'response'
+
+        with self.assertLogs('utils.query_analysis', 'WARNING') as logs:
+            QueryAnalysisMiddleware(view)(RequestFactory().get('/api/borrow/'))
+        self.assertIn('GET /api/borrow/ ran 21 queries', logs.output[0])
+
+
+class ConcurrentInventoryTests(TransactionTestCase):
+    """Hammer the conditional inventory updates from many threads at once."""
+
+    workers = 50
+    attempts = 300
+    copies = 5
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='reader@example.com', username='reader', password='secret')
+        author = Author.objects.create(name='Author')
+        self.book = Book.objects.create(
+            title='Contended', author=author, total_copies=self.copies, available_copies=self.copies,
+        )
+
+    def run_concurrently(self, func):
+        """Run ``func`` ``attempts`` times across threads, retrying lock errors."""
+        barrier = threading.Barrier(self.workers)
+
+        def attempt(index):
+            if index < self.workers:
+                barrier.wait()
+            try:
+                while True:
+                    try:
+                        with transaction.atomic():
+                            return func(index)
+                    except OperationalError:
+                        # SQLite reports contention instead of blocking
+                        time.sleep(0.001)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(attempt, range(self.attempts)))
+
+    def test_borrows_never_oversell(self):
+        def borrow(index):
+            if not Book.checkout_copy(self.book.pk):
+                return False
+            now = timezone.now()
+            Borrow.objects.create(user=self.user, book=self.book, borrow_date=now, due_date=now)
+            return True
+
+        results = self.run_concurrently(borrow)
+
+        self.book.refresh_from_db()
+        self.assertEqual(sum(results), self.copies)
+        self.assertEqual(self.book.available_copies, 0)
+        self.assertEqual(Borrow.objects.filter(book=self.book).count(), self.copies)
+
+    def test_returns_never_exceed_total_copies(self):
+        Book.objects.filter(pk=self.book.pk).update(available_copies=0)
+        now = timezone.now()
+        borrows = [
+            Borrow.objects.create(user=self.user, book=self.book, borrow_date=now, due_date=now)
+            for _ in range(self.copies)
+        ]
+
+        def give_back(index):
+            borrow = borrows[index % len(borrows)]
+            returned = Borrow.objects.filter(pk=borrow.pk, returned=False).update(
+                returned=True, return_date=timezone.now(),
+            )
+            return bool(returned) and Book.return_copy(self.book.pk)
+
+        results = self.run_concurrently(give_back)
+
+        self.book.refresh_from_db()
+        self.assertEqual(sum(results), self.copies)
+        self.assertEqual(self.book.available_copies, self.copies)
+
+    # Lock errors are retried, and every retry would count against the throttle
+    @mock.patch.object(BurstRateThrottle, 'allow_request', return_value=True)
+    def test_batches_never_oversell_or_return_twice(self, allow_request):
+        other = Book.objects.create(
+            title='Also contended', author=self.book.author, total_copies=self.copies, available_copies=self.copies,
+        )
+        # Every request redoes its whole batch on a lock error, so fewer
+        # threads than the single-copy tests keep SQLite from livelocking
+        self.workers = self.attempts = 6
+        User.objects.bulk_create(User(username=f'batch{i}', email=f'batch{i}@example.com') for i in range(self.workers))
+        users = list(User.objects.filter(username__startswith='batch').order_by('pk'))
+
+        def borrow_batch(index):
+            client = APIClient()
+            client.force_authenticate(users[index])
+            response = client.post('/api/borrow/batch/', {'books': [str(self.book.pk), str(other.pk)]}, format='json')
+            return response.data['borrowed']
+
+        self.assertEqual(sum(self.run_concurrently(borrow_batch)), 2 * self.copies)
+        self.assertEqual(Book.objects.filter(available_copies=0).count(), 2)
+
+        # Every borrower's batch is sent twice at once; each borrow comes back once
+        borrowers = list(User.objects.filter(borrows__isnull=False).distinct())
+        self.workers = self.attempts = 2 * len(borrowers)
+
+        def return_batch(index):
+            user = borrowers[index % len(borrowers)]
+            client = APIClient()
+            client.force_authenticate(user)
+            borrows = [str(pk) for pk in Borrow.objects.filter(user=user).values_list('pk', flat=True)]
+            return client.post('/api/return/batch/', {'borrows': borrows}, format='json').data['returned']
+
+        self.assertEqual(sum(self.run_concurrently(return_batch)), 2 * self.copies)
+        self.assertEqual(
+            list(Book.objects.filter(pk__in=[self.book.pk, other.pk]).values_list('available_copies', flat=True)),
+            [self.copies, self.copies],
+        )
+        self.assertFalse(User.objects.filter(active_borrow_count__gt=0).exists())
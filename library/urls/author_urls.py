@@ -1,9 +1,13 @@
 
 from django.urls import path
-from library.views import author_views as views
+from django.conf import settings
+from library.views import async_views, author_views as views
+
+# GET is served natively async under ASGI
+reads = async_views if settings.API_ASYNC_VIEWS else views
 
 urlpatterns = [
     # Author endpoints
-    path('authors/', views.author_list, name='author-list'),
+    path('authors/', reads.author_list, name='author-list'),
     path('authors/<str:pk>/', views.author_detail, name='author-detail'),
 ]
\ No newline at end of file
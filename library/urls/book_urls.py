@@ -1,9 +1,20 @@
 
 from django.urls import path
-from library.views import book_views as views
+from django.conf import settings
+from library.views import async_views, book_views as views
+
+# GET is served natively async under ASGI
+reads = async_views if settings.API_ASYNC_VIEWS else views
 
 urlpatterns = [
     # Book endpoints
-    path('book/', views.book_list, name='book-list'),
-    path('book/<str:pk>/', views.book_detail, name='book-detail'),
-]
\ No newline at end of file
+    path('book/', reads.book_list, name='book-list'),
+    path('book/availability/', reads.book_availability, name='book-availability'),
+    path('book/<str:pk>/', reads.book_detail, name='book-detail'),
+]
+
+# The change feed holds its connection open, which only an async server affords
+if settings.API_ASYNC_VIEWS and settings.AVAILABILITY_STREAM:
+    urlpatterns.insert(2, path(
+        'book/availability/stream/', async_views.book_availability_stream, name='book-availability-stream',
+    ))
\ No newline at end of file
@@ -1,12 +1,19 @@
 
 from django.urls import path
-from library.views import borrow_views as views
+from django.conf import settings
+from library.views import async_views, borrow_views as views
+
+# GET is served natively async under ASGI
+reads = async_views if settings.API_ASYNC_VIEWS else views
 
 urlpatterns = [
     # Borrowing endpoints
     path('borrow/', views.borrow_list, name='borrow-list'),
-    path('borrow/<int:pk>/', views.borrow_detail, name='borrow-detail'),
+    path('borrow/batch/', views.borrow_batch, name='borrow-batch'),
+    path('borrow/export/', views.borrow_export, name='borrow-export'),
+    path('borrow/<uuid:pk>/', views.borrow_detail, name='borrow-detail'),
     path('return/', views.return_book, name='return-book'),
-    path('users/<int:user_id>/penalties/', views.user_penalties, name='user-penalties'),
+    path('return/batch/', views.return_batch, name='return-batch'),
+    path('users/<int:user_id>/penalties/', reads.user_penalties, name='user-penalties'),
     
 ]
@@ -1,9 +1,13 @@
 
 from django.urls import path
-from library.views import category_views as views
+from django.conf import settings
+from library.views import async_views, category_views as views
+
+# GET is served natively async under ASGI
+reads = async_views if settings.API_ASYNC_VIEWS else views
 
 urlpatterns = [
     # Author endpoints
-    path('category/', views.category_list, name='category-list'),
+    path('category/', reads.category_list, name='category-list'),
     path('category/<str:pk>/', views.category_detail, name='category-detail'),
 ]
\ No newline at end of file
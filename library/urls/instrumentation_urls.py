@@ -0,0 +1,7 @@
+from django.urls import path
+from library.views import instrumentation_views as views
+
+urlpatterns = [
+    # Request timings collected by utils.instrumentation
+    path('instrumentation/', views.instrumentation_summary, name='instrumentation'),
+]
@@ -0,0 +1,8 @@
+from django.urls import path
+from library.views import reservation_views as views
+
+urlpatterns = [
+    # Hold queue of books with no copy left
+    path('reservation/', views.reservation_list, name='reservation-list'),
+    path('reservation/<uuid:pk>/', views.reservation_detail, name='reservation-detail'),
+]
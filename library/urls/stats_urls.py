@@ -0,0 +1,10 @@
+from django.urls import path
+from library.views import stats_views as views
+
+urlpatterns = [
+    # Statistics endpoints, answered from the daily rollups
+    path('stats/popular-books/', views.popular_books, name='stats-popular-books'),
+    path('stats/popular-categories/', views.popular_categories, name='stats-popular-categories'),
+    path('stats/authors/', views.author_circulation, name='stats-authors'),
+    path('stats/daily/', views.daily_circulation, name='stats-daily'),
+]
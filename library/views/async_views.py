@@ -0,0 +1,151 @@
+"""
+Async versions of the catalog read endpoints, routed in place of the sync
+ones when ``API_ASYNC_VIEWS`` is on (the default under ``core.asgi``).
+
+They answer GET exactly like their sync counterparts, with the queries run
+through the async ORM and the cache calls awaited; writes are passed on to
+the sync views.
+"""
+from django.http import StreamingHttpResponse
+from rest_framework import exceptions, status
+from rest_framework.response import Response
+
+from authentication.models import User
+from library import availability
+from library.cache import aget_or_build, detail_entry, entry_data, normalize_pk
+from library.models import Author, Book, Category
+from library.pagination import AuthorPagination, BookPagination, CategoryPagination
+from library.search import search
+from library.serializers import (
+    AuthorSerializer,
+    BookSerializer,
+    CategorySerializer,
+    PenaltyPointsSerializer,
+)
+from library.views import author_views, book_views, borrow_views, category_views
+from utils.async_views import async_api_view
+from utils.conditional import conditional_response, make_etag, page_etag
+from utils.throttling import SustainedRateThrottle
+
+
+async def _paginate(paginator, queryset, request):
+    """``paginator.paginate_queryset()`` with the page fetched by ``async for``."""
+    rows = [row async for row in paginator.get_page_queryset(queryset, request)]
+    return paginator.build_page(rows)
+
+
+async def _list(request, queryset, paginator, serializer_class, rows=False):
+    if rows:
+        queryset = serializer_class.get_row_queryset(queryset, paginator.get_ordering(request).lstrip('-'))
+    else:
+        queryset = serializer_class.get_optimized_queryset(queryset)
+    page = await _paginate(paginator, queryset, request)
+
+    # Answer 304 before serializing when the client's copy is current
+    etag = page_etag(request, paginator, page, serializer_class.get_timestamps)
+    return conditional_response(
+        request, etag, None,
+        lambda: paginator.get_paginated_response(
+            serializer_class.represent_rows(page) if rows else serializer_class(page, many=True).data
+        ),
+    )
+
+
+@async_api_view(book_views.book_list, throttle_classes=[SustainedRateThrottle])
+async def book_list(request):
+    """List all books."""
+    books = Book.objects.all()
+    paginator = BookPagination()
+    search_query = request.query_params.get('search', None)
+    if search_query:
+        books = search(books, search_query)
+        paginator.ordering = '-search_rank'
+    return await _list(request, books, paginator, BookSerializer, rows=True)
+
+
+@async_api_view(book_views.book_detail, throttle_classes=[SustainedRateThrottle])
+async def book_detail(request, pk):
+    """Get book details."""
+    pk = normalize_pk(Book, pk)
+    entry = await aget_or_build(Book, pk, lambda: _book_entry(pk)) if pk else None
+    if entry is None:
+        return Response({"detail": "Book not found."}, status=status.HTTP_404_NOT_FOUND)
+    etag = make_etag(entry['version'], request.accepted_renderer.format)
+    return conditional_response(
+        request, etag, entry['last_modified'], lambda: Response(entry_data(request, entry)),
+    )
+
+
+async def _book_entry(pk):
+    try:
+        book = await Book.objects.select_related('author', 'category').aget(pk=pk)
+    except Book.DoesNotExist:
+        return None
+    return detail_entry(BookSerializer, book)
+
+
+@async_api_view(book_views.book_availability, throttle_classes=[SustainedRateThrottle])
+async def book_availability(request):
+    """Available copies of a batch of books: ``?ids=<id>,<id>,...``."""
+    book_ids, error = book_views.availability_ids(request)
+    if error:
+        return error
+    if not book_ids:
+        return Response({"detail": "ids is required."}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(await availability.aget_availability(book_ids))
+
+
+# EventSource always asks for text/event-stream
+@async_api_view(book_views.book_availability, throttle_classes=[SustainedRateThrottle], negotiate=False)
+async def book_availability_stream(request):
+    """Server-Sent Events of availability changes, of ``?ids=`` or of every book."""
+    book_ids, error = book_views.availability_ids(request)
+    if error:
+        return error
+    response = StreamingHttpResponse(availability.stream(book_ids), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Tell nginx not to buffer the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@async_api_view(author_views.author_list, throttle_classes=[SustainedRateThrottle])
+async def author_list(request):
+    """List all authors."""
+    authors = Author.objects.all()
+    paginator = AuthorPagination()
+    search_query = request.query_params.get('search', None)
+    if search_query:
+        authors = search(authors, search_query)
+        paginator.ordering = '-search_rank'
+    return await _list(request, authors, paginator, AuthorSerializer)
+
+
+@async_api_view(category_views.category_list, throttle_classes=[SustainedRateThrottle])
+async def category_list(request):
+    """List all categories."""
+    categories = Category.objects.all()
+    search_query = request.query_params.get('search', None)
+    if search_query:
+        categories = categories.filter(name__icontains=search_query)
+    return await _list(request, categories, CategoryPagination(), CategorySerializer)
+
+
+@async_api_view(borrow_views.user_penalties, throttle_classes=[SustainedRateThrottle], authenticated=True)
+async def user_penalties(request, user_id=None):
+    """View user penalty points."""
+    if user_id and user_id != request.user.id:
+        if not request.user.is_staff:
+            return Response({"detail": "Permission denied."}, status=status.HTTP_403_FORBIDDEN)
+        try:
+            user = await User.objects.aget(pk=user_id)
+        except User.DoesNotExist:
+            raise exceptions.NotFound("No User matches the given query.")
+    else:
+        user = request.user
+
+    projected = await PenaltyPointsSerializer.projected_penalty_queryset(user).aaggregate(
+        total=PenaltyPointsSerializer.projected_penalty_total(),
+    )
+    serializer = PenaltyPointsSerializer(user, context={'projected_penalty_points': projected['total']})
+    return Response(serializer.data)
@@ -1,12 +1,15 @@
 from rest_framework import status
 from rest_framework.decorators import api_view, throttle_classes
 from rest_framework.response import Response
-from django.db.models import Q
 
+from library.cache import detail_entry, entry_data, get_or_build, normalize_pk
 from library.models import Author
+from library.pagination import AuthorPagination
+from library.search import search
 from library.serializers import (
     AuthorSerializer,
 )
+from utils.conditional import conditional_response, make_etag, page_etag
 from utils.throttling import SustainedRateThrottle
 
 
@@ -19,15 +22,22 @@ def author_list(request):
         authors = Author.objects.all()
         # Apply search if provided
         search_query = request.query_params.get('search', None)
+        paginator = AuthorPagination()
         if search_query:
-            authors = authors.filter(Q(name__icontains=search_query) | Q(bio__icontains=search_query))
+            authors = search(authors, search_query)
+            # Best matches first unless the client asked for an ordering
+            paginator.ordering = '-search_rank'
         
-        # Apply ordering if provided
-        ordering = request.query_params.get('ordering', 'name')
-        authors = authors.order_by(ordering)
+        # Ordering and cursor are handled by the paginator
+        authors = AuthorSerializer.get_optimized_queryset(authors)
+        page = paginator.paginate_queryset(authors, request)
         
-        serializer = AuthorSerializer(authors, many=True)
-        return Response(serializer.data)
+        # Answer 304 before serializing when the client's copy is current
+        etag = page_etag(request, paginator, page, AuthorSerializer.get_timestamps)
+        return conditional_response(
+            request, etag, None,
+            lambda: paginator.get_paginated_response(AuthorSerializer(page, many=True).data),
+        )
     
     elif request.method == 'POST':
         """Create a new author. Admin only."""
@@ -47,33 +57,43 @@ def author_list(request):
 @throttle_classes([SustainedRateThrottle])
 def author_detail(request, pk):
     """Get author details, update or delete an author. Admin only."""
+    """Get author details."""
+    if request.method == 'GET':
+        pk = normalize_pk(Author, pk)
+        entry = get_or_build(Author, pk, lambda: _author_entry(pk)) if pk else None
+        if entry is None:
+            return Response({"detail": "Author not found."}, status=status.HTTP_404_NOT_FOUND)
+        etag = make_etag(entry['version'], request.accepted_renderer.format)
+        return conditional_response(
+            request, etag, entry['last_modified'], lambda: Response(entry_data(request, entry)),
+        )
+
     try:
         author = Author.objects.get(pk=pk)
     except Author.DoesNotExist:
         return Response({"detail": "Author not found."}, status=status.HTTP_404_NOT_FOUND)
 
-    """Get author details."""
-    if request.method == 'GET':
-        try:
-            author = Author.objects.get(pk=pk)
-        except Author.DoesNotExist:
-            return Response({"detail": "Author not found."}, status=status.HTTP_404_NOT_FOUND)
-        
-        serializer = AuthorSerializer(author)
-        return Response(serializer.data)
-    else:
-        if not request.user.is_staff:
-            return Response({"detail": "Permission denied."}, status=status.HTTP_403_FORBIDDEN)
-        
-        if request.method == 'PUT':
-            """Update or delete an author. Admin only."""
-            serializer = AuthorSerializer(author, data=request.data)
-            if serializer.is_valid():
-                serializer.save()
-                return Response(serializer.data)
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    if not request.user.is_staff:
+        return Response({"detail": "Permission denied."}, status=status.HTTP_403_FORBIDDEN)
+    
+    if request.method == 'PUT':
+        """Update or delete an author. Admin only."""
+        serializer = AuthorSerializer(author, data=request.data)
+        if serializer.is_valid():
+            serializer.save()
+            return Response(serializer.data)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-        elif request.method == 'DELETE':
-            """Delete an author."""
-            author.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+    elif request.method == 'DELETE':
+        """Delete an author."""
+        author.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+def _author_entry(pk):
+    """Detail cache entry: the serialized author and its validators, or None."""
+    try:
+        author = Author.objects.get(pk=pk)
+    except Author.DoesNotExist:
+        return None
+    return detail_entry(AuthorSerializer, author)
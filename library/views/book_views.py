@@ -1,12 +1,16 @@
 from rest_framework import status
 from rest_framework.decorators import api_view, throttle_classes
 from rest_framework.response import Response
-from django.db.models import Q
 
-from library.models import Book
+from library.availability import get_availability
+from library.cache import detail_entry, entry_data, get_or_build, normalize_pk
+from library.models import Book, MAX_BATCH_ITEMS
+from library.pagination import BookPagination
+from library.search import search
 from library.serializers import (
     BookSerializer,
 )
+from utils.conditional import conditional_response, make_etag, page_etag
 from utils.throttling import SustainedRateThrottle
 
 
@@ -19,15 +23,23 @@ def book_list(request):
         books = Book.objects.all()
         # Apply search if provided
         search_query = request.query_params.get('search', None)
+        paginator = BookPagination()
         if search_query:
-            books = books.filter(Q(title__icontains=search_query) | Q(description__icontains=search_query))
+            books = search(books, search_query)
+            # Best matches first unless the client asked for an ordering
+            paginator.ordering = '-search_rank'
         
-        # Apply ordering if provided
-        ordering = request.query_params.get('ordering', 'title')
-        books = books.order_by(ordering)
+        # Ordering and cursor are handled by the paginator; the page is
+        # fetched as values() rows, with the ordering field for the cursor
+        books = BookSerializer.get_row_queryset(books, paginator.get_ordering(request).lstrip('-'))
+        page = paginator.paginate_queryset(books, request)
         
-        serializer = BookSerializer(books, many=True)
-        return Response(serializer.data)
+        # Answer 304 before serializing when the client's copy is current
+        etag = page_etag(request, paginator, page, BookSerializer.get_timestamps)
+        return conditional_response(
+            request, etag, None,
+            lambda: paginator.get_paginated_response(BookSerializer.represent_rows(page)),
+        )
     
     elif request.method == 'POST':
         """Create a new book. Admin only."""
@@ -47,33 +59,73 @@ def book_list(request):
 @throttle_classes([SustainedRateThrottle])
 def book_detail(request, pk):
     """Get book details, update or delete an book. Admin only."""
+    """Get book details."""
+    if request.method == 'GET':
+        pk = normalize_pk(Book, pk)
+        entry = get_or_build(Book, pk, lambda: _book_entry(pk)) if pk else None
+        if entry is None:
+            return Response({"detail": "Book not found."}, status=status.HTTP_404_NOT_FOUND)
+        etag = make_etag(entry['version'], request.accepted_renderer.format)
+        return conditional_response(
+            request, etag, entry['last_modified'], lambda: Response(entry_data(request, entry)),
+        )
+
     try:
-        book = Book.objects.get(pk=pk)
+        book = Book.objects.select_related('author', 'category').get(pk=pk)
     except Book.DoesNotExist:
         return Response({"detail": "Book not found."}, status=status.HTTP_404_NOT_FOUND)
 
-    """Get book details."""
-    if request.method == 'GET':
-        try:
-            book = Book.objects.get(pk=pk)
-        except Book.DoesNotExist:
-            return Response({"detail": "Book not found."}, status=status.HTTP_404_NOT_FOUND)
-        
-        serializer = BookSerializer(book)
-        return Response(serializer.data)
-    else:
-        if not request.user.is_staff:
-            return Response({"detail": "Permission denied."}, status=status.HTTP_403_FORBIDDEN)
-        
-        if request.method == 'PUT':
-            """Update an book. Admin only."""
-            serializer = BookSerializer(book, data=request.data, partial=True)
-            if serializer.is_valid():
-                serializer.save()
-                return Response(serializer.data)
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    if not request.user.is_staff:
+        return Response({"detail": "Permission denied."}, status=status.HTTP_403_FORBIDDEN)
+    
+    if request.method == 'PUT':
+        """Update an book. Admin only."""
+        serializer = BookSerializer(book, data=request.data, partial=True)
+        if serializer.is_valid():
+            serializer.save()
+            return Response(serializer.data)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    elif request.method == 'DELETE':
+        """Delete an book."""
+        book.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+def _book_entry(pk):
+    """Detail cache entry: the serialized book and its validators, or None."""
+    try:
+        book = Book.objects.select_related('author', 'category').get(pk=pk)
+    except Book.DoesNotExist:
+        return None
+    return detail_entry(BookSerializer, book)
+
+
+@api_view(['GET'])
+@throttle_classes([SustainedRateThrottle])
+def book_availability(request):
+    """Available copies of a batch of books: ``?ids=<id>,<id>,...``."""
+    book_ids, error = availability_ids(request)
+    if error:
+        return error
+    if not book_ids:
+        return Response({"detail": "ids is required."}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(get_availability(book_ids))
+
 
-        elif request.method == 'DELETE':
-            """Delete an book."""
-            book.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+def availability_ids(request):
+    """The book ids of ``?ids=``, in canonical form, and an error response if they are invalid."""
+    book_ids = []
+    for raw in request.query_params.get('ids', '').split(','):
+        if not raw.strip():
+            continue
+        pk = normalize_pk(Book, raw.strip())
+        if pk is None:
+            return None, Response({"detail": "Invalid book ID."}, status=status.HTTP_400_BAD_REQUEST)
+        book_ids.append(pk)
+    book_ids = list(dict.fromkeys(book_ids))
+    if len(book_ids) > MAX_BATCH_ITEMS:
+        return None, Response(
+            {"detail": f"At most {MAX_BATCH_ITEMS} ids are allowed."}, status=status.HTTP_400_BAD_REQUEST,
+        )
+    return book_ids, None
@@ -1,20 +1,41 @@
+from collections import Counter
+
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.response import Response
+from django.conf import settings
 from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Greatest, Least
 from django.utils import timezone
 from rest_framework.permissions import IsAuthenticated
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from authentication.cache import invalidate_user
 from authentication.models import User
-from library.models import Book, Borrow
+from library import availability, cache
+from library.cache import normalize_pk
+from library.export import (
+    CONTENT_TYPES, EXPORT_FORMATS, aexport_lines, export_lines, export_queryset, parse_moment,
+)
+from library.models import Book, Borrow, Reservation, MAX_ACTIVE_BORROWS
+from library.pagination import BorrowPagination
 from library.serializers import (
+    BatchBorrowSerializer,
+    BatchReturnSerializer,
     BorrowSerializer,
     PenaltyPointsSerializer,
     ReturnBookSerializer,
 )
-from library.tasks import send_due_date_notification
+from utils.conditional import conditional_response, make_etag, page_etag
 from utils.throttling import BurstRateThrottle, SustainedRateThrottle
 
+BORROW_LIMIT_MESSAGE = (
+    "You have reached the maximum limit of 3 borrowed books. "
+    "Please return a book before borrowing another."
+)
+
 
 # Borrowing views
 @api_view(['GET', 'POST'])
@@ -38,24 +59,32 @@ def borrow_list(request):
         if returned is not None:
             borrows = borrows.filter(returned=(returned.lower() == 'true'))
         
-        # Apply ordering if provided
-        ordering = request.query_params.get('ordering', '-borrow_date')
-        borrows = borrows.order_by(ordering)
+        # Ordering and cursor are handled by the paginator
+        paginator = BorrowPagination()
+        borrows = BorrowSerializer.get_row_queryset(borrows, paginator.get_ordering(request).lstrip('-'))
+        page = paginator.paginate_queryset(borrows, request)
         
-        serializer = BorrowSerializer(borrows, many=True)
-        return Response(serializer.data)
+        # Answer 304 before serializing when the client's copy is current;
+        # days_remaining and is_overdue also depend on the current time,
+        # read once for the whole page
+        now = timezone.now()
+        etag = page_etag(
+            request, paginator, page, BorrowSerializer.get_timestamps,
+            now.date(), *(BorrowSerializer.row_is_overdue(row, now) for row in page),
+        )
+        return conditional_response(
+            request, etag, None,
+            lambda: paginator.get_paginated_response(BorrowSerializer.represent_rows(page, now)),
+        )
     
     elif request.method == 'POST':
         # Add user to the data before validation
         data = request.data.copy()
         
-        # Validate user's borrowing limit (max 3 active borrows)
-        active_borrows = Borrow.objects.filter(user=request.user, returned=False).count()
-        if active_borrows >= 3:
-            return Response(
-                {"detail": "You have reached the maximum limit of 3 borrowed books. Please return a book before borrowing another."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        # Validate user's borrowing limit (max 3 active borrows); the counter
+        # is re-checked atomically when the slot is claimed below
+        if request.user.active_borrow_count >= MAX_ACTIVE_BORROWS:
+            return Response({"detail": BORROW_LIMIT_MESSAGE}, status=status.HTTP_400_BAD_REQUEST)
         
         # Check book availability
         book_id = data.get('book')
@@ -67,14 +96,18 @@ def borrow_list(request):
         except Book.DoesNotExist:
             return Response({"detail": "Book not found."}, status=status.HTTP_404_NOT_FOUND)
         
-        if book.available_copies <= 0:
-            return Response({"detail": f"Book '{book.title}' is not available for borrowing."}, status=status.HTTP_400_BAD_REQUEST)
-        
         # Use atomic transaction to ensure consistency
         with transaction.atomic():
-            # Decrease available copies
-            book.available_copies -= 1
-            book.save()
+            # Count the borrow against the user's limit
+            if not User.claim_borrow_slot(request.user.pk, MAX_ACTIVE_BORROWS):
+                return Response({"detail": BORROW_LIMIT_MESSAGE}, status=status.HTTP_400_BAD_REQUEST)
+            
+            # A copy held for the user's reservation is theirs; otherwise
+            # decrease available copies, and the conditional UPDATE is what
+            # guarantees the last copy is only handed out once
+            if not Reservation.fulfil(request.user.pk, [book.pk]) and not Book.checkout_copy(book.pk):
+                transaction.set_rollback(True)
+                return Response({"detail": f"Book '{book.title}' is not available for borrowing."}, status=status.HTTP_400_BAD_REQUEST)
             
             # Create borrow record
             borrow = Borrow(
@@ -85,8 +118,8 @@ def borrow_list(request):
             )
             borrow.save()
             
-            # Send due date notification
-            send_due_date_notification.delay()
+            # The due date reminder is sent by the periodic
+            # send_due_date_notifications task
             
             serializer = BorrowSerializer(borrow)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -98,7 +131,7 @@ def borrow_list(request):
 def borrow_detail(request, pk):
     """Retrieve a borrow record."""
     try:
-        borrow = Borrow.objects.get(pk=pk)
+        borrow = Borrow.objects.select_related('user', 'book').get(pk=pk)
     except Borrow.DoesNotExist:
         return Response({"detail": "Borrow record not found."}, status=status.HTTP_404_NOT_FOUND)
     
@@ -106,8 +139,144 @@ def borrow_detail(request, pk):
     if borrow.user != request.user and not request.user.is_staff:
         return Response({"detail": "Permission denied."}, status=status.HTTP_403_FORBIDDEN)
     
-    serializer = BorrowSerializer(borrow)
-    return Response(serializer.data)
+    timestamps = [stamp for stamp in BorrowSerializer.get_timestamps(borrow) if stamp]
+    etag = make_etag(
+        request.accepted_renderer.format, borrow.pk, *timestamps,
+        timezone.now().date(), borrow.is_overdue(),
+    )
+    return conditional_response(
+        request, etag, max(timestamps), lambda: Response(BorrowSerializer(borrow).data),
+    )
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([SustainedRateThrottle])
+def borrow_export(request):
+    """Stream the borrow history as CSV or NDJSON. Admin only."""
+    if not request.user.is_staff:
+        return Response({"detail": "Permission denied."}, status=status.HTTP_403_FORBIDDEN)
+    
+    # Not "format": DRF reserves that parameter for picking a renderer
+    export_format = request.query_params.get('export_format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return Response({"detail": f"export_format must be one of: {', '.join(EXPORT_FORMATS)}."}, status=status.HTTP_400_BAD_REQUEST)
+    
+    # Optional filters: borrow date range, user and book
+    filters = {}
+    try:
+        for param, name in (('from', 'date_from'), ('to', 'date_to')):
+            if request.query_params.get(param):
+                filters[name] = parse_moment(request.query_params[param])
+    except ValueError as e:
+        return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    user_id = request.query_params.get('user')
+    if user_id:
+        if not user_id.isdigit():
+            return Response({"detail": "Invalid user ID."}, status=status.HTTP_400_BAD_REQUEST)
+        filters['user'] = int(user_id)
+    
+    book_id = request.query_params.get('book')
+    if book_id:
+        filters['book'] = normalize_pk(Book, book_id)
+        if filters['book'] is None:
+            return Response({"detail": "Invalid book ID."}, status=status.HTTP_400_BAD_REQUEST)
+    
+    # Under ASGI a sync iterator would be read into memory before streaming
+    lines = aexport_lines if isinstance(request._request, ASGIRequest) else export_lines
+    response = StreamingHttpResponse(
+        lines(export_queryset(**filters), export_format, settings.EXPORT_CHUNK_SIZE),
+        content_type=CONTENT_TYPES[export_format],
+    )
+    response['Content-Disposition'] = f'attachment; filename="borrows.{export_format}"'
+    return response
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([BurstRateThrottle])
+def borrow_batch(request):
+    """Borrow several books in one request, with a result per book."""
+    serializer = BatchBorrowSerializer(data=request.data, context={'request': request})
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    user = serializer.validated_data.get('user', request.user)
+    book_ids = serializer.validated_data['books']
+    
+    # Validate the borrowing limit once for the whole batch
+    remaining = MAX_ACTIVE_BORROWS - user.active_borrow_count
+    if remaining <= 0:
+        return Response({"detail": BORROW_LIMIT_MESSAGE}, status=status.HTTP_400_BAD_REQUEST)
+    
+    with transaction.atomic():
+        # Lock the rows in primary key order so concurrent batches cannot deadlock
+        books = (
+            Book.objects.select_for_update().only('id', 'title', 'available_copies')
+            .order_by('pk').in_bulk(book_ids)
+        )
+        # Books with a copy held for the user's reservation
+        held = set(
+            Reservation.objects.filter(
+                user=user, book_id__in=book_ids, status=Reservation.READY, expires_at__gte=timezone.now(),
+            )
+            .values_list('book_id', flat=True)
+        )
+        
+        errors = {}
+        candidates = []
+        for book_id in book_ids:
+            book = books.get(book_id)
+            if book is None:
+                errors[book_id] = "Book not found."
+            elif book.available_copies <= 0 and book_id not in held:
+                errors[book_id] = f"Book '{book.title}' is not available for borrowing."
+            elif len(candidates) >= remaining:
+                errors[book_id] = BORROW_LIMIT_MESSAGE
+            else:
+                candidates.append(book_id)
+        
+        # Take the held copies, and decrease available copies of every other
+        # candidate in one conditional UPDATE
+        now = timezone.now()
+        fulfilled = Reservation.fulfil(user.pk, [book_id for book_id in candidates if book_id in held], now)
+        checked_out = _update_rows(
+            Book.objects.filter(available_copies__gt=0), [book_id for book_id in candidates if book_id not in held],
+            available_copies=F('available_copies') - 1, updated_at=now,
+        )
+        borrowed = [book_id for book_id in candidates if book_id in fulfilled or book_id in checked_out]
+        for book_id in candidates:
+            if book_id not in fulfilled and book_id not in checked_out:
+                errors[book_id] = f"Book '{books[book_id].title}' is not available for borrowing."
+        
+        # Count all new borrows against the user's limit at once
+        if borrowed and not User.claim_borrow_slot(user.pk, MAX_ACTIVE_BORROWS, len(borrowed)):
+            transaction.set_rollback(True)
+            return Response({"detail": BORROW_LIMIT_MESSAGE}, status=status.HTTP_400_BAD_REQUEST)
+        cache.invalidate(Book, *checked_out)
+        availability.changed(*checked_out)
+        
+        borrows = Borrow.objects.bulk_create(
+            Borrow(
+                user=user,
+                book=books[book_id],
+                borrow_date=now,
+                due_date=now + timezone.timedelta(days=14)
+            )
+            for book_id in borrowed
+        )
+    
+    created = {borrow.book_id: borrow for borrow in borrows}
+    results = []
+    for book_id in book_ids:
+        if book_id in created:
+            results.append({"book": book_id, "status": "borrowed", "borrow": BorrowSerializer(created[book_id]).data})
+        else:
+            results.append({"book": book_id, "status": "failed", "detail": errors[book_id]})
+    
+    response_status = status.HTTP_201_CREATED if borrows else status.HTTP_400_BAD_REQUEST
+    return Response({"borrowed": len(borrows), "results": results}, status=response_status)
 
 
 @api_view(['POST'])
@@ -120,7 +289,7 @@ def return_book(request):
         borrow_id = serializer.validated_data['borrow_id']
         
         try:
-            borrow = Borrow.objects.get(pk=borrow_id)
+            borrow = Borrow.objects.select_related('user', 'book').get(pk=borrow_id)
         except Borrow.DoesNotExist:
             return Response({"detail": "Borrow record not found."}, status=status.HTTP_404_NOT_FOUND)
         
@@ -134,24 +303,34 @@ def return_book(request):
         
         # Use atomic transaction to ensure consistency
         with transaction.atomic():
-            # Update the book's available copies
-            book = borrow.book
-            book.available_copies += 1
-            book.save()
-            
-            # Update the borrow record
+            # Mark the borrow returned only if nobody else did in the meantime,
+            # so a copy cannot be put back twice
             borrow.return_date = timezone.now()
             borrow.returned = True
-            borrow.save()
+            updated = Borrow.objects.filter(pk=borrow.pk, returned=False).update(
+                returned=True,
+                return_date=borrow.return_date,
+                updated_at=borrow.return_date,
+            )
+            if not updated:
+                return Response({"detail": "This book has already been returned."}, status=status.HTTP_400_BAD_REQUEST)
+            
+            # Hold the copy for the next user in the book's reservation
+            # queue, or put it back on the shelf; then update the user's
+            # borrow count
+            Reservation.release_copies(borrow.book_id, now=borrow.return_date)
+            User.release_borrow_slot(borrow.user_id)
             
             # Calculate and add penalty points if returned late
             penalty_points = borrow.calculate_penalty()
             if penalty_points > 0:
-                borrow.user.penalty_points += penalty_points
-                borrow.user.save()
+                User.objects.filter(pk=borrow.user_id).update(
+                    penalty_points=F('penalty_points') + penalty_points
+                )
+                borrow.user.refresh_from_db(fields=['penalty_points'])
             
             response_data = {
-                "message": f"Book '{book.title}' returned successfully.",
+                "message": f"Book '{borrow.book.title}' returned successfully.",
                 "borrow_id": borrow.id,
                 "return_date": borrow.return_date,
                 "penalty_points_added": penalty_points,
@@ -163,6 +342,134 @@ def return_book(request):
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([BurstRateThrottle])
+def return_batch(request):
+    """Return several borrowed books in one request, with a result per borrow."""
+    serializer = BatchReturnSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    borrow_ids = serializer.validated_data['borrows']
+    
+    with transaction.atomic():
+        borrows = Borrow.objects.select_related('user', 'book').in_bulk(borrow_ids)
+        
+        errors = {}
+        candidates = []
+        for borrow_id in borrow_ids:
+            borrow = borrows.get(borrow_id)
+            if borrow is None:
+                errors[borrow_id] = "Borrow record not found."
+            # Only the borrower or admin can return the book
+            elif borrow.user != request.user and not request.user.is_staff:
+                errors[borrow_id] = "Permission denied."
+            elif borrow.returned:
+                errors[borrow_id] = "This book has already been returned."
+            else:
+                candidates.append(borrow_id)
+        
+        # Mark the borrows returned only if nobody else did in the meantime
+        now = timezone.now()
+        returned = _update_rows(
+            Borrow.objects.filter(returned=False), candidates,
+            returned=True, return_date=now, updated_at=now,
+        )
+        for borrow_id in candidates:
+            if borrow_id not in returned:
+                errors[borrow_id] = "This book has already been returned."
+        
+        copies = Counter()
+        slots = Counter()
+        penalties = Counter()
+        for borrow_id in returned:
+            borrow = borrows[borrow_id]
+            borrow.returned = True
+            borrow.return_date = now
+            copies[borrow.book_id] += 1
+            slots[borrow.user_id] += 1
+            penalties[borrow.user_id] += borrow.calculate_penalty()
+        
+        # Put the copies back and apply borrow counts and penalties in
+        # aggregate: one UPDATE per table. Copies of reserved books are held
+        # for their queues first, one query per reserved book.
+        if copies:
+            reserved = (
+                Reservation.objects.filter(book_id__in=copies, status=Reservation.WAITING)
+                .order_by().values_list('book_id', flat=True).distinct()
+            )
+            for book_id in reserved:
+                copies[book_id] -= len(Reservation.hold_copies(book_id, copies[book_id], now))
+            shelved = +copies
+            if shelved:
+                Book.objects.filter(pk__in=shelved).update(
+                    available_copies=Least(F('available_copies') + _per_row(shelved), F('total_copies')),
+                    updated_at=now,
+                )
+                cache.invalidate(Book, *shelved)
+                availability.changed(*shelved)
+            User.objects.filter(pk__in=slots).update(
+                active_borrow_count=Greatest(F('active_borrow_count') - _per_row(slots), 0),
+                penalty_points=F('penalty_points') + _per_row(penalties),
+            )
+            invalidate_user(*slots)
+    
+    results = []
+    for borrow_id in borrow_ids:
+        if borrow_id in returned:
+            borrow = borrows[borrow_id]
+            results.append({
+                "borrow_id": borrow_id,
+                "status": "returned",
+                "message": f"Book '{borrow.book.title}' returned successfully.",
+                "return_date": borrow.return_date,
+                "penalty_points_added": borrow.calculate_penalty(),
+            })
+        else:
+            results.append({"borrow_id": borrow_id, "status": "failed", "detail": errors[borrow_id]})
+    
+    response_status = status.HTTP_200_OK if returned else status.HTTP_400_BAD_REQUEST
+    return Response({
+        "returned": len(returned),
+        "penalty_points_added": sum(penalties.values()),
+        "results": results,
+    }, status=response_status)
+
+
+class _RowsChanged(Exception):
+    pass
+
+
+def _update_rows(queryset, pks, **changes):
+    """
+    Apply ``changes`` to the rows of ``queryset`` among ``pks`` and return
+    the set of primary keys that were updated.
+
+    One UPDATE covers the whole batch. Only when a concurrent change made
+    some rows stop matching is it rolled back and redone row by row, to
+    find out which ones.
+    """
+    if not pks:
+        return set()
+    try:
+        with transaction.atomic():
+            if queryset.filter(pk__in=pks).update(**changes) != len(pks):
+                raise _RowsChanged
+        return set(pks)
+    except _RowsChanged:
+        return {pk for pk in pks if queryset.filter(pk=pk).update(**changes)}
+
+
+def _per_row(amounts):
+    """Expression evaluating to ``amounts[pk]`` for each updated row."""
+    return Case(
+        *(When(pk=pk, then=Value(amount)) for pk, amount in amounts.items()),
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 @throttle_classes([SustainedRateThrottle])
@@ -1,8 +1,11 @@
 from rest_framework import status
 from rest_framework.decorators import api_view, throttle_classes
+from utils.conditional import conditional_response, make_etag, page_etag
 from utils.throttling import SustainedRateThrottle
 from rest_framework.response import Response
+from library.cache import detail_entry, entry_data, get_or_build, normalize_pk
 from library.models import Category
+from library.pagination import CategoryPagination
 from library.serializers import (
     CategorySerializer,
 )
@@ -20,12 +23,17 @@ def category_list(request):
         if search_query:
             categorys = categorys.filter(name__icontains=search_query)
         
-        # Apply ordering if provided
-        ordering = request.query_params.get('ordering', 'name')
-        categorys = categorys.order_by(ordering)
+        # Ordering and cursor are handled by the paginator
+        paginator = CategoryPagination()
+        categorys = CategorySerializer.get_optimized_queryset(categorys)
+        page = paginator.paginate_queryset(categorys, request)
         
-        serializer = CategorySerializer(categorys, many=True)
-        return Response(serializer.data)
+        # Answer 304 before serializing when the client's copy is current
+        etag = page_etag(request, paginator, page, CategorySerializer.get_timestamps)
+        return conditional_response(
+            request, etag, None,
+            lambda: paginator.get_paginated_response(CategorySerializer(page, many=True).data),
+        )
     
     elif request.method == 'POST':
         """Create a new category. Admin only."""
@@ -44,33 +52,43 @@ def category_list(request):
 @api_view(['GET', 'PUT', 'DELETE'])
 def category_detail(request, pk):
     """Get category details, update or delete an category. Admin only."""
+    """Get category details."""
+    if request.method == 'GET':
+        pk = normalize_pk(Category, pk)
+        entry = get_or_build(Category, pk, lambda: _category_entry(pk)) if pk else None
+        if entry is None:
+            return Response({"detail": "Category not found."}, status=status.HTTP_404_NOT_FOUND)
+        etag = make_etag(entry['version'], request.accepted_renderer.format)
+        return conditional_response(
+            request, etag, entry['last_modified'], lambda: Response(entry_data(request, entry)),
+        )
+
     try:
         category = Category.objects.get(pk=pk)
     except Category.DoesNotExist:
         return Response({"detail": "Category not found."}, status=status.HTTP_404_NOT_FOUND)
 
-    """Get category details."""
-    if request.method == 'GET':
-        try:
-            category = Category.objects.get(pk=pk)
-        except Category.DoesNotExist:
-            return Response({"detail": "Category not found."}, status=status.HTTP_404_NOT_FOUND)
-        
-        serializer = CategorySerializer(category)
-        return Response(serializer.data)
-    else:
-        if not request.user.is_staff:
-            return Response({"detail": "Permission denied."}, status=status.HTTP_403_FORBIDDEN)
-        
-        if request.method == 'PUT':
-            """Update or delete an category. Admin only."""
-            serializer = CategorySerializer(category, data=request.data)
-            if serializer.is_valid():
-                serializer.save()
-                return Response(serializer.data)
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    if not request.user.is_staff:
+        return Response({"detail": "Permission denied."}, status=status.HTTP_403_FORBIDDEN)
+    
+    if request.method == 'PUT':
+        """Update or delete an category. Admin only."""
+        serializer = CategorySerializer(category, data=request.data)
+        if serializer.is_valid():
+            serializer.save()
+            return Response(serializer.data)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-        elif request.method == 'DELETE':
-            """Delete an category."""
-            category.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+    elif request.method == 'DELETE':
+        """Delete an category."""
+        category.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+def _category_entry(pk):
+    """Detail cache entry: the serialized category and its validators, or None."""
+    try:
+        category = Category.objects.get(pk=pk)
+    except Category.DoesNotExist:
+        return None
+    return detail_entry(CategorySerializer, category)
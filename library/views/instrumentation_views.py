@@ -0,0 +1,19 @@
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from utils import instrumentation
+
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def instrumentation_summary(request):
+    """Per-view timings of the sampled requests, or clear them. Admin only."""
+    if not request.user.is_staff:
+        return Response({"detail": "Permission denied."}, status=status.HTTP_403_FORBIDDEN)
+
+    if request.method == 'DELETE':
+        instrumentation.samples.clear()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    return Response(instrumentation.summary())
@@ -0,0 +1,135 @@
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from authentication.models import User
+from library.cache import normalize_pk
+from library.models import Book, Borrow, Reservation, MAX_ACTIVE_RESERVATIONS
+from library.pagination import ReservationPagination
+from library.serializers import ReservationSerializer
+from utils.conditional import conditional_response, page_etag
+from utils.throttling import BurstRateThrottle
+
+RESERVATION_LIMIT_MESSAGE = (
+    f"You have reached the maximum limit of {MAX_ACTIVE_RESERVATIONS} open reservations. "
+    "Please cancel one before reserving another."
+)
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([BurstRateThrottle])
+def reservation_list(request):
+    """List user's reservations or join the queue of a book with no copy left."""
+    if request.method == 'GET':
+        # Regular users can see only their reservations, admins can see all
+        if request.user.is_staff:
+            reservations = Reservation.objects.all()
+        else:
+            reservations = Reservation.objects.filter(user=request.user)
+
+        # Apply filters if provided
+        book_id = request.query_params.get('book', None)
+        if book_id:
+            reservations = reservations.filter(book_id=normalize_pk(Book, book_id))
+
+        reservation_status = request.query_params.get('status', None)
+        if reservation_status:
+            reservations = reservations.filter(status=reservation_status)
+
+        # Ordering and cursor are handled by the paginator; queue positions
+        # change without the rows changing, so they are part of the ETag
+        paginator = ReservationPagination()
+        reservations = ReservationSerializer.get_optimized_queryset(reservations)
+        page = paginator.paginate_queryset(reservations, request)
+        etag = page_etag(
+            request, paginator, page, ReservationSerializer.get_timestamps,
+            *(reservation.holds_ahead for reservation in page),
+        )
+        return conditional_response(
+            request, etag, None,
+            lambda: paginator.get_paginated_response(ReservationSerializer(page, many=True).data),
+        )
+
+    elif request.method == 'POST':
+        book_id = request.data.get('book')
+        if not book_id:
+            return Response({"detail": "Book ID is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        book_id = normalize_pk(Book, book_id)
+        if book_id is None:
+            return Response({"detail": "Book not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        with transaction.atomic():
+            # The book row is locked so no return commits between the checks
+            # and the enqueue, and then the user row, in the order the
+            # borrows lock them, so the user's concurrent reservations
+            # cannot all pass the limit
+            book = Book.objects.select_for_update().filter(pk=book_id).only('id', 'title', 'available_copies').first()
+            if book is None:
+                return Response({"detail": "Book not found."}, status=status.HTTP_404_NOT_FOUND)
+            User.objects.select_for_update().only('pk').get(pk=request.user.pk)
+
+            # Only books with no copy on the shelf are queued for
+            if book.available_copies > 0:
+                return Response({"detail": f"Book '{book.title}' is available for borrowing."}, status=status.HTTP_400_BAD_REQUEST)
+
+            # The copy they return would otherwise be held for themselves
+            if Borrow.objects.filter(user=request.user, book=book, returned=False).exists():
+                return Response({"detail": f"You are currently borrowing '{book.title}'."}, status=status.HTTP_400_BAD_REQUEST)
+
+            open_reservations = Reservation.objects.filter(user=request.user, status__in=Reservation.OPEN)
+            if open_reservations.count() >= MAX_ACTIVE_RESERVATIONS:
+                return Response({"detail": RESERVATION_LIMIT_MESSAGE}, status=status.HTTP_400_BAD_REQUEST)
+
+            try:
+                reservation = Reservation.enqueue(request.user, book.pk)
+            except IntegrityError:
+                return Response({"detail": f"You have already reserved '{book.title}'."}, status=status.HTTP_400_BAD_REQUEST)
+
+            # Where rows cannot be locked (SQLite), a copy returned since the
+            # check would stay on the shelf: it goes to the queue instead
+            if Book.checkout_copy(book.pk) and reservation.pk in Reservation.release_copies(book.pk):
+                reservation.refresh_from_db(fields=['status', 'ready_at', 'expires_at'])
+
+        # The pickup notice is sent by the periodic
+        # send_reservation_notifications task once a copy is held
+
+        return Response(ReservationSerializer(reservation).data, status=status.HTTP_201_CREATED)
+
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([BurstRateThrottle])
+def reservation_detail(request, pk):
+    """Retrieve or cancel a reservation."""
+    try:
+        reservation = ReservationSerializer.get_optimized_queryset(Reservation.objects.all()).get(pk=pk)
+    except Reservation.DoesNotExist:
+        return Response({"detail": "Reservation not found."}, status=status.HTTP_404_NOT_FOUND)
+
+    # Check permissions: only the holder or admin can see or cancel the reservation
+    if reservation.user != request.user and not request.user.is_staff:
+        return Response({"detail": "Permission denied."}, status=status.HTTP_403_FORBIDDEN)
+
+    if request.method == 'GET':
+        return Response(ReservationSerializer(reservation).data)
+
+    with transaction.atomic():
+        # Cancel it only if it is still open; a copy held for it goes to the
+        # next user in line or back on the shelf
+        now = timezone.now()
+        was_ready = Reservation.objects.filter(pk=reservation.pk, status=Reservation.READY).update(
+            status=Reservation.CANCELLED, updated_at=now,
+        )
+        if was_ready:
+            Reservation.release_copies(reservation.book_id, now=now)
+        elif not Reservation.objects.filter(pk=reservation.pk, status=Reservation.WAITING).update(
+            status=Reservation.CANCELLED, updated_at=now,
+        ):
+            return Response({"detail": "This reservation is no longer open."}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response(status=status.HTTP_204_NO_CONTENT)
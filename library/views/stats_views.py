@@ -0,0 +1,94 @@
+from datetime import timedelta
+
+from django.db.models import F, Sum
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.decorators import api_view, throttle_classes
+from rest_framework.response import Response
+
+from library.models import BookDailyStats
+from library.stats import cached_stats
+from utils.throttling import SustainedRateThrottle
+
+MAX_STATS_DAYS = 365
+MAX_STATS_LIMIT = 100
+
+
+def _stats_params(request):
+    """Validated (days, limit) query parameters, or an error response."""
+    try:
+        days = int(request.query_params.get('days', 30))
+        limit = int(request.query_params.get('limit', 10))
+    except ValueError:
+        return None, Response({"detail": "days and limit must be integers."}, status=status.HTTP_400_BAD_REQUEST)
+    if not 1 <= days <= MAX_STATS_DAYS or not 1 <= limit <= MAX_STATS_LIMIT:
+        return None, Response(
+            {"detail": f"days must be between 1 and {MAX_STATS_DAYS}, limit between 1 and {MAX_STATS_LIMIT}."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    return (days, limit), None
+
+
+def _ranking(days, limit, *fields, **expressions):
+    """Borrows and returns per group over the last ``days`` days, most borrowed first."""
+    since = timezone.localdate() - timedelta(days=days - 1)
+    rows = (
+        BookDailyStats.objects.filter(date__gte=since)
+        .values(*fields, **expressions)
+        .annotate(borrows=Sum('borrows'), returns=Sum('returns'))
+        .order_by('-borrows', *fields, *expressions)[:limit]
+    )
+    return [dict(row) for row in rows]
+
+
+@api_view(['GET'])
+@throttle_classes([SustainedRateThrottle])
+def popular_books(request):
+    """Most borrowed books over the last `days` days."""
+    params, error = _stats_params(request)
+    if error:
+        return error
+    return Response(cached_stats('popular-books', params, lambda: _ranking(
+        *params, 'book', title=F('book__title'),
+    )))
+
+
+@api_view(['GET'])
+@throttle_classes([SustainedRateThrottle])
+def popular_categories(request):
+    """Busiest categories over the last `days` days."""
+    params, error = _stats_params(request)
+    if error:
+        return error
+    return Response(cached_stats('popular-categories', params, lambda: _ranking(
+        *params, category=F('book__category_id'), name=F('book__category__name'),
+    )))
+
+
+@api_view(['GET'])
+@throttle_classes([SustainedRateThrottle])
+def author_circulation(request):
+    """Borrows and returns per author over the last `days` days."""
+    params, error = _stats_params(request)
+    if error:
+        return error
+    return Response(cached_stats('authors', params, lambda: _ranking(
+        *params, author=F('book__author_id'), name=F('book__author__name'),
+    )))
+
+
+@api_view(['GET'])
+@throttle_classes([SustainedRateThrottle])
+def daily_circulation(request):
+    """Total borrows and returns per day over the last `days` days."""
+    params, error = _stats_params(request)
+    if error:
+        return error
+    days, _ = params
+    since = timezone.localdate() - timedelta(days=days - 1)
+    return Response(cached_stats('daily', (days,), lambda: [
+        dict(row) for row in BookDailyStats.objects.filter(date__gte=since)
+        .values('date')
+        .annotate(borrows=Sum('borrows'), returns=Sum('returns'))
+        .order_by('date')
+    ]))
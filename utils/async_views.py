@@ -0,0 +1,125 @@
+"""
+Native async variants of read-only API views, for ASGI deployments.
+
+DRF's ``@api_view`` functions are sync, so under ASGI every request to one
+crosses a thread-sensitive ``sync_to_async`` bridge. ``async_api_view``
+turns an ``async def`` view into a plain Django async view that still
+looks like DRF to the view body and the client: it gets a DRF ``Request``
+(``query_params``, ``user``, ``accepted_renderer``), authentication and the
+throttles run with awaited cache and database calls, API exceptions become
+the usual ``{"detail": ...}`` responses, and the ``Response`` is rendered
+as JSON. Methods other than GET and HEAD are handed to the sync view the
+async one stands in for.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.views import exception_handler
+
+from authentication.jwt_auth import CachedJWTAuthentication
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+def async_api_view(sync_view, throttle_classes=(), authenticated=False, negotiate=True):
+    """
+    Serve GET/HEAD with the decorated ``async def view(request, ...)`` and
+    every other method with ``sync_view``.
+
+    ``throttle_classes`` are the view's throttles; with ``authenticated``
+    anonymous requests are refused like ``IsAuthenticated`` does. Views
+    answering in a media type of their own (an event stream) pass
+    ``negotiate=False``: the Accept header is not matched against the JSON
+    renderer, which still renders their error responses.
+    """
+    fallback = sync_to_async(sync_view)
+
+    def decorator(view):
+        @csrf_exempt
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in SAFE_METHODS:
+                return await fallback(request, *args, **kwargs)
+
+            authenticator = CachedJWTAuthentication()
+            request = Request(request, authenticators=[authenticator])
+            try:
+                await _authenticate(request, authenticator, authenticated)
+                await _throttle(request, throttle_classes)
+                if negotiate:
+                    request.accepted_renderer, request.accepted_media_type = (
+                        DefaultContentNegotiation().select_renderer(request, [json_renderer()])
+                    )
+                response = await view(request, *args, **kwargs)
+            except exceptions.APIException as exc:
+                if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+                    exc.auth_header = authenticator.authenticate_header(request)
+                response = exception_handler(exc, {'request': request, 'args': args, 'kwargs': kwargs})
+            return _render(request, response)
+
+        return wrapper
+
+    return decorator
+
+
+def json_renderer():
+    """The first JSON renderer of ``DEFAULT_RENDERER_CLASSES``."""
+    for renderer_class in api_settings.DEFAULT_RENDERER_CLASSES:
+        if renderer_class.format == 'json':
+            return renderer_class()
+    return JSONRenderer()
+
+
+async def _authenticate(request, authenticator, authenticated):
+    try:
+        result = await authenticator.aauthenticate(request)
+    except exceptions.APIException:
+        request._not_authenticated()
+        raise
+    if result is None:
+        # Sets the anonymous user, as DRF's Request does
+        request._not_authenticated()
+    else:
+        request.user, request.auth = result
+    if authenticated and not request.user.is_authenticated:
+        raise exceptions.NotAuthenticated()
+
+
+async def _throttle(request, throttle_classes):
+    waits = []
+    for throttle_class in throttle_classes:
+        throttle = throttle_class()
+        if not await throttle.aallow_request(request, None):
+            waits.append(throttle.wait())
+    if waits:
+        raise exceptions.Throttled(max(waits))
+
+
+def _render(request, response):
+    """
+    Render a DRF ``response`` here, into a plain ``HttpResponse``.
+
+    Django's async handler would otherwise render the DRF response (a
+    ``SimpleTemplateResponse``) through another ``sync_to_async`` call.
+    """
+    if not isinstance(response, Response):
+        return response
+    response.accepted_renderer = getattr(request, 'accepted_renderer', None) or json_renderer()
+    response.accepted_media_type = response.accepted_renderer.media_type
+    response.renderer_context = {'request': request, 'response': response}
+    response.render()
+
+    rendered = HttpResponse(response.content, status=response.status_code)
+    # Kept for the test client, as on DRF responses
+    rendered.data = response.data
+    for header, value in response.items():
+        rendered[header] = value
+    return rendered
@@ -0,0 +1,99 @@
+"""
+Who is making a change, for the ``created_by``/``updated_by`` audit fields.
+
+``AuditContextMiddleware`` keeps the current request in a context variable,
+which follows the request through both sync and ASGI handling. The user is
+read from the request only when a model is saved, so users authenticated
+later by DRF (JWT) are seen as well. Code running outside a request, such
+as Celery tasks and management commands, names its user with ``audit_as``:
+
+    with audit_as(admin):
+        Book.objects.bulk_create(rows)
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import models
+from django.utils import timezone
+
+_current_request = ContextVar('audit_request', default=None)
+_current_user = ContextVar('audit_user', default=None)
+
+
+def get_audit_user():
+    """The user changes are attributed to, or None."""
+    user = _current_user.get()
+    if user is None:
+        request = _current_request.get()
+        user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return None
+    return user
+
+
+@contextmanager
+def audit_as(user):
+    """Attribute every change made inside the block to ``user``."""
+    token = _current_user.set(user)
+    try:
+        yield user
+    finally:
+        _current_user.reset(token)
+
+
+class AuditContextMiddleware:
+    """Expose the current request to ``get_audit_user()``."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _current_request.set(request)
+        try:
+            return self.get_response(request)
+        finally:
+            _current_request.reset(token)
+
+    async def __acall__(self, request):
+        token = _current_request.set(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            _current_request.reset(token)
+
+
+class AuditQuerySet(models.QuerySet):
+    """Fills in the audit fields on the bulk paths, which bypass ``save()``."""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        user = get_audit_user()
+        if user is not None:
+            for obj in objs:
+                if obj.created_by_id is None:
+                    obj.created_by_id = user.pk
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        fields = list(fields)
+        # auto_now is only applied by save(), so stamp updated_at here too
+        now = timezone.now()
+        user = get_audit_user()
+        for obj in objs:
+            obj.updated_at = now
+            if user is not None:
+                obj.updated_by_id = user.pk
+        stamped = ('updated_at', 'updated_by') if user is not None else ('updated_at',)
+        fields += [name for name in stamped if name not in fields]
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+
+AuditManager = models.Manager.from_queryset(AuditQuerySet)
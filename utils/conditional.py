@@ -0,0 +1,73 @@
+"""
+Conditional GET support (ETag / Last-Modified) for the API views.
+
+Views compute their validators from timestamps they already have at hand
+(the cached detail entry, or the rows of the current page) and hand
+``conditional_response`` a callable that builds the real response, so a
+client with a fresh copy gets a 304 before anything is serialized.
+
+List pages only get an ETag: deleting a row, or a row leaving the page,
+does not make the newest timestamp of the page any newer, so a
+Last-Modified derived from it would answer 304 to a stale copy.
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(*parts):
+    """Build a strong ETag from the values that identify a representation."""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(str(part).encode())
+        digest.update(b'\x00')
+    return quote_etag(digest.hexdigest())
+
+
+def page_etag(request, paginator, rows, timestamps, *extra):
+    """
+    ETag of a page of ``rows``.
+
+    ``timestamps(row)`` returns every ``updated_at`` the row's representation
+    depends on (its own and those of the related rows it embeds). The row
+    ids are part of the ETag so a page that loses a row changes it, and so
+    are the pagination links, so a page that gains a next link does not
+    compare equal to the old one; ``extra`` adds anything else the
+    representation depends on. Rows may be instances or ``values()`` dicts.
+    """
+    parts = [
+        request.accepted_renderer.format,
+        paginator.get_next_link(),
+        paginator.get_previous_link(),
+        *extra,
+    ]
+    for row in rows:
+        parts.append(row['id'] if isinstance(row, dict) else row.pk)
+        parts.extend(stamp.timestamp() for stamp in timestamps(row) if stamp is not None)
+    return make_etag(*parts)
+
+
+def conditional_response(request, etag, last_modified, build_response):
+    """
+    Answer a GET/HEAD with 304 if the client's validators still match.
+
+    Otherwise ``build_response()`` is called, and the ETag and Last-Modified
+    headers are added to whichever response goes out. ``last_modified`` may
+    be None, as it is for list pages.
+    """
+    response = None
+    if request.method in ('GET', 'HEAD'):
+        response = get_conditional_response(
+            request,
+            etag=etag,
+            last_modified=int(last_modified.timestamp()) if last_modified else None,
+        )
+    if response is None:
+        response = build_response()
+
+    if etag:
+        response.headers['ETag'] = etag
+    if last_modified:
+        response.headers['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
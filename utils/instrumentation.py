@@ -0,0 +1,248 @@
+"""
+Per-request performance instrumentation.
+
+``InstrumentationMiddleware`` samples ``INSTRUMENTATION_SAMPLE_RATE`` of
+the requests. For a sampled request it records the wall time, the number
+and total time of database queries (through an execute wrapper installed
+on every connection when it is opened), the time spent in serializers'
+``to_representation`` (``InstrumentedSerializerMixin``, or
+``serializer_timer`` around code that serializes without it) and the hits
+and misses of the caches that report through ``record_cache``. The measurements go out as a
+``Server-Timing`` header and into an in-process ring buffer, summarized
+per view by ``summary()`` (served at ``/api/instrumentation/``).
+
+Requests that are not sampled pay for one random number; the query hook
+and the serializer mixin only read a context variable.
+"""
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+_current = ContextVar('instrumentation_metrics', default=None)
+
+# Upper bounds (ms) of the wall time histogram buckets; the last one is open
+HISTOGRAM_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+class RequestMetrics:
+    __slots__ = ('db_queries', 'db_time', 'serializer_time', 'cache_hits', 'cache_misses')
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+class RingBuffer:
+    """The last ``size`` samples, as (view, wall, queries, db, serializer, hits, misses) tuples."""
+
+    def __init__(self, size):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def append(self, sample):
+        with self._lock:
+            self._samples.append(sample)
+
+    def snapshot(self):
+        with self._lock:
+            return list(self._samples)
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+
+samples = RingBuffer(settings.INSTRUMENTATION_BUFFER_SIZE)
+
+
+def record_cache(hit):
+    """Count a cache hit or miss against the current request, if it is sampled."""
+    metrics = _current.get()
+    if metrics is not None:
+        if hit:
+            metrics.cache_hits += 1
+        else:
+            metrics.cache_misses += 1
+
+
+def record_query(execute, sql, params, many, context):
+    """``execute_wrapper`` hook timing the queries of sampled requests."""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_time += time.perf_counter() - start
+        metrics.db_queries += 1
+
+
+def install_query_hook(connection=None, **kwargs):
+    """
+    Add ``record_query`` to ``connection``, or to the open connections of
+    the current thread.
+
+    Connected to ``connection_created``, so every connection gets the hook
+    once, when it is opened. The hook stays installed and reads the sampled
+    request from a context variable, so a connection shared by concurrent
+    async requests credits every query to the request that ran it. It goes
+    in front of the other wrappers: ``connection.execute_wrapper()`` drops
+    its own wrapper with a blind ``pop()``, which must not take this one.
+    """
+    for connection in [connection] if connection else connections.all(initialized_only=True):
+        if record_query not in connection.execute_wrappers:
+            connection.execute_wrappers.insert(0, record_query)
+
+
+connection_created.connect(install_query_hook)
+
+
+class InstrumentedSerializerMixin:
+    """Adds the time spent in ``to_representation`` to the sampled request."""
+
+    def to_representation(self, instance):
+        metrics = _current.get()
+        if metrics is None:
+            return super().to_representation(instance)
+        start = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            metrics.serializer_time += time.perf_counter() - start
+
+
+@contextmanager
+def serializer_timer():
+    """Add the time spent in the block to the serializer time of the sampled request."""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serializer_time += time.perf_counter() - start
+
+
+class InstrumentationMiddleware:
+    """Measure a sample of the requests; see the module docstring."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, time.perf_counter() - start)
+
+    @staticmethod
+    def sampled():
+        rate = settings.INSTRUMENTATION_SAMPLE_RATE
+        return rate > 0 and (rate >= 1 or random.random() < rate)
+
+    @staticmethod
+    def finish(request, response, metrics, wall):
+        match = request.resolver_match
+        view = match.view_name if match else None
+        samples.append((
+            view or request.path, wall, metrics.db_queries, metrics.db_time,
+            metrics.serializer_time, metrics.cache_hits, metrics.cache_misses,
+        ))
+        if settings.INSTRUMENTATION_SERVER_TIMING:
+            response.headers['Server-Timing'] = server_timing(wall, metrics)
+        return response
+
+
+def server_timing(wall, metrics):
+    return ', '.join((
+        f'app;dur={wall * 1000:.2f}',
+        f'db;dur={metrics.db_time * 1000:.2f};desc="{metrics.db_queries} queries"',
+        f'serializer;dur={metrics.serializer_time * 1000:.2f}',
+        f'cache;desc="{metrics.cache_hits} hits, {metrics.cache_misses} misses"',
+    ))
+
+
+def percentiles(values):
+    """p50/p95/p99 of ``values`` in milliseconds (nearest rank)."""
+    ordered = sorted(values)
+    last = len(ordered) - 1
+    return {
+        f'p{p}': round(ordered[min(last, int(len(ordered) * p / 100))] * 1000, 3)
+        for p in (50, 95, 99)
+    }
+
+
+def histogram(values):
+    """Count of ``values`` per ``HISTOGRAM_BUCKETS`` bucket, keyed by upper bound in ms."""
+    counts = dict.fromkeys([*map(str, HISTOGRAM_BUCKETS), '+Inf'], 0)
+    for value in values:
+        ms = value * 1000
+        bound = next((bound for bound in HISTOGRAM_BUCKETS if ms <= bound), None)
+        counts[str(bound) if bound else '+Inf'] += 1
+    return counts
+
+
+def summary():
+    """Per-view latency percentiles, wall time histogram, query and cache figures."""
+    by_view = {}
+    for sample in samples.snapshot():
+        by_view.setdefault(sample[0], []).append(sample)
+
+    views = {}
+    for view, rows in sorted(by_view.items()):
+        _, wall, queries, db_time, serializer_time, hits, misses = zip(*rows)
+        lookups = sum(hits) + sum(misses)
+        views[view] = {
+            'requests': len(rows),
+            'wall_ms': percentiles(wall),
+            'wall_histogram_ms': histogram(wall),
+            'db_ms': percentiles(db_time),
+            'serializer_ms': percentiles(serializer_time),
+            'queries_per_request': round(sum(queries) / len(rows), 2),
+            'cache_hit_ratio': round(sum(hits) / lookups, 3) if lookups else None,
+        }
+    return {
+        'sample_rate': settings.INSTRUMENTATION_SAMPLE_RATE,
+        'buffer_size': settings.INSTRUMENTATION_BUFFER_SIZE,
+        'views': views,
+    }
@@ -2,7 +2,7 @@
 import uuid
 from django.db import models
 from django.conf import settings
-from django_currentuser.middleware import get_current_user
+from utils.audit import AuditManager, get_audit_user
 
 
 class TimeAuditModel(models.Model):
@@ -43,6 +43,8 @@ class BaseModel(TimeAuditModel, UserAuditModel):
         default=uuid.uuid4, unique=True, editable=False, db_index=True, primary_key=True
     )
 
+    objects = AuditManager()
+
     class Meta:
         abstract = True
 
@@ -52,20 +54,18 @@ class BaseModel(TimeAuditModel, UserAuditModel):
             if created_by_id:
                 self.created_by_id = created_by_id
             else:
-                user = get_current_user()
+                # Outside a request or audit_as() block the fields are left alone
+                user = get_audit_user()
 
-                if user is None or user.is_anonymous:
-                    self.created_by = None
-                    self.updated_by = None
-                else:
+                if user is not None:
                     # Check if the model is being created or updated
                     if self._state.adding:
                         # If creating, set created_by and leave updated_by as None
-                        self.created_by = user
-                        self.updated_by = None
+                        self.created_by_id = user.pk
+                        self.updated_by_id = None
                     else:
                         # If updating, set updated_by only
-                        self.updated_by = user
+                        self.updated_by_id = user.pk
 
         super(BaseModel, self).save(*args, **kwargs)
 
@@ -0,0 +1,156 @@
+import base64
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over a stable ``(field, id)`` ordering.
+
+    The cursor carries the ordering values of the edge row of the current
+    page, so fetching any page is an index range seek rather than an OFFSET
+    scan and costs the same no matter how deep the client pages.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    ordering_query_param = 'ordering'
+    invalid_cursor_message = 'Invalid cursor.'
+
+    # Default ordering and the fields a client may order by. Only non-null
+    # fields are allowed, NULLs cannot be compared in a range seek.
+    ordering = '-created_at'
+    ordering_fields = ()
+    tiebreaker = 'id'
+
+    def get_page_size(self, request):
+        page_size = getattr(settings, 'API_PAGE_SIZE', 20)
+        max_page_size = getattr(settings, 'API_MAX_PAGE_SIZE', 100)
+        try:
+            requested = int(request.query_params[self.page_size_query_param])
+            if requested > 0:
+                page_size = requested
+        except (KeyError, ValueError):
+            pass
+        return min(page_size, max_page_size)
+
+    def get_ordering(self, request):
+        """Return the ordering requested by the client, if it is allowed."""
+        ordering = request.query_params.get(self.ordering_query_param, self.ordering)
+        if ordering.lstrip('-') not in self.ordering_fields:
+            ordering = self.ordering
+        return ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.get_page_queryset(queryset, request)
+        return self.build_page(list(queryset))
+
+    def get_page_queryset(self, queryset, request):
+        """Order, seek and slice ``queryset`` for the page the cursor points at."""
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+
+        ordering = self.get_ordering(request)
+        self.field = ordering.lstrip('-')
+        self.descending = ordering.startswith('-')
+        self.reverse, position = self.decode_cursor(request, queryset)
+
+        # Walking backwards flips the ordering; the page is reversed again
+        # once it has been fetched.
+        descending = self.descending != self.reverse
+        prefix = '-' if descending else ''
+        queryset = queryset.order_by(prefix + self.field, prefix + self.tiebreaker)
+
+        if position is not None:
+            value, pk = position
+            lookup = 'lt' if descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{self.field}__{lookup}': value}) |
+                Q(**{self.field: value, f'{self.tiebreaker}__{lookup}': pk})
+            )
+
+        self.has_cursor = position is not None
+        return queryset[:self.page_size + 1]
+
+    def build_page(self, rows):
+        """Trim the over-fetched row and work out the next/previous positions."""
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if self.reverse:
+            rows.reverse()
+            has_next, has_previous = self.has_cursor, has_more
+        else:
+            has_next, has_previous = has_more, self.has_cursor
+
+        self.next_position = self._get_position(rows[-1]) if has_next and rows else None
+        self.previous_position = self._get_position(rows[0]) if has_previous and rows else None
+        return rows
+
+    def _get_position(self, row):
+        if isinstance(row, dict):
+            return [row[self.field], row[self.tiebreaker]]
+        return [getattr(row, self.field), getattr(row, self.tiebreaker)]
+
+    def decode_cursor(self, request, queryset):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return False, None
+
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            value, pk = payload['p']
+            reverse = bool(payload.get('r'))
+            value = self._get_field(queryset, self.field).to_python(value)
+            pk = self._get_field(queryset, self.tiebreaker).to_python(pk)
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+        return reverse, (value, pk)
+
+    def encode_cursor(self, position, reverse=False):
+        payload = {'p': [self._to_json(value) for value in position]}
+        if reverse:
+            payload['r'] = 1
+        encoded = base64.urlsafe_b64encode(
+            json.dumps(payload, separators=(',', ':')).encode('ascii')
+        ).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    @staticmethod
+    def _to_json(value):
+        if isinstance(value, (str, int, float)):
+            return value
+        if hasattr(value, 'isoformat'):
+            return value.isoformat()
+        return str(value)
+
+    @staticmethod
+    def _get_field(queryset, name):
+        annotation = queryset.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        return queryset.model._meta.get_field(name)
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position)
+
+    def get_previous_link(self):
+        if self.previous_position is None:
+            return None
+        return self.encode_cursor(self.previous_position, reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
@@ -0,0 +1,227 @@
+"""
+Query pattern analysis: N+1 and slow query detection.
+
+``QueryRecorder`` records every query run while it is active together with
+its normalized fingerprint (literals and ``IN`` lists collapsed), its
+duration and the line of project code it came from. The report groups the
+queries by fingerprint; the same fingerprint run over and over in one
+request is the signature of an N+1.
+
+In tests:
+
+    @assert_max_queries(3, max_repeats=2)
+    def test_borrow_list(self):
+        ...
+
+On staging, ``QueryAnalysisMiddleware`` (on when ``QUERY_ANALYSIS`` is set)
+logs the offenders of every request with their origin.
+"""
+import logging
+import os
+import re
+import sys
+import time
+from collections import Counter
+from contextlib import ContextDecorator
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+_recorder = ContextVar('query_recorder', default=None)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\((?:\s*(?:%s|\?)\s*,?)+\)', re.IGNORECASE)
+_SPACE = re.compile(r'\s+')
+
+_PROJECT_ROOT = str(settings.BASE_DIR) + os.sep
+# Project code that wraps queries without being where they come from
+_SKIPPED_FILES = {
+    os.path.abspath(__file__),
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instrumentation.py'),
+}
+
+
+def fingerprint(sql):
+    """``sql`` with its literals and ``IN`` lists replaced by placeholders."""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def query_origin():
+    """``path:line in function`` of the innermost project frame running the query."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_PROJECT_ROOT) and filename not in _SKIPPED_FILES and 'site-packages' not in filename:
+            return f'{os.path.relpath(filename, _PROJECT_ROOT)}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return None
+
+
+def _record_query(execute, sql, params, many, context):
+    recorder = _recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        recorder.add(sql, time.perf_counter() - start, query_origin())
+
+
+def install_query_hook(connection=None, **kwargs):
+    """
+    Add the recording hook to ``connection``, or to the open connections of
+    the current thread.
+
+    The hook goes in front of the other wrappers, as in
+    ``utils.instrumentation.install_query_hook()``.
+    """
+    for connection in [connection] if connection else connections.all(initialized_only=True):
+        if _record_query not in connection.execute_wrappers:
+            connection.execute_wrappers.insert(0, _record_query)
+
+
+def connect_query_hook():
+    """
+    Install the recording hook on the open connections of the current
+    thread and, through ``connection_created``, on those opened later.
+
+    Only done once something records queries (a ``QueryRecorder``, or the
+    middleware when ``QUERY_ANALYSIS`` is set), so that otherwise queries
+    do not pay for the hook.
+    """
+    connection_created.connect(install_query_hook)
+    install_query_hook()
+
+
+class QueryRecorder:
+    """Record the queries run inside ``with QueryRecorder() as recorder:``."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __enter__(self):
+        connect_query_hook()
+        self._token = _recorder.set(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        _recorder.reset(self._token)
+
+    def add(self, sql, duration, origin):
+        self.queries.append((fingerprint(sql), sql, duration, origin))
+
+    def repeated(self, max_repeats):
+        """[(fingerprint, count, origins)] of fingerprints run more than ``max_repeats`` times."""
+        counts = Counter(query[0] for query in self.queries)
+        return [
+            (sql, count, Counter(query[3] for query in self.queries if query[0] == sql))
+            for sql, count in counts.most_common()
+            if count > max_repeats
+        ]
+
+    def slow(self, budget_ms):
+        """[(sql, ms, origin)] of the queries that took longer than ``budget_ms``."""
+        return [
+            (sql, duration * 1000, origin)
+            for _, sql, duration, origin in self.queries
+            if duration * 1000 > budget_ms
+        ]
+
+    def problems(self, max_queries=None, max_repeats=None, slow_ms=None):
+        """Lines describing every limit the recorded queries break."""
+        lines = []
+        if max_queries is not None and len(self.queries) > max_queries:
+            lines.append(f'{len(self.queries)} queries, expected at most {max_queries}')
+        if max_repeats is not None:
+            for sql, count, origins in self.repeated(max_repeats):
+                lines.append(f'{count}x {sql}')
+                lines.extend(f'    {times}x from {origin}' for origin, times in origins.most_common(3))
+        if slow_ms is not None:
+            for sql, ms, origin in self.slow(slow_ms):
+                lines.append(f'{ms:.1f} ms (budget {slow_ms} ms) from {origin}: {sql}')
+        return lines
+
+
+class assert_max_queries(ContextDecorator):
+    """
+    Fail when the block or test runs more than ``max_queries`` queries, repeats
+    one fingerprint more than ``max_repeats`` times, or runs a query slower
+    than ``slow_ms``. Any limit can be None.
+    """
+
+    def __init__(self, max_queries=None, max_repeats=None, slow_ms=None):
+        self.max_queries = max_queries
+        self.max_repeats = max_repeats
+        self.slow_ms = slow_ms
+
+    def __enter__(self):
+        self.recorder = QueryRecorder().__enter__()
+        return self.recorder
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.recorder.__exit__(exc_type, exc_value, traceback)
+        if exc_type is not None:
+            return False
+        problems = self.recorder.problems(self.max_queries, self.max_repeats, self.slow_ms)
+        if problems:
+            raise AssertionError('Query limits exceeded:\n' + '\n'.join(problems))
+        return False
+
+
+class QueryAnalysisMiddleware:
+    """
+    Log the repeated and slow queries of each request, for staging.
+
+    Limits come from ``QUERY_ANALYSIS_MAX_REPEATS`` and
+    ``QUERY_ANALYSIS_SLOW_MS``; the middleware removes itself unless
+    ``QUERY_ANALYSIS`` is set.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.QUERY_ANALYSIS:
+            raise MiddlewareNotUsed
+        connection_created.connect(install_query_hook)
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+        self.report(request, recorder)
+        return response
+
+    async def __acall__(self, request):
+        # The ORM runs in the request's thread-sensitive executor thread
+        await sync_to_async(install_query_hook)()
+        with QueryRecorder() as recorder:
+            response = await self.get_response(request)
+        self.report(request, recorder)
+        return response
+
+    @staticmethod
+    def report(request, recorder):
+        problems = recorder.problems(
+            max_repeats=settings.QUERY_ANALYSIS_MAX_REPEATS,
+            slow_ms=settings.QUERY_ANALYSIS_SLOW_MS,
+        )
+        if problems:
+            logger.warning(
+                '%s %s ran %d queries:\n%s',
+                request.method, request.path, len(recorder.queries), '\n'.join(problems),
+            )
@@ -0,0 +1,156 @@
+"""
+Fast JSON rendering.
+
+``FastJSONRenderer`` writes the bytes DRF's ``JSONRenderer`` writes with
+the default settings (compact, strict, UTF-8), encoded with orjson when it
+is installed and with the standard library otherwise. orjson encodes
+strings, UUIDs, dates and datetimes itself (datetimes in UTC end in ``Z``,
+as DRF writes them); ``Decimal`` and everything else DRF's encoder knows go
+through that encoder's rules.
+
+A ``JSONFragment`` as the whole response (a cached detail entry) is written
+out as it is, without encoding anything; fragments inside the data are
+spliced in as bytes too, by orjson itself (as ``orjson.Fragment``) or, with
+the standard library, in place of a placeholder.
+
+The two encoders write the same bytes, except for floats below 1e-4 or
+from 1e16 up (``1e-7`` against ``1e-07``, the same number) and for NaN and
+infinities, which orjson writes as ``null`` where the standard library
+refuses them.
+"""
+import json
+import re
+import secrets
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS if orjson else 0
+
+# DRF escapes these two, valid in JSON but not in JavaScript source
+_LINE_SEPARATORS = ((b'\xe2\x80\xa8', b'\\u2028'), (b'\xe2\x80\xa9', b'\\u2029'))
+
+
+class JSONFragment:
+    """
+    JSON that is already encoded, written out as is by ``FastJSONRenderer``.
+
+    ``data`` is the value it encodes (decoded on first use if it was not
+    given), so ``response.data[...]`` reads the same as with plain data.
+    """
+    __slots__ = ('encoded', '_data')
+
+    def __init__(self, encoded, data=None):
+        self.encoded = encoded
+        if data is not None:
+            self._data = data
+
+    @property
+    def data(self):
+        try:
+            return self._data
+        except AttributeError:
+            self._data = json.loads(self.encoded)
+            return self._data
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __eq__(self, other):
+        return isinstance(other, JSONFragment) and other.encoded == self.encoded
+
+    def __repr__(self):
+        return f'JSONFragment({self.encoded!r})'
+
+
+class _Fragments:
+    """The fragments met while encoding one document, and their placeholders."""
+
+    def __init__(self):
+        self.encoded = []
+        self.nonce = secrets.token_hex(8)
+
+    def placeholder(self, fragment):
+        self.encoded.append(fragment.encoded)
+        # NUL comes out escaped, and the nonce keeps data from faking one
+        return f'\x00fragment:{len(self.encoded) - 1}:{self.nonce}'
+
+    def splice(self, output):
+        pattern = re.compile(rb'"\\u0000fragment:(\d+):' + self.nonce.encode() + rb'"')
+        return pattern.sub(lambda match: self.encoded[int(match[1])], output)
+
+
+class FragmentEncoder(JSONEncoder):
+    """DRF's encoder, with fragments replaced by placeholders (or decoded, without ``fragments``)."""
+
+    def __init__(self, *args, fragments=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fragments = fragments
+
+    def default(self, obj):
+        if isinstance(obj, JSONFragment):
+            return obj.data if self.fragments is None else self.fragments.placeholder(obj)
+        return super().default(obj)
+
+
+_encoder = JSONEncoder()
+
+
+def _orjson_default(obj):
+    if isinstance(obj, JSONFragment):
+        return orjson.Fragment(obj.encoded)
+    return _encoder.default(obj)
+
+
+def dumps(data):
+    """``data`` as compact UTF-8 JSON bytes, as ``JSONRenderer`` writes them."""
+    if isinstance(data, JSONFragment):
+        return data.encoded
+
+    output = None
+    if orjson is not None:
+        try:
+            output = orjson.dumps(data, default=_orjson_default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            # Integers beyond 64 bits, for one; let the standard library decide
+            pass
+
+    fragments = None
+    if output is None:
+        fragments = _Fragments()
+        output = json.dumps(
+            data, cls=FragmentEncoder, fragments=fragments,
+            ensure_ascii=False, allow_nan=False, separators=(',', ':'),
+        ).encode()
+
+    for raw, escaped in _LINE_SEPARATORS:
+        if raw in output:
+            output = output.replace(raw, escaped)
+    if fragments and fragments.encoded:
+        output = fragments.splice(output)
+    return output
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    ``JSONRenderer`` writing through ``dumps()``. Requests for indented
+    output, and non-default ``UNICODE_JSON``/``COMPACT_JSON``/``STRICT_JSON``
+    settings, are rendered by ``JSONRenderer`` itself.
+    """
+    encoder_class = FragmentEncoder
+    splices_fragments = True
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if (
+            self.ensure_ascii or not self.compact or not self.strict
+            or self.get_indent(accepted_media_type, renderer_context or {})
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
@@ -1,6 +1,251 @@
+"""
+Request throttles for the API.
+
+DRF's ``SimpleRateThrottle`` keeps a list with a timestamp of every request
+in the window under each key, and rewrites it on each request. The throttles
+here keep two integer counters per key instead (the current and the
+previous fixed window) and estimate a sliding window from them:
+
+    estimate = previous * (1 - elapsed fraction of current window) + current
+
+The counters live in the ``THROTTLE_CACHE`` alias, which is shared between
+workers when it is Redis. There a Lua script increments the current counter,
+gives it its expiry and reads the previous one in a single round trip:
+Django's ``incr`` is an ``EXISTS`` and an ``INCR``, and a counter expiring
+in between would be recreated without a TTL. Other backends use ``add`` and
+``incr``. A request that is refused takes its increment back, so only
+allowed requests are counted and a client retrying while throttled does not
+keep itself throttled.
+If that cache cannot be reached, counting falls back to a per-process
+store for ``THROTTLE_FALLBACK_SECONDS`` before the shared cache is tried
+again, so an outage neither blocks requests nor lets them all through.
+"""
+import logging
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
 from rest_framework.throttling import UserRateThrottle, AnonRateThrottle
 
-class BurstRateThrottle(UserRateThrottle):
+logger = logging.getLogger(__name__)
+
+# KEYS: current and previous counters, ARGV: timeout of the current one.
+# Also sets the TTL of a counter left without one.
+REDIS_COUNT = """
+local current = redis.call('INCR', KEYS[1])
+if redis.call('TTL', KEYS[1]) < 0 then
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+return {current, redis.call('GET', KEYS[2]) or 0}
+"""
+
+# KEYS: current counter. DECR would recreate an expired one without a TTL.
+REDIS_UNCOUNT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('DECR', KEYS[1])
+end
+return 0
+"""
+
+
+def redis_eval(cache, script, keys, *args):
+    """Run ``script`` on the Redis server of ``cache`` with the cache's versions of ``keys``."""
+    keys = [cache.make_and_validate_key(key) for key in keys]
+    client = cache._cache.get_client(keys[0], write=True)
+    return client.eval(script, len(keys), *keys, *args)
+
+
+def redis_count(cache, current_key, previous_key, timeout):
+    current, previous = redis_eval(cache, REDIS_COUNT, [current_key, previous_key], timeout)
+    return int(current), int(previous)
+
+
+class LocalCounterStore:
+    """In-process counters with expiry, used when the shared cache is down."""
+
+    def __init__(self):
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def incr(self, key, timeout, now):
+        with self._lock:
+            count, expires = self._counters.get(key, (0, 0))
+            if expires <= now:
+                count = 0
+                if len(self._counters) > 10000:
+                    self._prune(now)
+            self._counters[key] = (count + 1, now + timeout if not count else expires)
+            return count + 1
+
+    def decr(self, key, now):
+        with self._lock:
+            count, expires = self._counters.get(key, (0, 0))
+            if count and expires > now:
+                self._counters[key] = (count - 1, expires)
+
+    def get(self, key, now):
+        with self._lock:
+            count, expires = self._counters.get(key, (0, 0))
+            return count if expires > now else 0
+
+    def _prune(self, now):
+        for key in [key for key, (_, expires) in self._counters.items() if expires <= now]:
+            del self._counters[key]
+
+
+local_counters = LocalCounterStore()
+
+
+class SlidingWindowThrottleMixin:
+    """
+    Sliding window counter in place of ``SimpleRateThrottle``'s history list.
+
+    Mix in before a ``SimpleRateThrottle`` subclass; ``scope``, ``rate`` and
+    ``get_cache_key()`` keep working as they do in DRF.
+    """
+    # Until this time the local store is used instead of the shared cache
+    fallback_until = 0
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        window, offset = divmod(self.now, self.duration)
+        window = int(window)
+        if self.decide(*self.count(window), offset):
+            return True
+        self.uncount(window)
+        return False
+
+    async def aallow_request(self, request, view):
+        """``allow_request()`` for the async views, with the cache calls awaited."""
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        window, offset = divmod(self.now, self.duration)
+        window = int(window)
+        if self.decide(*await self.acount(window), offset):
+            return True
+        await self.auncount(window)
+        return False
+
+    def decide(self, current, previous, offset):
+        estimate = previous * (1 - offset / self.duration) + current
+        if estimate > self.num_requests:
+            self.wait_seconds = self.duration - offset
+            return self.throttle_failure()
+        return self.throttle_success()
+
+    def count(self, window):
+        """Bump the counter of ``window`` and return it with the previous one."""
+        current_key = f'{self.key}:{window}'
+        previous_key = f'{self.key}:{window - 1}'
+        # Kept for two windows so it can still be read as the previous one
+        timeout = self.duration * 2
+
+        self.counted_locally = not self.use_shared_cache()
+        if not self.counted_locally:
+            cache = caches[settings.THROTTLE_CACHE]
+            try:
+                if isinstance(cache, RedisCache):
+                    return redis_count(cache, current_key, previous_key, timeout)
+                try:
+                    current = cache.incr(current_key)
+                except ValueError:
+                    # First request of the window, or the counter expired
+                    current = 1 if cache.add(current_key, 1, timeout) else cache.incr(current_key)
+                return current, cache.get(previous_key, 0)
+            except Exception:
+                self.start_fallback()
+                self.counted_locally = True
+
+        current = local_counters.incr(current_key, timeout, self.now)
+        return current, local_counters.get(previous_key, self.now)
+
+    async def acount(self, window):
+        current_key = f'{self.key}:{window}'
+        previous_key = f'{self.key}:{window - 1}'
+        timeout = self.duration * 2
+
+        self.counted_locally = not self.use_shared_cache()
+        if not self.counted_locally:
+            cache = caches[settings.THROTTLE_CACHE]
+            try:
+                if isinstance(cache, RedisCache):
+                    return await sync_to_async(redis_count)(cache, current_key, previous_key, timeout)
+                try:
+                    current = await cache.aincr(current_key)
+                except ValueError:
+                    current = 1 if await cache.aadd(current_key, 1, timeout) else await cache.aincr(current_key)
+                return current, await cache.aget(previous_key, 0)
+            except Exception:
+                self.start_fallback()
+                self.counted_locally = True
+
+        current = local_counters.incr(current_key, timeout, self.now)
+        return current, local_counters.get(previous_key, self.now)
+
+    def uncount(self, window):
+        """Take back the increment of a refused request from the store ``count()`` used."""
+        current_key = f'{self.key}:{window}'
+        if self.counted_locally:
+            local_counters.decr(current_key, self.now)
+            return
+        cache = caches[settings.THROTTLE_CACHE]
+        try:
+            if isinstance(cache, RedisCache):
+                redis_eval(cache, REDIS_UNCOUNT, [current_key])
+            else:
+                cache.decr(current_key)
+        except Exception:
+            # Expired in between, or the cache went down; the counter is
+            # at most one too high until its window ends
+            pass
+
+    async def auncount(self, window):
+        current_key = f'{self.key}:{window}'
+        if self.counted_locally:
+            local_counters.decr(current_key, self.now)
+            return
+        cache = caches[settings.THROTTLE_CACHE]
+        try:
+            if isinstance(cache, RedisCache):
+                await sync_to_async(redis_eval)(cache, REDIS_UNCOUNT, [current_key])
+            else:
+                await cache.adecr(current_key)
+        except Exception:
+            pass
+
+    def use_shared_cache(self):
+        return self.now >= SlidingWindowThrottleMixin.fallback_until
+
+    def start_fallback(self):
+        logger.warning('Throttle cache unavailable, counting locally', exc_info=True)
+        SlidingWindowThrottleMixin.fallback_until = self.now + settings.THROTTLE_FALLBACK_SECONDS
+
+    def throttle_success(self):
+        return True
+
+    def throttle_failure(self):
+        return False
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class BurstRateThrottle(SlidingWindowThrottleMixin, UserRateThrottle):
     """
     Throttle for burst requests (high frequency in short time).
     Used for sensitive operations like borrow/return.
@@ -8,7 +253,7 @@ class BurstRateThrottle(UserRateThrottle):
     scope = 'burst'
     rate = '10/minute'
 
-class SustainedRateThrottle(UserRateThrottle):
+class SustainedRateThrottle(SlidingWindowThrottleMixin, UserRateThrottle):
     """
     Throttle for sustained requests over time.
     Used for general API calls.
@@ -16,9 +261,9 @@ class SustainedRateThrottle(UserRateThrottle):
     scope = 'sustained'
     rate = '100/hour'
 
-class AuthenticationRateThrottle(AnonRateThrottle):
+class AuthenticationRateThrottle(SlidingWindowThrottleMixin, AnonRateThrottle):
     """
     Specific throttle for authentication endpoints to prevent brute force.
     """
     scope = 'auth'
-    rate = '5/minute'
\ No newline at end of file
+    rate = '5/minute'